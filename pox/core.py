@@ -196,6 +196,9 @@ class POXCore (EventMixin):
 
     self.scheduler = recoco.Scheduler(daemon=True)
 
+    # Coarse timers which share a single task (see recoco.TimerWheel)
+    self.timers = recoco.TimerWheel(scheduler=self.scheduler)
+
     self._waiters = [] # List of waiting components
 
   @property
@@ -235,6 +238,15 @@ class POXCore (EventMixin):
     """
     _self.scheduler.callLater(_func, *args, **kw)
 
+  def callLaterMany (self, calls):
+    """
+    Like callLater(), but for a sequence of calls at once
+
+    Each call is a callable or a tuple of (callable, args[, kw]).  This is
+    cheaper than calling callLater() for each of them.
+    """
+    self.scheduler.callLaterMany(calls)
+
   def raiseLater (_self, _obj, *args, **kw):
     # first arg is `_self` rather than `self` in case the user wants
     # to specify self as a keyword argument
@@ -127,9 +127,20 @@ class NXSoftwareSwitch (SoftwareSwitch):
   def add_connection (self, connection):
     self.role_by_conn[connection.ID] = nx.ROLE_OTHER
     connection.set_message_handler(self.rx_message)
+    self._watch_connection(connection)
     self.connections.append(connection)
+    self._expiry_enabled = True
+    self._schedule_flow_expiry()
     return connection
 
+  def _handle_connection_closed (self, connection):
+    if connection not in self.connections: return
+    self.connections.remove(connection)
+    self.role_by_conn.pop(connection.ID, None)
+    self._sent_hellos.discard(connection)
+    if not self.connections:
+      self.disconnect()
+
   def set_connection (self, connection):
     self.add_connection(connection)
 
@@ -34,15 +34,18 @@ TODO
 """
 
 
+from pox.core import core
 from pox.lib.util import assert_type, initHelper, dpid_to_str
 from pox.lib.revent import Event, EventMixin
 from pox.openflow.libopenflow_01 import *
 import pox.openflow.libopenflow_01 as of
 from pox.openflow.util import make_type_to_unpacker_table
-from pox.openflow.flow_table import SwitchFlowTable
+from pox.openflow.flow_table import SwitchFlowTable, packet_key
 from pox.lib.packet import *
 
 import logging
+import time
+from collections import deque
 
 
 class DpPacketOut (Event):
@@ -58,6 +61,139 @@ class DpPacketOut (Event):
     self.switch = node # For backwards compatability
 
 
+class PacketBufferPool (object):
+  """
+  Packets a switch holds on to while it waits for the controller
+
+  Buffers come from a free list, so allocating and releasing one is O(1).
+  A buffer ID holds the slot in its low 16 bits and a generation number
+  above them.  The generation changes each time a slot is reused, so a
+  stale ID (one already released or expired) is noticed instead of
+  picking up a newer packet.
+
+  If timeout is not None, buffers which haven't been used after that many
+  seconds are released, as unanswered packet_ins would otherwise use up
+  the pool.  Releasing a buffer leaves its deadline queued (expiry skips
+  it), so the queue is compacted when it gets to twice the pool size.
+  """
+  _SLOT_BITS = 16
+  _SLOT_MASK = (1 << _SLOT_BITS) - 1
+  _MAX_GENERATION = 0x7fff
+
+  def __init__ (self, size=100, timeout=None):
+    assert size <= self._SLOT_MASK + 1
+    self.size = size
+    self.timeout = timeout
+    self._packets = [None] * size # slot -> (packet, in_port)
+    self._generations = [0] * size
+    self._free = range(size - 1, -1, -1) # Lowest slot gets popped first
+    self._deadlines = deque() # (expiry time, buffer_id) in allocation order
+
+    self.high_water = 0
+    self.allocated_count = 0
+    self.released_count = 0
+    self.expired_count = 0
+    self.overflow_count = 0
+    self.unknown_count = 0
+
+  def __len__ (self):
+    """
+    Number of buffers in use
+    """
+    return self.size - len(self._free)
+
+  def allocate (self, packet, in_port=None, now=None):
+    """
+    Buffer packet and return its buffer ID
+
+    If no buffer is available, returns None.
+    """
+    if self.timeout is not None:
+      if now is None: now = time.time()
+      self.expire(now)
+    if not self._free:
+      self.overflow_count += 1
+      return None
+    slot = self._free.pop()
+    generation = self._generations[slot] % self._MAX_GENERATION + 1
+    self._generations[slot] = generation
+    self._packets[slot] = (packet, in_port)
+    buffer_id = (generation << self._SLOT_BITS) | slot
+    if self.timeout is not None:
+      deadlines = self._deadlines
+      deadlines.append((now + self.timeout, buffer_id))
+      if len(deadlines) > 2 * self.size:
+        self._compact()
+    self.allocated_count += 1
+    in_use = self.size - len(self._free)
+    if in_use > self.high_water: self.high_water = in_use
+    return buffer_id
+
+  def _take (self, buffer_id):
+    slot = buffer_id & self._SLOT_MASK
+    if slot >= self.size: return None
+    if self._generations[slot] != buffer_id >> self._SLOT_BITS: return None
+    entry = self._packets[slot]
+    if entry is not None:
+      self._packets[slot] = None
+      self._free.append(slot)
+    return entry
+
+  def release (self, buffer_id):
+    """
+    Frees a buffer and returns its (packet, in_port)
+
+    Returns None if buffer_id is not (or no longer) a valid buffer.
+    """
+    entry = self._take(buffer_id)
+    if entry is None:
+      self.unknown_count += 1
+    else:
+      self.released_count += 1
+    return entry
+
+  def expire (self, now=None):
+    """
+    Releases buffers older than the timeout
+
+    Returns the number of buffers released.
+    """
+    if self.timeout is None: return 0
+    if now is None: now = time.time()
+    deadlines = self._deadlines
+    count = 0
+    while deadlines and deadlines[0][0] <= now:
+      if self._take(deadlines.popleft()[1]) is not None:
+        count += 1
+    self.expired_count += count
+    return count
+
+  def _compact (self):
+    """
+    Drops queued deadlines for buffers which have already been released
+    """
+    packets = self._packets
+    generations = self._generations
+    mask = self._SLOT_MASK
+    shift = self._SLOT_BITS
+    self._deadlines = deque(d for d in self._deadlines
+                            if packets[d[1] & mask] is not None
+                            and generations[d[1] & mask] == d[1] >> shift)
+
+  def stats (self):
+    """
+    Returns a dict of buffer occupancy statistics
+    """
+    return dict(n_buffers = self.size,
+                in_use = len(self),
+                high_water = self.high_water,
+                allocated = self.allocated_count,
+                released = self.released_count,
+                expired = self.expired_count,
+                overflows = self.overflow_count,
+                unknown = self.unknown_count)
+
+
 def _generate_port (port_no, dpid=0):
   p = ofp_phy_port()
   p.port_no = port_no
@@ -75,6 +211,18 @@ def _generate_ports (num_ports=4, dpid=0):
 
 
 class SoftwareSwitchBase (object):
+  # Flow expiry runs this long after the earliest expiry time, so that
+  # flows expiring close together are handled in one go
+  flow_expiry_slack = 0.1
+
+  # Maximum number of exact header tuples remembered by the microflow
+  # cache in front of the flow table (0 disables the cache)
+  microflow_cache_size = 4096
+
+  # Buffered packets not claimed by the controller within this many
+  # seconds are dropped (None keeps them until they're used)
+  packet_buffer_timeout = 5
+
   def __init__ (self, dpid, name=None, ports=4, miss_send_len=128,
                 max_buffers=100, features=None):
     """
@@ -93,6 +241,11 @@ class SoftwareSwitchBase (object):
     self._has_sent_hello = False
 
     self.table = SwitchFlowTable()
+    self.table.addListeners(self)
+    self._expiry_timer = None
+    self._expiry_time = None
+    self._expiry_enabled = True # False once disconnected
+    self._microflows = {} # packet_key -> TableEntry or None
     self._lookup_count = 0
     self._matched_count = 0
 
@@ -100,7 +253,8 @@ class SoftwareSwitchBase (object):
     self._connection = None
 
     # buffer for packets during packet_in
-    self._packet_buffer = []
+    self.packet_buffers = PacketBufferPool(max_buffers,
+                                           self.packet_buffer_timeout)
 
     # Map port_no -> openflow.pylibopenflow_01.ofp_phy_ports
     self.ports = {}
@@ -176,7 +330,34 @@ class SoftwareSwitchBase (object):
     Set this switch's connection.
     """
     connection.set_message_handler(self.rx_message)
+    self._watch_connection(connection)
     self._connection = connection
+    self._expiry_enabled = True
+    self._schedule_flow_expiry()
+
+  def _watch_connection (self, connection):
+    # Not every connection can tell us when it closes
+    set_close_handler = getattr(connection, 'set_close_handler', None)
+    if set_close_handler is not None:
+      set_close_handler(self._handle_connection_closed)
+
+  def _handle_connection_closed (self, connection):
+    if connection is self._connection:
+      self.disconnect()
+
+  def disconnect (self):
+    """
+    Drops this switch's connection and stops its timers
+
+    This happens on its own when the connection closes.  Flows stop
+    expiring on their own (expire_flows() can still be called) until the
+    switch is given a new connection.
+    """
+    self._connection = None
+    self._expiry_enabled = False
+    if self._expiry_timer is not None:
+      self._expiry_timer.cancel()
+      self._expiry_timer = None
 
   def send (self, message):
     """
@@ -211,6 +392,46 @@ class SoftwareSwitchBase (object):
                              ports = self.ports.values())
     self.send(msg)
 
+  def _handle_FlowTableModification (self, event):
+    # Any change can alter which entry a packet resolves to.  Modified
+    # entries keep their identity, so cached entries see new actions.
+    self._microflows.clear()
+    if event.added:
+      self._schedule_flow_expiry()
+    if event.reason is None: return
+    now = time.time()
+    for entry in event.removed:
+      if entry.flags & OFPFF_SEND_FLOW_REM:
+        self.send(entry.to_flow_removed(event.reason, now=now))
+
+  def _schedule_flow_expiry (self):
+    """
+    Makes sure flow expiry will run once the next flow may have expired
+    """
+    if not self._expiry_enabled: return
+    t = self.table.next_expiry()
+    if t is None: return
+    if self._expiry_timer is not None:
+      if self._expiry_time <= t: return
+      self._expiry_timer.cancel()
+    self._expiry_time = t
+    delay = max(0, t - time.time()) + self.flow_expiry_slack
+    self._expiry_timer = core.timers.callDelayed(delay, self._expire_flows)
+
+  def _expire_flows (self):
+    self._expiry_timer = None
+    self.expire_flows()
+    self._schedule_flow_expiry()
+
+  def expire_flows (self, now=None):
+    """
+    Removes flows whose idle or hard timeout has passed
+
+    Sends flow_removed messages for those with OFPFF_SEND_FLOW_REM set.
+    This normally happens on its own via a timer.
+    """
+    return self.table.remove_expired_entries(now)
+
   def _rx_flow_mod (self, ofp, connection):
     """
     Handles flow mods
@@ -431,10 +652,20 @@ class SoftwareSwitchBase (object):
       return
 
     self._lookup_count += 1
-    entry = self.table.entry_for_packet(packet, in_port)
+    key = packet_key(packet, in_port)
+    microflows = self._microflows
+    try:
+      entry = microflows[key]
+    except KeyError:
+      entry = self.table.entry_for_key(key)
+      if self.microflow_cache_size:
+        if len(microflows) >= self.microflow_cache_size:
+          microflows.clear()
+        microflows[key] = entry
     if entry is not None:
       self._matched_count += 1
-      entry.touch_packet(len(packet))
+      raw = packet.raw
+      entry.touch_packet(len(raw) if raw is not None else len(packet))
       self._process_actions_for_packet(entry.actions, packet, in_port)
     else:
       # no matching entry
@@ -554,18 +785,7 @@ class SoftwareSwitchBase (object):
 
     If no buffer is available, return None.
     """
-    # Do we have an empty slot?
-    for (i, value) in enumerate(self._packet_buffer):
-      if value is None:
-        # Yes -- use it
-        self._packet_buffer[i] = (packet, in_port)
-        return i + 1
-    # No -- create a new slow
-    if len(self._packet_buffer) >= self.max_buffers:
-      # No buffers available!
-      return None
-    self._packet_buffer.append( (packet, in_port) )
-    return len(self._packet_buffer)
+    return self.packet_buffers.allocate(packet, in_port)
 
   def _process_actions_for_packet_from_buffer (self, actions, buffer_id,
                                                ofp=None):
@@ -575,16 +795,19 @@ class SoftwareSwitchBase (object):
     ofp is the message which triggered this processing, if any (used for error
     generation)
     """
-    buffer_id = buffer_id - 1
-    if buffer_id >= len(self._packet_buffer):
-      self.log.warn("Invalid output buffer id: %d", buffer_id)
-      return
-    if self._packet_buffer[buffer_id] is None:
-      self.log.warn("Buffer %d has already been flushed", buffer_id)
+    entry = self.packet_buffers.release(buffer_id)
+    if entry is None:
+      self.log.warn("Unknown or expired buffer id: %d", buffer_id)
+      err = ofp_error(type=OFPET_BAD_REQUEST, code=OFPBRC_BUFFER_UNKNOWN)
+      if ofp:
+        err.xid = ofp.xid
+        err.data = ofp.pack()
+      else:
+        err.xid = 0
+      self.send(err)
       return
-    (packet, in_port) = self._packet_buffer[buffer_id]
+    (packet, in_port) = entry
     self._process_actions_for_packet(actions, packet, in_port, ofp)
-    self._packet_buffer[buffer_id] = None
 
   def _process_actions_for_packet (self, actions, packet, in_port, ofp=None):
     """
@@ -760,10 +983,22 @@ class OFConnection (object):
     self.unpackers = make_type_to_unpacker_table()
 
     self.on_message_received = None
+    self.on_closed = None
+    io_worker.close_handler = self._handle_close
 
   def set_message_handler (self, handler):
     self.on_message_received = handler
 
+  def set_close_handler (self, handler):
+    """
+    Sets a function to call with this connection when it closes
+    """
+    self.on_closed = handler
+
+  def _handle_close (self, io_worker):
+    if self.on_closed is not None:
+      self.on_closed(self)
+
   def send (self, data):
     """
     Send raw data to the controller.
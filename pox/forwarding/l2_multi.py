@@ -33,8 +33,8 @@ Works with openflow.spanning_tree
 from pox.core import core
 import pox.openflow.libopenflow_01 as of
 from pox.lib.revent import *
-from pox.lib.recoco import Timer
-from collections import defaultdict
+from pox.lib.recoco import WheelTimer
+from collections import defaultdict, deque
 from pox.openflow.discovery import Discovery
 from pox.lib.util import dpid_to_str
 import time
@@ -50,9 +50,6 @@ switches = {}
 # ethaddr -> (switch, port)
 mac_map = {}
 
-# [sw1][sw2] -> (distance, intermediate)
-path_map = defaultdict(lambda:defaultdict(lambda:(None,None)))
-
 # Waiting path.  (dpid,xid)->WaitingPath
 waiting_paths = {}
 
@@ -67,61 +64,137 @@ FLOW_HARD_TIMEOUT = 30
 PATH_SETUP_TIME = 4
 
 
-def _calc_paths ():
-  """
-  Essentially Floyd-Warshall algorithm
+class PathEngine (object):
   """
+  Shortest paths (by hop count) between all pairs of nodes
 
-  def dump ():
-    for i in sws:
-      for j in sws:
-        a = path_map[i][j][0]
-        #a = adjacency[i][j]
-        if a is None: a = "*"
-        print a,
-      print
-
-  sws = switches.values()
-  path_map.clear()
-  for k in sws:
-    for j,port in adjacency[k].iteritems():
-      if port is None: continue
-      path_map[k][j] = (1,None)
-    path_map[k][k] = (0,None) # distance, intermediate
-
-  #dump()
-
-  for k in sws:
-    for i in sws:
-      for j in sws:
-        if path_map[i][k][0] is not None:
-          if path_map[k][j][0] is not None:
-            # i -> k -> j exists
-            ikj_dist = path_map[i][k][0]+path_map[k][j][0]
-            if path_map[i][j][0] is None or ikj_dist < path_map[i][j][0]:
-              # i -> k -> j is better than existing
-              path_map[i][j] = (ikj_dist, k)
-
-  #print "--------------------"
-  #dump()
-
-
-def _get_raw_path (src, dst):
+  For each source node, this keeps the distance to and the first hop
+  towards every node it can reach.  Adding or removing a link only updates
+  the source trees it affects: an added link is relaxed outwards from
+  its nearer end, and a removed link only causes the trees in which it
+  was on a shortest path to be recomputed.
   """
-  Get a raw path (just a list of nodes to traverse)
-  """
-  if len(path_map) == 0: _calc_paths()
-  if src is dst:
-    # We're here!
-    return []
-  if path_map[src][dst][0] is None:
-    return None
-  intermediate = path_map[src][dst][1]
-  if intermediate is None:
-    # Directly connected
-    return []
-  return _get_raw_path(src, intermediate) + [intermediate] + \
-         _get_raw_path(intermediate, dst)
+  def __init__ (self):
+    self._adjacency = defaultdict(set) # node -> set of neighbors
+    self._dist = {} # [src][dst] -> hops
+    self._next = {} # [src][dst] -> first node after src
+
+  def add_link (self, a, b):
+    """
+    Adds a link between nodes a and b (in both directions)
+    """
+    if b in self._adjacency[a]: return
+    self._adjacency[a].add(b)
+    self._adjacency[b].add(a)
+    for n in (a, b):
+      if n not in self._dist:
+        self._dist[n] = {n:0}
+        self._next[n] = {}
+    for src,dist in self._dist.iteritems():
+      da = dist.get(a)
+      db = dist.get(b)
+      if da is not None and (db is None or da + 1 < db):
+        self._relax(src, a, b)
+      elif db is not None and (da is None or db + 1 < da):
+        self._relax(src, b, a)
+
+  def remove_link (self, a, b):
+    """
+    Removes the link between nodes a and b
+    """
+    if b not in self._adjacency.get(a, ()): return
+    self._adjacency[a].discard(b)
+    self._adjacency[b].discard(a)
+    for n in (a, b):
+      if not self._adjacency[n]:
+        del self._adjacency[n]
+        del self._dist[n]
+        del self._next[n]
+    for src,dist in self._dist.iteritems():
+      da = dist.get(a)
+      db = dist.get(b)
+      # If the link wasn't between successive hops, no path used it
+      if da is not None and db is not None and abs(da - db) == 1:
+        self._recompute(src)
+
+  def _relax (self, src, near, far):
+    """
+    Propagates the shorter distance through near -> far to src's tree
+    """
+    dist = self._dist[src]
+    next_hop = self._next[src]
+    dist[far] = dist[near] + 1
+    next_hop[far] = far if near is src else next_hop[near]
+    adjacency = self._adjacency
+    queue = deque((far,))
+    while queue:
+      n = queue.popleft()
+      d = dist[n] + 1
+      hop = next_hop[n]
+      for m in adjacency[n]:
+        dm = dist.get(m)
+        if dm is None or d < dm:
+          dist[m] = d
+          next_hop[m] = hop
+          queue.append(m)
+
+  def _recompute (self, src):
+    """
+    Rebuilds src's tree with a breadth-first search
+    """
+    dist = {src:0}
+    next_hop = {}
+    adjacency = self._adjacency
+    for m in adjacency[src]:
+      dist[m] = 1
+      next_hop[m] = m
+    queue = deque(adjacency[src])
+    while queue:
+      n = queue.popleft()
+      d = dist[n] + 1
+      hop = next_hop[n]
+      for m in adjacency[n]:
+        if m not in dist:
+          dist[m] = d
+          next_hop[m] = hop
+          queue.append(m)
+    self._dist[src] = dist
+    self._next[src] = next_hop
+
+  def clear (self):
+    self._adjacency.clear()
+    self._dist.clear()
+    self._next.clear()
+
+  def distance (self, src, dst):
+    """
+    Number of hops from src to dst, or None if unreachable
+    """
+    if src is dst: return 0
+    return self._dist.get(src, {}).get(dst)
+
+  def next_hop (self, src, dst):
+    """
+    The node after src on a shortest path to dst (or None)
+    """
+    return self._next.get(src, {}).get(dst)
+
+  def get_path (self, src, dst):
+    """
+    Returns the list of nodes from src to dst (inclusive), or None
+    """
+    if src is dst: return [src]
+    path = [src]
+    n = self.next_hop(src, dst)
+    if n is None: return None
+    while n is not dst:
+      path.append(n)
+      n = self._next[n][dst]
+    path.append(dst)
+    return path
+
+# Shortest paths between switches
+paths = PathEngine()
 
 
 def _check_path (p):
@@ -142,13 +215,8 @@ def _get_path (src, dst, first_port, final_port):
   """
   Gets a cooked path -- a list of (node,in_port,out_port)
   """
-  # Start with a raw path...
-  if src == dst:
-    path = [src]
-  else:
-    path = _get_raw_path(src, dst)
-    if path is None: return None
-    path = [src] + path + [dst]
+  path = paths.get_path(src, dst)
+  if path is None: return None
 
   # Now add the ports
   r = []
@@ -237,6 +305,8 @@ class Switch (EventMixin):
     self.dpid = None
     self._listeners = None
     self._connected_at = None
+    self._congested = False
+    self._congestion_drops = 0 # Packets dropped while congested
 
   def __repr__ (self):
     return dpid_to_str(self.dpid)
@@ -303,6 +373,25 @@ class Switch (EventMixin):
 
       return
 
+    for sw,_,_ in p:
+      if sw._congested:
+        # Don't pile more flow_mods onto a switch that isn't keeping up.
+        # The packet is dropped; we'll get another shot at it later.
+        sw._congestion_drops += 1
+        if sw._congestion_drops == 1:
+          log.warning("Dropping packets needing new paths through %s "
+                      "while it's congested", sw)
+        log.debug("Not installing path for %s -> %s: %s is congested",
+                  match.dl_src, match.dl_dst, sw)
+        if event.ofp.buffer_id is not None:
+          # Kill the buffer
+          msg = of.ofp_packet_out()
+          msg.buffer_id = event.ofp.buffer_id
+          event.ofp.buffer_id = None # Mark is dead
+          msg.in_port = event.port
+          self.connection.send(msg)
+        return
+
     log.debug("Installing path for %s -> %s %04x (%i hops)",
         match.dl_src, match.dl_dst, match.dl_type, len(p))
 
@@ -400,6 +489,7 @@ class Switch (EventMixin):
     self.connection = connection
     self._listeners = self.listenTo(connection)
     self._connected_at = time.time()
+    self._congested = False
 
   @property
   def is_holding_down (self):
@@ -411,6 +501,15 @@ class Switch (EventMixin):
   def _handle_ConnectionDown (self, event):
     self.disconnect()
 
+  def _handle_ConnectionBackpressure (self, event):
+    self._congested = event.congested
+    if event.congested:
+      self._congestion_drops = 0
+      log.warning("%s is congested; holding off on new paths", self)
+    else:
+      log.info("%s is no longer congested (dropped %i packets)", self,
+               self._congestion_drops)
+
 
 class l2_multi (EventMixin):
 
@@ -443,7 +542,6 @@ class l2_multi (EventMixin):
     for sw in switches.itervalues():
       if sw.connection is None: continue
       sw.connection.send(clear)
-    path_map.clear()
 
     if event.removed:
       # This link no longer okay
@@ -487,6 +585,12 @@ class l2_multi (EventMixin):
       for mac in bad_macs:
         del mac_map[mac]
 
+    # Bring the shortest paths up to date with the new adjacency
+    if adjacency[sw1][sw2] is not None and adjacency[sw2][sw1] is not None:
+      paths.add_link(sw1, sw2)
+    else:
+      paths.remove_link(sw1, sw2)
+
   def _handle_ConnectionUp (self, event):
     sw = switches.get(event.dpid)
     if sw is None:
@@ -510,4 +614,4 @@ def launch ():
   core.registerNew(l2_multi)
 
   timeout = min(max(PATH_SETUP_TIME, 5) * 2, 15)
-  Timer(timeout, WaitingPath.expire_waiting_paths, recurring=True)
+  WheelTimer(timeout, WaitingPath.expire_waiting_paths, recurring=True)
@@ -39,7 +39,7 @@ from pox.lib.packet.ethernet import ethernet
 from pox.lib.packet.ipv4 import ipv4
 from pox.lib.packet.arp import arp
 
-from pox.lib.recoco.recoco import Timer
+from pox.lib.recoco.recoco import WheelTimer
 
 import pox.openflow.libopenflow_01 as of
 
@@ -48,6 +48,8 @@ import pox.openflow.discovery as discovery
 from pox.lib.revent.revent import *
 
 import time
+import heapq
+import itertools
 
 import string
 
@@ -70,7 +72,11 @@ class Alive (object):
   def __init__ (self, livelinessInterval=timeoutSec['arpAware']):
     self.lastTimeSeen = time.time()
     self.interval=livelinessInterval
-  
+    self.checkTime = None # When host_tracker will next look at this entry
+
+  def deadline (self):
+    return self.lastTimeSeen + self.interval
+
   def expired (self):
     return time.time() > self.lastTimeSeen + self.interval
 
@@ -155,9 +161,24 @@ class host_tracker (EventMixin):
     
     # The following tables should go to Topology later
     self.entryByMAC = {}
-    self._t = Timer(timeoutSec['timerInterval'],
-                   self._check_timeouts, recurring=True)
+    self.entriesByIP = {} # IP -> {MAC -> MacEntry}
+
+    # (dpid, port) -> number of discovered links using it.  Hosts aren't
+    # learned on these ports.
+    self._switchPorts = {}
+
+    # Heap of (time, seq, macEntry, ipAddr, entry) saying when to check on
+    # a MAC entry (ipAddr and entry are None) or one of its IP entries.
+    # Seeing traffic only updates an entry's lastTimeSeen, so when a check
+    # comes due the entry may have been refreshed in the meantime, in which
+    # case it's just put back for its new deadline.
+    self._checks = []
+    self._checkSeq = itertools.count()
+
+    self._t = WheelTimer(timeoutSec['timerInterval'],
+                         self._check_timeouts, recurring=True)
     self.listenTo(core)
+    core.listen_to_dependencies(self, attrs=False)
     log.info("host_tracker ready")
 
   # The following two functions should go to Topology also
@@ -168,7 +189,13 @@ class host_tracker (EventMixin):
       result = None
     return result
 
-  def sendPing(self, macEntry, ipAddr):
+  def getMacEntriesByIP(self, ipaddr):
+    """
+    Returns the MAC entries that have been seen using the given IP address
+    """
+    return self.entriesByIP.get(ipaddr, {}).values()
+
+  def _pingMessage(self, macEntry, ipAddr):
     r = arp() # Builds an "ETH/IP any-to-any ARP packet
     r.opcode = arp.REQUEST
     r.hwdst = macEntry.macaddr
@@ -180,15 +207,30 @@ class host_tracker (EventMixin):
             macEntry.dpid, macEntry.port, str(r.hwdst), str(r.protodst))
     msg = of.ofp_packet_out(data = e.pack(),
                            action = of.ofp_action_output(port = macEntry.port))
-    if core.openflow.sendToDPID(macEntry.dpid, msg.pack()):
-      ipEntry = macEntry.ipAddrs[ipAddr]
-      ipEntry.pings.sent()
+    return msg.pack()
+
+  def sendPing(self, macEntry, ipAddr):
+    self.sendPings(macEntry.dpid, [(macEntry, ipAddr)])
+
+  def sendPings(self, dpid, pings):
+    """
+    Sends ARP pings for a list of (macEntry, ipAddr) on one switch
+
+    They all go to the switch in one write.
+    """
+    data = b''.join(self._pingMessage(m, ip) for m, ip in pings)
+    if core.openflow.sendToDPID(dpid, data):
+      for macEntry, ipAddr in pings:
+        ipEntry = macEntry.ipAddrs.get(ipAddr)
+        if ipEntry is not None: ipEntry.pings.sent()
     else:
-      # macEntry is stale, remove it.
-      log.debug("%i %i ERROR sending ARP REQ to %s %s",
-                macEntry.dpid, macEntry.port, str(r.hwdst), str(r.protodst))
-      del macEntry.ipAddrs[ipAddr]
-    return
+      # macEntries are stale, remove them.
+      for macEntry, ipAddr in pings:
+        log.debug("%i %i ERROR sending ARP REQ to %s %s",
+                  macEntry.dpid, macEntry.port,
+                  str(macEntry.macaddr), str(ipAddr))
+        if ipAddr in macEntry.ipAddrs:
+          self._removeIP(macEntry, ipAddr)
 
   def getSrcIPandARP(self, packet):
     """
@@ -226,14 +268,62 @@ class host_tracker (EventMixin):
       # new mapping
       ipEntry = IpEntry(hasARP)
       macEntry.ipAddrs[pckt_srcip] = ipEntry
+      self.entriesByIP.setdefault(pckt_srcip, {})[macEntry.macaddr] = macEntry
       log.info("Learned %s got IP %s", str(macEntry), str(pckt_srcip) )
     if hasARP:
       ipEntry.pings.received()
+    if ipEntry.checkTime is None or ipEntry.checkTime > ipEntry.deadline():
+      # New, or its interval just got shorter
+      self._schedule(ipEntry.deadline(), macEntry, pckt_srcip, ipEntry)
+
+  def _removeIP (self, macEntry, ipAddr):
+    del macEntry.ipAddrs[ipAddr]
+    entries = self.entriesByIP.get(ipAddr)
+    if entries is not None:
+      entries.pop(macEntry.macaddr, None)
+      if not entries: del self.entriesByIP[ipAddr]
+
+  def _removeMAC (self, macEntry):
+    for ipAddr in macEntry.ipAddrs.keys():
+      self._removeIP(macEntry, ipAddr)
+    del self.entryByMAC[macEntry.macaddr]
+
+  def _schedule (self, when, macEntry, ipAddr=None, ipEntry=None):
+    entry = macEntry if ipEntry is None else ipEntry
+    entry.checkTime = when
+    heapq.heappush(self._checks,
+                   (when, next(self._checkSeq), macEntry, ipAddr, ipEntry))
 
   def _handle_GoingUpEvent (self, event):
     self.listenTo(core.openflow)
     log.debug("Up...")
 
+  def _all_dependencies_met (self):
+    for link in core.openflow_discovery.adjacency:
+      self._addSwitchPort(link.dpid1, link.port1)
+      self._addSwitchPort(link.dpid2, link.port2)
+
+  def _addSwitchPort (self, dpid, port):
+    key = (dpid, port)
+    self._switchPorts[key] = self._switchPorts.get(key, 0) + 1
+
+  def _removeSwitchPort (self, dpid, port):
+    key = (dpid, port)
+    n = self._switchPorts.get(key, 0) - 1
+    if n > 0:
+      self._switchPorts[key] = n
+    else:
+      self._switchPorts.pop(key, None)
+
+  def _handle_openflow_discovery_LinkEvent (self, event):
+    link = event.link
+    if event.added:
+      self._addSwitchPort(link.dpid1, link.port1)
+      self._addSwitchPort(link.dpid2, link.port2)
+    else:
+      self._removeSwitchPort(link.dpid1, link.port1)
+      self._removeSwitchPort(link.dpid2, link.port2)
+
   def _handle_PacketIn (self, event):
     """
     Populate MAC and IP tables based on incoming packets.
@@ -254,7 +344,7 @@ class host_tracker (EventMixin):
     if packet.type == ethernet.LLDP_TYPE:    # Ignore LLDP packets
       return
     # This should use Topology later 
-    if not core.openflow_discovery.is_edge_port(dpid, inport):
+    if (dpid, inport) in self._switchPorts:
       # No host should be right behind a switch-only port
       log.debug("%i %i ignoring packetIn at switch-only port", dpid, inport)
       return
@@ -269,6 +359,7 @@ class host_tracker (EventMixin):
       # should we raise a NewHostFound event (at the end)?
       macEntry = MacEntry(dpid,inport,packet.src)
       self.entryByMAC[packet.src] = macEntry
+      self._schedule(macEntry.deadline(), macEntry)
       log.info("Learned %s", str(macEntry))
     elif macEntry != (dpid, inport, packet.src):    
       # there is already an entry of host with that MAC, but host has moved
@@ -292,25 +383,47 @@ class host_tracker (EventMixin):
 
     return
 
-  def _check_timeouts(self):
-    for macEntry in self.entryByMAC.values():
-      entryPinged = False
-      for ip_addr, ipEntry in macEntry.ipAddrs.items():
-        if ipEntry.expired():
-          if ipEntry.pings.failed():
-            del macEntry.ipAddrs[ip_addr]
-            log.info("Entry %s: IP address %s expired",
-                    str(macEntry), str(ip_addr) )
-          else: 
-            self.sendPing(macEntry,ip_addr)
-            ipEntry.pings.sent()
-            entryPinged = True
-      if macEntry.expired() and not entryPinged:
-        log.info("Entry %s expired", str(macEntry))
-        # sanity check: there should be no IP addresses left
-        if len(macEntry.ipAddrs) > 0:
-          for ip in macEntry.ipAddrs.keys():
-            log.warning("Entry %s expired but still had IP address %s",
-                        str(macEntry), str(ip_addr) )
-            del macEntry.ipAddrs[ip_addr]
-        del self.entryByMAC[macEntry.macaddr]
+  def _check_timeouts(self, now=None):
+    if now is None: now = time.time()
+    checks = self._checks
+    pings = {} # dpid -> [(macEntry, ipAddr)]
+    while checks and checks[0][0] <= now:
+      when, _, macEntry, ipAddr, ipEntry = heapq.heappop(checks)
+      entry = macEntry if ipEntry is None else ipEntry
+      if entry.checkTime != when: continue # Superseded by a later check
+      if self.entryByMAC.get(macEntry.macaddr) is not macEntry: continue
+      if ipEntry is None:
+        self._check_mac(macEntry, now)
+      elif macEntry.ipAddrs.get(ipAddr) is ipEntry:
+        self._check_ip(macEntry, ipAddr, ipEntry, now, pings)
+    for dpid, dpidPings in pings.iteritems():
+      self.sendPings(dpid, dpidPings)
+
+  def _check_ip(self, macEntry, ip_addr, ipEntry, now, pings):
+    deadline = ipEntry.deadline()
+    if deadline > now:
+      self._schedule(deadline, macEntry, ip_addr, ipEntry)
+    elif ipEntry.pings.failed():
+      self._removeIP(macEntry, ip_addr)
+      log.info("Entry %s: IP address %s expired",
+              str(macEntry), str(ip_addr) )
+    else:
+      pings.setdefault(macEntry.dpid, []).append((macEntry, ip_addr))
+      self._schedule(now + ipEntry.pings.interval, macEntry, ip_addr, ipEntry)
+
+  def _check_mac(self, macEntry, now):
+    deadline = macEntry.deadline()
+    if deadline > now:
+      self._schedule(deadline, macEntry)
+      return
+    for ipEntry in macEntry.ipAddrs.itervalues():
+      if ipEntry.deadline() <= now:
+        # Still pinging this address; wait and see if it answers
+        self._schedule(now + ipEntry.pings.interval, macEntry)
+        return
+    log.info("Entry %s expired", str(macEntry))
+    # sanity check: there should be no IP addresses left
+    for ip_addr in macEntry.ipAddrs:
+      log.warning("Entry %s expired but still had IP address %s",
+                  str(macEntry), str(ip_addr) )
+    self._removeMAC(macEntry)
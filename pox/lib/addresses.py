@@ -73,10 +73,35 @@ def _load_oui_names ():
 _load_oui_names()
 
 
+# Interned EthAddr/IPAddr instances handed out by the from_raw()/from_int()
+# factories, keyed by raw value.  Addresses are immutable, so sharing them
+# is safe; the tables are simply flushed when they fill up.
+_eth_intern = {}
+_ip_intern = {}
+_intern_limit_default = 4096
+_intern_limit = _intern_limit_default
+
+def set_intern_limit (limit):
+  """
+  Sets the maximum number of addresses of each type kept in the intern
+  table.  A limit of 0 disables interning.
+  """
+  global _intern_limit
+  _intern_limit = max(0, int(limit))
+  _eth_intern.clear()
+  _ip_intern.clear()
+
+
 class EthAddr (object):
   """
   An Ethernet (MAC) address type.
+
+  Instances are immutable.  Packet parsers should use from_raw(), which
+  skips the type sniffing done by the constructor and may hand back a
+  shared instance from the intern table (see set_intern_limit()).
   """
+  __slots__ = ['_value']
+
   def __init__ (self, addr):
     """
     Understands Ethernet address is various forms.  Hex strings, raw byte
@@ -106,16 +131,34 @@ class EthAddr (object):
         addr = b''.join((chr(int(addr[x*2:x*2+2], 16)) for x in range(0,6)))
       else:
         raise RuntimeError("Expected ethernet address string to be 6 raw bytes or some hex")
-      self._value = addr
+      _set_eth(self, addr)
     elif isinstance(addr, EthAddr):
-      self._value = addr.toRaw()
+      _set_eth(self, addr._value)
     elif type(addr) == list or (hasattr(addr, '__len__') and len(addr) == 6 and hasattr(addr, '__iter__')):
-      self._value = b''.join( (chr(x) for x in addr) )
+      _set_eth(self, b''.join( (chr(x) for x in addr) ))
     elif addr is None:
-      self._value = b'\x00' * 6
+      _set_eth(self, b'\x00' * 6)
     else:
       raise RuntimeError("Expected ethernet address to be a string of 6 raw bytes or some hex")
 
+  @classmethod
+  def from_raw (cls, raw):
+    """
+    Returns an EthAddr for a 6 byte raw string without any checking.
+    """
+    if cls is EthAddr and _intern_limit:
+      a = _eth_intern.get(raw)
+      if a is None:
+        a = _new(cls)
+        _set_eth(a, raw)
+        if len(_eth_intern) >= _intern_limit:
+          _eth_intern.clear()
+        _eth_intern[raw] = a
+      return a
+    a = _new(cls)
+    _set_eth(a, raw)
+    return a
+
   def isBridgeFiltered (self):
     """
     Returns True if this is IEEE 802.1D MAC Bridge Filtered MAC Group Address,
@@ -190,23 +233,27 @@ class EthAddr (object):
     return self.toStr()
 
   def __cmp__ (self, other):
+    if type(other) is EthAddr:
+      return cmp(self._value, other._value)
     try:
-      if type(other) == EthAddr:
-        other = other._value
-      elif type(other) == bytes:
+      if type(other) == bytes:
         pass
       else:
         other = EthAddr(other)._value
-      if self._value == other:
-        return 0
-      if self._value < other:
-        return -1
-      if self._value > other:
-        return -1
-      raise RuntimeError("Objects can not be compared?")
+      return cmp(self._value, other)
     except:
       return -other.__cmp__(self)
 
+  def __eq__ (self, other):
+    if type(other) is EthAddr:
+      return self._value == other._value
+    return self.__cmp__(other) == 0
+
+  def __ne__ (self, other):
+    if type(other) is EthAddr:
+      return self._value != other._value
+    return self.__cmp__(other) != 0
+
   def __hash__ (self):
     return self._value.__hash__()
 
@@ -217,38 +264,76 @@ class EthAddr (object):
     return 6
 
   def __setattr__ (self, a, v):
-    if hasattr(self, '_value'):
-      raise TypeError("This object is immutable")
-    object.__setattr__(self, a, v)
+    raise TypeError("This object is immutable")
+
+  def __reduce__ (self):
+    return (self.__class__, (self._value,))
+
+_new = object.__new__
+_set_eth = EthAddr._value.__set__
 
 
 class IPAddr (object):
   """
   Represents an IPv4 address.
+
+  Instances are immutable.  Packet parsers should use from_raw() or
+  from_int(), which skip the type sniffing done by the constructor and
+  may hand back a shared instance from the intern table.
   """
+  __slots__ = ['_value']
+
   def __init__ (self, addr, networkOrder = False):
     """ Can be initialized with several formats.
         If addr is an int/long, then it is assumed to be in host byte order
         unless networkOrder = True
-        Stored in network byte order as a signed int
+        Stored as an unsigned int in host byte order
     """
 
-    # Always stores as a signed network-order int
+    # Always stores as an unsigned host-order int
     if isinstance(addr, basestring) or isinstance(addr, bytes):
       if len(addr) != 4:
         # dotted quad
-        self._value = struct.unpack('i', socket.inet_aton(addr))[0]
+        _set_ip(self, _unpack_ip(socket.inet_aton(addr))[0])
       else:
-        self._value = struct.unpack('i', addr)[0]
+        _set_ip(self, _unpack_ip(addr)[0])
     elif isinstance(addr, IPAddr):
-      self._value = addr._value
+      _set_ip(self, addr._value)
     elif isinstance(addr, int) or isinstance(addr, long):
       addr = addr & 0xffFFffFF # unsigned long
-      self._value = struct.unpack("!i",
-          struct.pack(('!' if networkOrder else '') + "I", addr))[0]
+      if networkOrder:
+        addr = socket.ntohl(addr)
+      _set_ip(self, addr)
     else:
       raise RuntimeError("Unexpected IP address format")
 
+  @classmethod
+  def from_int (cls, value, networkOrder = False):
+    """
+    Returns an IPAddr for an unsigned 32 bit int without any checking.
+    """
+    if networkOrder:
+      value = socket.ntohl(value)
+    if cls is IPAddr and _intern_limit:
+      a = _ip_intern.get(value)
+      if a is None:
+        a = _new(cls)
+        _set_ip(a, value)
+        if len(_ip_intern) >= _intern_limit:
+          _ip_intern.clear()
+        _ip_intern[value] = a
+      return a
+    a = _new(cls)
+    _set_ip(a, value)
+    return a
+
+  @classmethod
+  def from_raw (cls, raw):
+    """
+    Returns an IPAddr for a 4 byte raw (network order) string.
+    """
+    return cls.from_int(_unpack_ip(raw)[0])
+
   def toSignedN (self):
     """ A shortcut """
     return self.toSigned(networkOrder = True)
@@ -259,25 +344,25 @@ class IPAddr (object):
 
   def toSigned (self, networkOrder = False):
     """ Return the address as a signed int """
-    if networkOrder:
-      return self._value
-    v = socket.htonl(self._value & 0xffFFffFF)
-    return struct.unpack("i", struct.pack("I", v))[0]
+    v = self.toUnsigned(networkOrder)
+    if v & 0x80000000:
+      return v - 0x100000000
+    return v
 
   def toRaw (self):
     """
     Returns the address as a four-character byte string.
     """
-    return struct.pack("i", self._value)
+    return _pack_ip(self._value)
 
   def toUnsigned (self, networkOrder = False):
     """
     Returns the address as an integer in either network or host (the
     default) byte order.
     """
-    if not networkOrder:
-      return socket.htonl(self._value & 0xffFFffFF)
-    return self._value & 0xffFFffFF
+    if networkOrder:
+      return socket.htonl(self._value)
+    return self._value
 
   def toStr (self):
     """ Return dotted quad representation """
@@ -304,20 +389,32 @@ class IPAddr (object):
       if type(n) is not IPAddr:
         n = IPAddr(n)
 
-    return (self.toUnsigned() & ~((1 << (32-b))-1)) == n.toUnsigned()
+    return (self._value & ~((1 << (32-b))-1)) == n._value
 
   def __str__ (self):
     return self.toStr()
 
   def __cmp__ (self, other):
+    if type(other) is IPAddr:
+      return cmp(self._value, other._value)
     if other is None: return 1
     try:
       if not isinstance(other, IPAddr):
         other = IPAddr(other)
-      return cmp(self.toUnsigned(), other.toUnsigned())
+      return cmp(self._value, other._value)
     except:
       return -other.__cmp__(self)
 
+  def __eq__ (self, other):
+    if type(other) is IPAddr:
+      return self._value == other._value
+    return self.__cmp__(other) == 0
+
+  def __ne__ (self, other):
+    if type(other) is IPAddr:
+      return self._value != other._value
+    return self.__cmp__(other) != 0
+
   def __hash__ (self):
     return self._value.__hash__()
 
@@ -328,9 +425,14 @@ class IPAddr (object):
     return 4
 
   def __setattr__ (self, a, v):
-    if hasattr(self, '_value'):
-      raise TypeError("This object is immutable")
-    object.__setattr__(self, a, v)
+    raise TypeError("This object is immutable")
+
+  def __reduce__ (self):
+    return (self.__class__, (self._value,))
+
+_set_ip = IPAddr._value.__set__
+_pack_ip = struct.Struct('!I').pack
+_unpack_ip = struct.Struct('!I').unpack
 
 
 def netmask_to_cidr (dq):
@@ -446,7 +548,6 @@ if __name__ == '__main__':
   for v in [('255.0.0.1',True), (0xff000001, True), (0x010000ff, False)]:
     print("== " + str(v) + " =======================")
     a = IPAddr(v[0],v[1])
-    print(a._value,-16777215)
     #print(hex(a._value),'ff000001')
     print(str(a),'255.0.0.1')
     print(hex(a.toUnsigned()),'010000ff')
@@ -117,3 +117,72 @@ class EpollSelect(object):
 
   def close(self):
     self.epoll.close()
+
+
+class EpollRegistry(object):
+  """ a thin wrapper around epoll with persistent registrations.
+      Unlike EpollSelect, which re-derives its registrations from the lists
+      it is handed on every call, objects stay registered here until they
+      are explicitly unregistered.  This is what you want when you have
+      lots of fds but only a few of them are active at any given time.
+
+      Like EpollSelect, you can register raw fds or objects that answer to
+      #fileno(), and poll() hands back the registered object.  The registry
+      itself has a fileno(), so it can be handed to select() (or a recoco
+      Select()) to wait for any of its members.
+  """
+
+  def __init__(self):
+    self.epoll = select.epoll()
+    self.fd_to_obj = {}
+
+  def fileno(self):
+    return self.epoll.fileno()
+
+  def __len__(self):
+    return len(self.fd_to_obj)
+
+  def register(self, obj, mask):
+    fd = obj.fileno() if hasattr(obj, "fileno") else obj
+    self.epoll.register(fd, mask)
+    self.fd_to_obj[fd] = obj
+
+  def modify(self, obj, mask):
+    fd = obj.fileno() if hasattr(obj, "fileno") else obj
+    self.epoll.modify(fd, mask)
+
+  def unregister(self, obj):
+    """ unregister obj. Tolerates fds which have already been closed
+        (the kernel drops those from the epoll set by itself).
+    """
+    try:
+      fd = obj.fileno() if hasattr(obj, "fileno") else obj
+    except Exception:
+      fd = None
+    if isinstance(obj, (int, long)):
+      # Equal fds needn't be the same int object
+      if fd not in self.fd_to_obj: return
+    elif fd is None or self.fd_to_obj.get(fd) is not obj:
+      # Closed out from under us; find it the hard way
+      for k,v in self.fd_to_obj.items():
+        if v is obj:
+          fd = k
+          break
+      else:
+        return
+    del self.fd_to_obj[fd]
+    try:
+      self.epoll.unregister(fd)
+    except (IOError, OSError):
+      pass
+
+  def poll(self, timeout=-1, maxevents=-1):
+    """ returns a list of (obj, eventmask) tuples """
+    fd_to_obj = self.fd_to_obj
+    return [(fd_to_obj[fd], event)
+            for fd, event in self.epoll.poll(timeout, maxevents)
+            if fd in fd_to_obj]
+
+  def close(self):
+    self.epoll.close()
+    self.fd_to_obj.clear()
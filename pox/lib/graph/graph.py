@@ -20,6 +20,7 @@
 import pox.lib.graph.minigraph as nx
 from collections import defaultdict
 from copy import copy
+from itertools import islice
 
 LINK = 'link'
 
@@ -63,7 +64,7 @@ class Link (object):
     return Link(self[1], self[0])
 
   def port (self, n):
-    return self._p[_index(n)]
+    return self._p[self._index(n)]
 
   def other_port (self, n):
     """
@@ -96,7 +97,7 @@ class Link (object):
     if type(n) is tuple:
       return n in [self[0], self[1]]
     else:
-      return n in [self._n]
+      return n in self._n
 
   def __len__ (self):
     return 2
@@ -125,6 +126,21 @@ class LeaveException (RuntimeError):
   pass
 
 class Operator (object):
+  def _compile (self):
+    """
+    Returns a function f(n, li) which evaluates this operator
+
+    Subclasses return closures over their compiled operands so that a
+    query tree is evaluated without any per-node method dispatch.
+    """
+    return self.__call__
+
+  def _overrides_call (self, base):
+    """
+    True if a subclass has its own __call__, so _compile can't be trusted
+    """
+    return type(self).__call__.im_func is not base.__call__.im_func
+
   def __repr__ (self):
     return "<%s>" % (self.__class__.__name__)
 
@@ -133,6 +149,9 @@ class Literal (Operator):
     self._v = v
   def __call__ (self, n, li=None):
     return self._v
+  def _compile (self):
+    v = self._v
+    return lambda n, li: v
   def __repr__ (self):
     return repr(self._v)
 
@@ -146,6 +165,8 @@ class Anything (Operator):
 class Self (Operator):
   def __call__ (self, n, li=None):
     return n
+  def _compile (self):
+    return lambda n, li: n
   def __repr__ (self):
     return "Self"
 
@@ -193,7 +214,7 @@ class Call (Operator):
         ao = v
       else:
         ao = Literal(v)
-      _self._kw[k].append(ao)
+      _self._kw[k] = ao
 
   def __call__ (self, n, li):
     arglist = []
@@ -201,7 +222,7 @@ class Call (Operator):
       arglist.append(arg(n,li))
     kws = {}
     for k,v in self._kw.iteritems():
-      kws[k] = v(n)
+      kws[k] = v(n, li)
     func = arglist.pop(0)
     return func(*arglist, **kws)
 
@@ -222,6 +243,13 @@ class UnaryOp (Operator):
     a = self._operand(n, li)
     return self._apply(a)
 
+  def _compile (self):
+    if self._overrides_call(UnaryOp):
+      return self.__call__
+    a = self._operand._compile()
+    apply = self._apply
+    return lambda n, li: apply(a(n, li))
+
   def _apply (self, attr):
     raise RuntimeError("Unimplemented")
 
@@ -241,6 +269,11 @@ class BinaryOp (Operator):
     r = self._right(n, li)
     return self._apply(l, r)
 
+  def _compile (self):
+    if self._overrides_call(BinaryOp):
+      return self.__call__
+    return _compile_binary(self)
+
   def _apply (self, l, r):
     raise RuntimeError("Unimplemented")
 
@@ -250,35 +283,51 @@ class BinaryOp (Operator):
     else:
       return "%s(%s, %s)" % (self.__class__.__name__, self._left, self._right)
 
+def _compile_binary (op):
+  l = op._left._compile()
+  r = op._right._compile()
+  apply = op._apply
+  return lambda n, li: apply(l(n, li), r(n, li))
+
 class Or (BinaryOp):
   _symbol = "or"
   def _apply (self, l, r):
     return l or r
+  def _compile (self):
+    # Unlike __call__, stops as soon as the left side is true
+    l = self._left._compile()
+    r = self._right._compile()
+    return lambda n, li: l(n, li) or r(n, li)
 
 class And (BinaryOp):
   _symbol = "and"
   def _apply (self, l, r):
     return l and r
+  def _compile (self):
+    # Unlike __call__, stops as soon as the left side is false
+    l = self._left._compile()
+    r = self._right._compile()
+    return lambda n, li: l(n, li) and r(n, li)
 
 class LessThan (BinaryOp):
   _symbol = "<"
-  def _apply (self, value):
-    return value < self._value
+  def _apply (self, l, r):
+    return l < r
 
 class GreaterThan (BinaryOp):
   _symbol = ">"
   def _apply (self, l, r):
-    return value > self._value
+    return l > r
 
 class LessThanEqualTo (BinaryOp):
   _symbol = "<="
   def _apply (self, l, r):
-    return value <= self._value
+    return l <= r
 
 class GreaterThanEqualTo (BinaryOp):
-  _symbol = "=>"
+  _symbol = ">="
   def _apply (self, l, r):
-    return value > self._value
+    return l >= r
 
 class Not (UnaryOp):
   def _apply (self, v):
@@ -326,6 +375,11 @@ class NodeOp (Operator):
     r = self._right(n, li)
     return self._apply(l, r)
 
+  def _compile (self):
+    if self._overrides_call(NodeOp):
+      return self.__call__
+    return _compile_binary(self)
+
   def _apply (self, l, r):
     raise RuntimeError("Unimplemented")
 
@@ -340,11 +394,19 @@ class Equal (NodeOp):
   def _apply (self, l, r):
     #print "???", repr(l), repr(r), l == r
     return l == r
+  def _compile (self):
+    l = self._left._compile()
+    r = self._right._compile()
+    return lambda n, li: l(n, li) == r(n, li)
 
 class Is (NodeOp):
   _symbol = "is"
   def _apply (self, l, r):
     return l is r
+  def _compile (self):
+    l = self._left._compile()
+    r = self._right._compile()
+    return lambda n, li: l(n, li) is r(n, li)
 
 class Field (NodeOp):
   def __init__ (self, left, right=_dummy, optional=True):
@@ -361,6 +423,25 @@ class Field (NodeOp):
     if do_call: a = a()
     #print ">>>",a
     return a
+
+  def _compile (self):
+    if not isinstance(self._right, Literal):
+      return NodeOp._compile(self)
+    # The field name is fixed, so work out what to fetch just once
+    name = self._right._v
+    do_call = name.endswith("()")
+    if do_call: name = name[:-2]
+    optional = self._optional
+    obj = self._left._compile()
+    def field (n, li):
+      try:
+        a = getattr(obj(n, li), name)
+      except AttributeError:
+        if optional: raise LeaveException
+        raise
+      if do_call: a = a()
+      return a
+    return field
 F = Field # Short alias
 
 class IsInstance (NodeOp):
@@ -384,10 +465,6 @@ class ConnectedTo (NodeOp):
     return "%s.connected_to(%s)" % (self._left, self._right)
 
 class InValues (BinaryOp):
-  def __init__ (self, left, right):
-    super(Member, self).__init__(left, right)
-    self._optional = optional
-
   def _apply (self, l, r):
     return l in r.values()
 
@@ -407,62 +484,126 @@ class Member (BinaryOp):
     return getattr(l, r)
 
 
+def _pins (query, pins = None):
+  """
+  Finds the values a link query requires of its ends
+
+  Returns a dict mapping Self, Port, Other and OtherPort to the value the
+  query compares them to with Equal or Is.  Only comparisons the whole
+  query depends on (i.e., ones joined by And) count.
+  """
+  if pins is None: pins = {}
+  if isinstance(query, And):
+    _pins(query._left, pins)
+    _pins(query._right, pins)
+  elif isinstance(query, (Equal, Is)):
+    l,r = query._left, query._right
+    if isinstance(l, Literal): l,r = r,l
+    if isinstance(r, Literal) and type(l) in (Self, Port, Other, OtherPort):
+      try:
+        hash(r._v)
+      except TypeError:
+        return pins
+      pins.setdefault(type(l), r._v)
+  return pins
+
+def _anything (n, li):
+  return True
+
+def _compile_query (query):
+  """
+  Turns a query into a function f(n, li) returning True if it matches
+  """
+  if query is None: return _anything
+  if isinstance(query, Operator):
+    f = query._compile()
+  else:
+    f = query
+  def test (n, li):
+    try:
+      return f(n, li)
+    except LeaveException:
+      return False
+  return test
+
+
 class Graph (object):
   def __init__ (self):
     self._g = nx.MultiGraph()
     self.node_port = {}
 
+    # Adjacency indexes.  Every link is kept as an entry tuple of
+    # (link, flipped link), which is stored in _links under both of its
+    # ends, and once in _entries.
+    self._links = {} # node -> port -> entry
+    self._port_nodes = {} # port -> set of nodes with a link on that port
+    self._entries = {} # link -> entry
+
   def __contains__ (self, n):
     return n in self._g
 
   def add (self, node):
     self._g.add_node(node)
-    self.node_port[node] = {}
+    self.node_port.setdefault(node, {})
+    self._links.setdefault(node, {})
 
   def remove (self, node):
+    for port in self.node_port.get(node, {}).keys():
+      self.disconnect_port((node, port))
     self._g.remove_node(node)
+    self.node_port.pop(node, None)
+    self._links.pop(node, None)
 
   def neighbors (self, n):
-    return self._g.neighbors(n)
+    return list(set(other[0] for other in self.node_port[n].itervalues()))
 
   def find_port (self, node1, node2):
-    for n1, n2, k, d in self._g.edges([node1, node2], data=True, keys=True):
-      return (d[LINK][node1][1], d[LINK][node2][1])
+    for port, other in self.node_port.get(node1, {}).iteritems():
+      if other[0] == node2:
+        return (port, other[1])
     return None
   
   def connected(self, node1, node2):
     return (self.find_port(node1, node2) != None)
 
+  def _attach (self, np, other, entry):
+    self.node_port[np[0]][np[1]] = other
+    self._links[np[0]][np[1]] = entry
+    self._port_nodes.setdefault(np[1], set()).add(np[0])
+
+  def _detach (self, np):
+    del self.node_port[np[0]][np[1]]
+    del self._links[np[0]][np[1]]
+    nodes = self._port_nodes[np[1]]
+    nodes.discard(np[0])
+    if not nodes:
+      del self._port_nodes[np[1]]
+
   def disconnect_port (self, np):
     """
     Disconnects the given (node,port)
     """
     assert type(np) is tuple
-    remove = []
     if self.port_for_node(np[0], np[1]) is None:
       return 0
-    for n1,n2,k,d in self._g.edges([np[0], self.node_port[np[0]][np[1]][0]], data=True, keys=True):
-      if np in d[LINK]:
-        remove.append((n1,n2,k))
-        del self.node_port[n1][d[LINK][n1][1]]
-        del self.node_port[n2][d[LINK][n2][1]]
-    for e in remove:
-      #print "remove",e
-      self._g.remove_edge(*e)
-    return len(remove)
+    l = self._links[np[0]][np[1]][0]
+    np1 = (l._n[0], l._p[0])
+    np2 = (l._n[1], l._p[1])
+    self._g.remove_edge(np1[0], np2[0], l)
+    self._detach(np1)
+    self._detach(np2)
+    del self._entries[l]
+    return 1
 
   def unlink (self, np1, np2):
-    count = 0
     if isinstance(np1, tuple):
-      count = disconnect_port(np1) 
+      return self.disconnect_port(np1)
     elif isinstance(np2, tuple):
-      count = disconnect_port(np2)
-    else:
-      for n1, n2, k, d in self._g.edges([np1, np2], data=True, keys=True):
-        self._g.remove_edge(n1,n2,k)
-        del self.node_port[n1][d[LINK][n1][1]]
-        del self.node_port[n2][d[LINK][n2][1]]
-        count = count + 1
+      return self.disconnect_port(np2)
+    count = 0
+    for port, other in self.node_port.get(np1, {}).items():
+      if other[0] == np2:
+        count += self.disconnect_port((np1, port))
     return count
 
   def link (self, np1, np2):
@@ -489,45 +630,90 @@ class Graph (object):
         if free not in np2.ports:
           np2 = (np2,free)
           break
-    self._g.add_node(np1[0])
-    self._g.add_node(np2[0])
+    self.add(np1[0])
+    self.add(np2[0])
     self.disconnect_port(np1)
     self.disconnect_port(np2)
-    self._g.add_edge(np1[0],np2[0],link=Link(np1,np2))
-    self.node_port[np1[0]][np1[1]] = np2
-    self.node_port[np2[0]][np2[1]] = np1
+    l = Link(np1,np2)
+    self._g.add_edge(np1[0],np2[0],key=l,link=l)
+    entry = (l, l.flip())
+    self._entries[l] = entry
+    self._attach(np1, np2, entry)
+    self._attach(np2, np1, entry)
+
+  def _entries_at (self, node, port):
+    """
+    Returns the entries for links with an end at (node, port)
 
-  def find_links (self, query1=None, query2=()):
-    # No idea if new link query stuff works.
+    Either can be _dummy to mean any.
+    """
+    if node is not _dummy:
+      ports = self._links.get(node)
+      if not ports: return ()
+      if port is _dummy: return ports.values()
+      e = ports.get(port)
+      return () if e is None else (e,)
+    nodes = self._port_nodes.get(port)
+    if not nodes: return ()
+    # Both ends of a link may be on this port number
+    return set(self._links[n][port] for n in nodes)
+
+  def _candidates (self, query1, query2):
+    """
+    Returns the entries for links which the queries might match
+
+    If a query pins down a node or port at either end, only links there
+    are returned, which takes O(degree).  Otherwise returns all of them.
+    """
+    best = None
+    for q in (query1, query2):
+      pins = _pins(q)
+      for n,p in ((Self, Port), (Other, OtherPort)):
+        node = pins.get(n, _dummy)
+        port = pins.get(p, _dummy)
+        if node is not _dummy and port is not _dummy:
+          return self._entries_at(node, port)
+        if node is not _dummy:
+          best = (node, port)
+        elif port is not _dummy and best is None:
+          best = (node, port)
+    if best is not None:
+      return self._entries_at(*best)
+    return self._entries.itervalues()
+
+  def _iter_links (self, query1, query2):
     if query2 is None: query2 = query1
     if query1 == (): query1 = None
     if query2 == (): query2 = None
-    o = set()
-    for n1,n2,k,d in self._g.edges(data=True, keys=True):
-      l = d[LINK]
-      ok = False
-      if query1 is None or self._test_node(l[0][0], args=(query1,), link=l):
-        if query2 is None or self._test_node(l[1][0], args=(query2,), link=l):
-          ok = True
-      if not ok and (query1 != query2):
-        if query2 is None or self._test_node(l[0][0], args=(query2,), link=l):
-          if query1 is None or self._test_node(l[1][0], args=(query1,), link=l):
-            ok = True
-            l = l.flip()
-      if ok:
-        o.add(l)
-    return list(o)
+    test1 = _compile_query(query1)
+    test2 = _compile_query(query2)
+    either_way = query1 != query2
+    # Each query is tested against its end's node, with the link flipped
+    # so that node is first (so Port is its own port).
+    for l,r in self._candidates(query1, query2):
+      n1,n2 = l._n
+      if test1(n1, l) and test2(n2, r):
+        yield l
+      elif either_way and test2(n1, l) and test1(n2, r):
+        yield r
+
+  def find_links (self, query1=None, query2=()):
+    """
+    Returns the links between a node matching query1 and one matching
+    query2, with the query1 end first
+
+    Leaving out query2 matches anything; passing None repeats query1.
+    Queries which compare Self, Port, Other or OtherPort to a value with
+    Equal or Is are answered from the adjacency index.
+    """
+    return list(self._iter_links(query1, query2))
 
   def ports_for_node (self, node):
     """
     Map of local port -> (other, other_port)
     """
     ports = defaultdict(_void)
-    for n1, n2, k, d in self._g.edges([node], data=True, keys=True):
-      p = d[LINK]
-      assert n1 is node
-      assert ports.get(p[node]) is None
-      ports[p[node][1]] = p.other(node)
+    ports.update(self.node_port.get(node, {}))
     return ports
  
   def port_for_node(self, node, port):
@@ -539,7 +725,7 @@ class Graph (object):
       can be a node, or a (node, port) pair
       Returns number of nodes disconnected
     """
-    self.unlink(node1, node2)
+    return self.unlink(node1, node2)
   
   def disconnect_node(self, node1):
     """ Disconnecte node from all neighbours """
@@ -567,7 +753,8 @@ class Graph (object):
       one = kw['one']
       del kw['one']
     assert len(kw) == 0
-    r = self.find_links(query1, query2)
+    # Two are enough to know there's more than one
+    r = list(islice(self._iter_links(query1, query2), 2 if one else 1))
     if len(r) > 1 and one:
       raise RuntimeError("More than one match")
     elif len(r) == 0:
@@ -577,8 +764,9 @@ class Graph (object):
     return r[0]
 
   def has_link (self, query1=None, query2=()):
-    # Really bad implementation.  We can easily scape early.
-    return len(self.find_links(query1, query2)) > 0
+    for l in self._iter_links(query1, query2):
+      return True
+    return False
 
   def _test_node (self, n, args=(), kw={}, link=None):
     #TODO: Should use a special value for unspecified n2
@@ -598,14 +786,13 @@ class Graph (object):
         return False
     return True
 
-  def find (self, *args, **kw):
-    r = []
-    def test (n):
-      return self._test_node(n, args, kw)
+  def _iter_nodes (self, args, kw):
     for n in self._g.nodes():
-      if test(n):
-        r.append(n)
-    return r
+      if self._test_node(n, args, kw):
+        yield n
+
+  def find (self, *args, **kw):
+    return list(self._iter_nodes(args, kw))
 
   def get_one (self, *args, **kw):
     kw['one'] = True
@@ -638,8 +825,9 @@ class Graph (object):
     return r[0]
 
   def has (self, *args, **kw):
-    # Really bad implementation.  We can easily scape early.
-    return len(self.find(*args,**kw)) > 0
+    for n in self._iter_nodes(args, kw):
+      return True
+    return False
 
   def __len__ (self):
     return len(self._g)
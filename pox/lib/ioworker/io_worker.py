@@ -322,6 +322,7 @@ class RecocoIOLoop (Task):
   """
   recoco task that handles the actual IO for our IO workers
   """
+  scheduling_class = 'io'
   _select_timeout = 5
   _BUF_SIZE = 8192
   more_debugging = False
@@ -53,6 +53,8 @@ from tcp import *
 from udp import *
 from vlan import *
 
+from packet_base import lazy_stats
+
 __all__ = [
   'arp',
   'dhcp',
@@ -80,4 +82,6 @@ __all__ = [
   'TCP',
   'UDP',
   'VLAN',
+
+  'lazy_stats',
 ]
@@ -103,6 +103,10 @@ class ethernet(packet_base):
     self.type = 0
     self.next = b''
 
+    if kw.pop('lazy', False):
+      # Only parse the payload when someone asks for it
+      self._lazy = True
+
     if raw is not None:
       self.parse(raw)
 
@@ -117,14 +121,14 @@ class ethernet(packet_base):
                % (alen,))
       return
 
-    self.dst = EthAddr(raw[:6])
-    self.src = EthAddr(raw[6:12])
+    self.dst = EthAddr.from_raw(raw[:6])
+    self.src = EthAddr.from_raw(raw[6:12])
     self.type = struct.unpack('!H', raw[12:ethernet.MIN_LEN])[0]
 
     self.hdr_len = ethernet.MIN_LEN
     self.payload_len = alen - self.hdr_len
 
-    self.next = ethernet.parse_next(self, self.type, raw, ethernet.MIN_LEN)
+    self._set_next(ethernet.parse_next, self.type, raw, ethernet.MIN_LEN)
     self.parsed = True
 
   @staticmethod
@@ -35,6 +35,7 @@
 #======================================================================
 import struct
 import random
+from socket import htons
 from packet_utils       import *
 
 from packet_base import packet_base
@@ -228,6 +229,5 @@ class icmp(packet_base):
             self.next = raw[self.MIN_LEN:]
 
     def hdr(self, payload):
-        self.csum = checksum(struct.pack('!BBH', self.type, self.code, 0) +
-                             payload)
+        self.csum = checksum(payload, htons((self.type << 8) | self.code))
         return struct.pack('!BBH', self.type, self.code, self.csum)
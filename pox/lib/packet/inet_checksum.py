@@ -0,0 +1,117 @@
+# This file is part of POX.
+#
+# POX is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# POX is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with POX.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+The Internet checksum (RFC 1071)
+
+checksum() computes it over a byte string, pseudo_header_checksum() does
+the same for TCP/UDP without gluing the pseudo-header onto the segment,
+and checksum_update() adjusts an existing checksum after a header field
+has been rewritten (RFC 1624), e.g., when decrementing the TTL or NATing
+an address.
+
+All checksums and field values taken and returned are ints in host byte
+order, as they'd be read from or written to a packet with struct's "!H".
+
+Long buffers are summed with NumPy if it's available.
+"""
+
+import array
+import struct
+from socket import ntohs, htons
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+# Buffers at least this long are summed with NumPy when possible.  Below
+# this, the setup cost outweighs the gain over array + sum().
+numpy_threshold = 4096
+
+_unpack_word = struct.Struct('H').unpack
+
+
+def _fold (s):
+  while s >> 16:
+    s = (s >> 16) + (s & 0xffff)
+  return s
+
+
+def checksum (data, start = 0, skip_word = None):
+  """
+  Returns the Internet checksum of data
+
+  start is a partial sum in native byte order to add in.  If skip_word is
+  given, the 16 bit word at that index (e.g., the checksum field itself)
+  is treated as zero.
+  """
+  n = len(data)
+  if n & 1:
+    # Pad the odd trailing byte with a zero
+    start += _unpack_word(data[-1] + b'\0')[0]
+    data = data[:-1]
+
+  if numpy is not None and n >= numpy_threshold:
+    words = numpy.frombuffer(data, dtype=numpy.uint16)
+    start += int(words.sum(dtype=numpy.uint64))
+  else:
+    words = array.array('H', data)
+    start += sum(words)
+  if skip_word is not None and skip_word < len(words):
+    start -= int(words[skip_word])
+
+  while start >> 16:
+    start = (start >> 16) + (start & 0xffff)
+  return ntohs(~start & 0xffff)
+
+
+def pseudo_header_checksum (srcip, dstip, protocol, data, skip_word = None):
+  """
+  Returns the TCP/UDP checksum of data under an IPv4 pseudo-header
+
+  srcip and dstip are IPAddrs.  The pseudo-header's length field is
+  len(data).  skip_word is as for checksum(), counted from the start of
+  data.
+  """
+  src = srcip.toUnsigned()
+  dst = dstip.toUnsigned()
+  ph = ((src >> 16) + (src & 0xffff) + (dst >> 16) + (dst & 0xffff)
+        + protocol + len(data))
+  # The ones' complement sum doesn't care about byte order (RFC 1071), so
+  # the pseudo-header can be summed as host order ints and swapped over.
+  return checksum(data, htons(_fold(ph)), skip_word)
+
+
+def checksum_update (csum, old, new, width = 16):
+  """
+  Returns csum adjusted for a field changing from old to new (RFC 1624)
+
+  width is the field's size in bits: 16, or 32 for an IP address.  Fields
+  narrower than 16 bits should be passed as the whole 16 bit word they
+  sit in, e.g., (ttl << 8) | protocol for the IPv4 TTL.
+
+  For UDP, a checksum of 0 means there isn't one, so leave it alone; a
+  computed 0 must be sent as 0xffff.
+  """
+  s = ~csum & 0xffff
+  if width == 32:
+    s += ((~old >> 16) & 0xffff) + (~old & 0xffff)
+    s += (new >> 16) + (new & 0xffff)
+  elif width == 16:
+    s += (~old & 0xffff) + new
+  else:
+    raise ValueError("Unsupported field width: %s" % (width,))
+  return ~_fold(s) & 0xffff
@@ -64,6 +64,13 @@ class ipv4(packet_base):
     UDP_PROTOCOL  = 17
     IGMP_PROTOCOL = 2
 
+    protocol_parsers = {
+      UDP_PROTOCOL  : udp,
+      TCP_PROTOCOL  : tcp,
+      ICMP_PROTOCOL : icmp,
+      IGMP_PROTOCOL : igmp,
+    }
+
     DF_FLAG = 0x02
     MF_FLAG = 0x01
 
@@ -136,8 +143,8 @@ class ipv4(packet_base):
                         % (self.hl, self.iplen))
             return
 
-        self.dstip = IPAddr(self.dstip)
-        self.srcip = IPAddr(self.srcip)
+        self.dstip = IPAddr.from_int(self.dstip)
+        self.srcip = IPAddr.from_int(self.srcip)
 
         # At this point, we are reasonably certain that we have an IP
         # packet
@@ -146,21 +153,18 @@ class ipv4(packet_base):
         length = self.iplen
         if length > dlen:
             length = dlen # Clamp to what we've got
-        if self.protocol == ipv4.UDP_PROTOCOL:
-            self.next = udp(raw=raw[self.hl*4:length], prev=self)
-        elif self.protocol == ipv4.TCP_PROTOCOL:
-            self.next = tcp(raw=raw[self.hl*4:length], prev=self)
-        elif self.protocol == ipv4.ICMP_PROTOCOL:
-            self.next = icmp(raw=raw[self.hl*4:length], prev=self)
-        elif self.protocol == ipv4.IGMP_PROTOCOL:
-            self.next = igmp(raw=raw[self.hl*4:length], prev=self)
+        if self.protocol in ipv4.protocol_parsers:
+            self._set_next(ipv4._parse_payload, raw[self.hl*4:length])
         elif dlen < self.iplen:
             self.msg('(ip parse) warning IP packet data shorter than IP len: %u < %u' % (dlen, self.iplen))
         else:
             self.next =  raw[self.hl*4:length]
 
-        if isinstance(self.next, packet_base) and not self.next.parsed:
-            self.next = raw[self.hl*4:length]
+    @staticmethod
+    def _parse_payload (prev, raw):
+        p = ipv4.protocol_parsers[prev.protocol](raw=raw, prev=prev)
+        if not p.parsed: return raw
+        return p
 
     def checksum(self):
         data = struct.pack('!BBHHHBBHII', (self.v << 4) + self.hl, self.tos,
@@ -93,8 +93,8 @@ class llc (packet_base):
 
     self.parsed = True
 
-    self.next = ethernet.parse_next(self, self.eth_type, raw, self.length,
-                                    allow_llc = False)
+    self._set_next(ethernet.parse_next, self.eth_type, raw, self.length,
+                   allow_llc = False)
 
   @property
   def effective_ethertype (self):
@@ -24,6 +24,12 @@ lg = logging.getLogger('packet')
 
 from pox.lib.util import initHelper
 
+# How lazily parsed payloads (see packet_base._set_next()) have fared.
+# "deferred" counts payloads whose parsing was put off, "parsed" counts
+# the ones that somebody later asked for, and "layers" breaks "parsed"
+# down by packet class name.
+lazy_stats = {'deferred' : 0, 'parsed' : 0, 'layers' : {}}
+
 class packet_base (object):
     """
     TODO: This description is somewhat outdated and should be fixed.
@@ -64,12 +70,51 @@ class packet_base (object):
         def __str__(self):
             # optionally convert to human readable string
     """
+    # When True, parsers which support it put off parsing their payload
+    # until .next is first read.  It's passed down from the containing
+    # packet, so it only needs setting on the outermost one (e.g., with
+    # ethernet's "lazy" argument).
+    _lazy = False
+
     def __init__ (self):
         self.next = None
         self.prev = None
         self.parsed = False
         self.raw = None
 
+    def __getattr__ (self, name):
+        # Only called when normal lookup fails, which for "next" means that
+        # _set_next() deferred parsing the payload and this is the first
+        # time anyone has asked for it.
+        if name == 'next':
+            pending = self.__dict__.pop('_next_parser', None)
+            if pending is not None:
+                parser, args, kw = pending
+                n = parser(self, *args, **kw)
+                self.next = n
+                lazy_stats['parsed'] += 1
+                layers = lazy_stats['layers']
+                layer = n.__class__.__name__
+                layers[layer] = layers.get(layer, 0) + 1
+                return n
+        raise AttributeError("'%s' object has no attribute '%s'"
+                             % (self.__class__.__name__, name))
+
+    def _set_next (self, parser, *args, **kw):
+        """
+        Sets the payload to parser(self, *args, **kw)
+
+        For lazy packets, the parser isn't called until .next is read.
+        """
+        prev = self.prev
+        if self._lazy or (prev is not None and prev._lazy):
+            self._lazy = True
+            self.__dict__.pop('next', None)
+            self._next_parser = (parser, args, kw)
+            lazy_stats['deferred'] += 1
+        else:
+            self.next = parser(self, *args, **kw)
+
     def _init (self, kw):
         if 'payload' in kw:
           self.set_payload(kw['payload'])
@@ -23,9 +23,7 @@
 Various functionality and data for the packet library
 """
 
-import array
-import struct
-from socket import ntohs
+from inet_checksum import checksum, pseudo_header_checksum, checksum_update
 
 _ethtype_to_str = {}
 _ipproto_to_str = {}
@@ -73,30 +71,6 @@ class TruncatedException (RuntimeError):
   pass
 
 
-def checksum (data, start = 0, skip_word = None):
-  if len(data) % 2 != 0:
-    arr = array.array('H', data[:-1])
-  else:
-    arr = array.array('H', data)
-
-  if skip_word is not None:
-    for i in range(0, len(arr)):
-      if i == skip_word:
-        continue
-      start +=  arr[i]
-  else:
-    for i in range(0, len(arr)):
-      start +=  arr[i]
-
-  if len(data) % 2 != 0:
-    start += struct.unpack('H', data[-1]+'\0')[0]
-
-  start  = (start >> 16) + (start & 0xffff)
-  start += (start >> 16)
-
-  return ntohs(~start & 0xffff)
-
-
 def ethtype_to_str(t):
   if t <= 0x05dc:
     return "802.3/%04x" % (t,)
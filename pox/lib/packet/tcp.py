@@ -303,7 +303,6 @@ class tcp(packet_base):
             return 0
 
         if unparsed:
-            payload_len = len(self.raw)
             payload = self.raw
         else:
             if payload is not None:
@@ -315,12 +314,6 @@ class tcp(packet_base):
             else:
                 payload = self.next
             payload = self.hdr(None, calc_checksum = False) + payload
-            payload_len = len(payload)
 
-        ippacket = struct.pack('!IIBBH', self.prev.srcip.toUnsigned(),
-                                         self.prev.dstip.toUnsigned(),
-                                         0,
-                                         self.prev.protocol,
-                                         payload_len)
-
-        return checksum(ippacket + payload, 0, 14)
+        return pseudo_header_checksum(self.prev.srcip, self.prev.dstip,
+                                      self.prev.protocol, payload, 8)
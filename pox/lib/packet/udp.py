@@ -130,7 +130,6 @@ class udp(packet_base):
             return 0
 
         if unparsed:
-            payload_len = len(self.raw)
             payload = self.raw
         else:
             if isinstance(self.next, packet_base):
@@ -141,17 +140,12 @@ class udp(packet_base):
                 payload = self.next
             payload_len = udp.MIN_LEN + len(payload)
 
-        ippacket = struct.pack('!IIBBH', self.prev.srcip.toUnsigned(),
-                                         self.prev.dstip.toUnsigned(),
-                                         0,
-                                         self.prev.protocol,
-                                         payload_len)
-
         if not unparsed:
           myhdr = struct.pack('!HHHH', self.srcport, self.dstport,
                               payload_len, 0)
           payload = myhdr + payload
 
-        r = checksum(ippacket + payload, 0, 9)
+        r = pseudo_header_checksum(self.prev.srcip, self.prev.dstip,
+                                   self.prev.protocol, payload, 3)
         return 0xffff if r == 0 else r
 
@@ -83,7 +83,7 @@ class vlan(packet_base):
 
         self.parsed = True
 
-        self.next = ethernet.parse_next(self,self.eth_type,raw,vlan.MIN_LEN)
+        self._set_next(ethernet.parse_next, self.eth_type, raw, vlan.MIN_LEN)
 
     @property
     def effective_ethertype (self):
@@ -27,16 +27,29 @@ import traceback
 import os
 import socket
 import pox.lib.util
-import random
-from pox.lib.epoll_select import EpollSelect
+import errno
+import math
+import weakref
+from heapq import heappush, heappop
+from pox.lib.epoll_select import EpollRegistry
 
 CYCLE_MAXIMUM = 2
 
+# Share of the scheduler each scheduling class gets when several of them
+# have tasks ready (classes not listed get a weight of 1)
+DEFAULT_WEIGHTS = {
+  'io' : 4,         # Socket loops, e.g., OpenFlow connections
+  'default' : 2,
+  'timer' : 2,      # Timers and the timer wheel
+  'call_later' : 1, # callLater() (e.g., requests from the web server)
+}
+
 # A ReturnFunction can return this to skip a scheduled slice at the last
 # moment.
 ABORT = object()
 
 defaultScheduler = None
+defaultTimerWheel = None
 
 nextTaskID = 0
 def generateTaskID ():
@@ -48,6 +61,9 @@ class BaseTask  (object):
   id = None
   #running = False
   priority = 1
+  scheduling_class = 'default'
+  run_time = 0.0 # Total seconds spent running this task
+  run_count = 0 # Number of times it has been run
 
   @classmethod
   def new (cls, *args, **kw):
@@ -72,7 +88,8 @@ class BaseTask  (object):
     Schedules this task.
 
     See Scheduler.schedule() and Scheduler.fast_schedule() for the meaning
-    of the 'fast' argument.
+    of the 'fast' argument.  Tasks with a higher priority run before others
+    of the same scheduling class (see ReadyQueue).
     """
     if scheduler is None: scheduler = defaultScheduler
     if priority != None: self.priority = priority
@@ -131,11 +148,110 @@ class Task (BaseTask):
     return "<" + self.__class__.__name__ + "/tid" + str(self.name) + ">"
 
 
+class ReadyQueue (object):
+  """
+  The tasks a Scheduler has ready to run.
+
+  There's a queue for each scheduling class (task.scheduling_class), and
+  the classes share the scheduler in proportion to their weights using
+  stride scheduling: each class has a "pass" which advances by
+  1/weight each time one of its tasks runs, and the ready class with the
+  lowest pass goes next.  A class which had nothing ready doesn't get to
+  bank credit for that time.  Within a class, tasks with a higher
+  priority always run first, and tasks of equal priority are FIFO.
+  This is all deterministic.
+
+  Safe to add to from other threads.
+  """
+  def __init__ (self, weights = None):
+    self.weights = dict(DEFAULT_WEIGHTS)
+    if weights: self.weights.update(weights)
+    self._classes = {} # name -> [pass, {priority:deque}, count]
+    self._members = set()
+    self._count = 0
+    self._pass = 0.0 # Pass of the class which ran most recently
+    self._lock = threading.Lock()
+
+  def __len__ (self):
+    return self._count
+
+  def __contains__ (self, task):
+    return task in self._members
+
+  def __iter__ (self):
+    return iter(list(self._members))
+
+  def append (self, task, first = False):
+    with self._lock:
+      self._add(task, first)
+
+  def appendleft (self, task):
+    self.append(task, True)
+
+  def extend (self, tasks):
+    with self._lock:
+      for task in tasks:
+        self._add(task, False)
+
+  def _add (self, task, first):
+    c = self._classes.get(task.scheduling_class)
+    if c is None:
+      c = self._classes[task.scheduling_class] = [self._pass, {}, 0]
+    elif c[2] == 0 and c[0] < self._pass:
+      c[0] = self._pass
+    q = c[1].get(task.priority)
+    if q is None: q = c[1][task.priority] = deque()
+    if first:
+      q.appendleft(task)
+    else:
+      q.append(task)
+    c[2] += 1
+    self._count += 1
+    self._members.add(task)
+
+  def popleft (self):
+    """
+    Removes and returns the task which should run next
+
+    Raises IndexError if there aren't any.
+    """
+    with self._lock:
+      best = None
+      for name,c in self._classes.iteritems():
+        if c[2] == 0: continue
+        if best is None or c[0] < best[0][0] or (c[0] == best[0][0] and
+            (self.weights.get(name, 1), name) >
+            (self.weights.get(best[1], 1), best[1])):
+          best = (c, name)
+      if best is None: raise IndexError("no tasks ready")
+      c,name = best
+      levels = c[1]
+      q = levels[max(p for p,q in levels.iteritems() if q)]
+      task = q.popleft()
+      c[2] -= 1
+      c[0] += 1.0 / self.weights.get(name, 1)
+      self._pass = c[0]
+      self._count -= 1
+      self._members.discard(task)
+      return task
+
+  def ready_counts (self):
+    """
+    Returns a dict of scheduling class -> number of tasks ready
+    """
+    return dict((name,c[2]) for name,c in self._classes.iteritems())
+
+
 class Scheduler (object):
   """ Scheduler for Tasks """
   def __init__ (self, isDefaultScheduler = None, startInThread = True,
-                daemon = False, useEpoll=False):
-    self._ready = deque()
+                daemon = False, useEpoll=False, weights=None):
+    """
+    weights maps scheduling class names to their share of the scheduler
+    (see ReadyQueue and DEFAULT_WEIGHTS)
+    """
+    self._ready = ReadyQueue(weights)
+    self._class_stats = {} # scheduling class -> [runs, seconds]
     self._hasQuit = False
     self._selectHub = SelectHub(self, useEpoll=useEpoll)
     self._thread = None
@@ -163,13 +279,26 @@ class Scheduler (object):
     scheduler.  This is a good way for another thread to call something in
     a co-op-thread-safe manner.
     """
+    self._get_call_later_task().callLater(func, *args, **kw)
 
-    with self._lock:
-      if self._callLaterTask is None:
-        self._callLaterTask = CallLaterTask()
-        self._callLaterTask.start()
+  def callLaterMany (self, calls):
+    """
+    Like callLater() for a sequence of calls, but cheaper
 
-    self._callLaterTask.callLater(func, *args, **kw)
+    Each call is a callable or a tuple of (callable, args[, kw]).
+    """
+    self._get_call_later_task().callLaterMany(calls)
+
+  def _get_call_later_task (self):
+    t = self._callLaterTask
+    if t is None:
+      with self._lock:
+        if self._callLaterTask is None:
+          t = CallLaterTask()
+          t.start(self)
+          self._callLaterTask = t
+        t = self._callLaterTask
+    return t
 
   def runThreaded (self, daemon = False):
     self._thread = Thread(target = self.run)
@@ -204,7 +333,7 @@ class Scheduler (object):
       return True
 
     st = ScheduleTask(self, task)
-    st.start(fast=True)
+    st.start(self, fast=True)
 
   def fast_schedule (self, task, first = False):
     """
@@ -237,14 +366,39 @@ class Scheduler (object):
 
     self._event.set()
 
+  def fast_schedule_many (self, tasks):
+    """
+    Like fast_schedule() for a sequence of tasks, but wakes the scheduler
+    just once
+    """
+    self._ready.extend(tasks)
+    self._event.set()
+
   def quit (self):
     self._hasQuit = True
+    self._event.set()
+
+  def get_stats (self):
+    """
+    Returns a dict of scheduling class -> dict of stats
+
+    The stats are the number of times tasks in the class were run, the
+    total time they ran for, and how many are ready to run right now.
+    """
+    r = {}
+    ready = self._ready.ready_counts()
+    for name in set(ready).union(self._class_stats):
+      runs,seconds = self._class_stats.get(name, (0, 0.0))
+      r[name] = dict(runs=runs, time=seconds, ready=ready.get(name, 0))
+    return r
 
   def run (self):
     try:
       while self._hasQuit == False:
         if len(self._ready) == 0:
-          self._event.wait(CYCLE_MAXIMUM) # Wait for a while
+          # An untimed wait blocks properly instead of polling (in Python
+          # 2), and anything which gives us work (or quit()) sets the event.
+          self._event.wait()
           self._event.clear()
           if self._hasQuit: break
         r = self.cycle()
@@ -257,21 +411,15 @@ class Scheduler (object):
   def cycle (self):
     #if len(self._ready) == 0: return False
 
-    # Patented hilarious priority system
-    #TODO: Replace it with something better
-    t = None
+    # See ReadyQueue for how the next task is picked
     try:
-      while True:
-        t = self._ready.popleft()
-        if t.priority >= 1: break
-        if len(self._ready) <= 1: break
-        if t.priority >= random.random(): break
-        self._ready.append(t)
+      t = self._ready.popleft()
     except IndexError:
       return False
 
     #print(len(self._ready), "tasks")
 
+    start = time.time()
     try:
       rv = t.execute()
     except StopIteration:
@@ -283,6 +431,15 @@ class Scheduler (object):
       except:
         pass
       return True
+    finally:
+      elapsed = time.time() - start
+      t.run_time += elapsed
+      t.run_count += 1
+      stats = self._class_stats.get(t.scheduling_class)
+      if stats is None:
+        stats = self._class_stats[t.scheduling_class] = [0, 0.0]
+      stats[0] += 1
+      stats[1] += elapsed
 
     if isinstance(rv, BlockingOperation):
       try:
@@ -485,20 +642,62 @@ class Send (BlockingOperation):
     task.rf = self._sendReturnFunc
     scheduler._selectHub.registerSelect(task, None, [self._fd], [self._fd])
 
+class _SelectRequest (object):
+  """
+  A task waiting in the SelectHub for file descriptors and/or a timeout
+  """
+  __slots__ = ('task', 'fds', 'active')
+
+  def __init__ (self, task):
+    self.task = task
+    self.fds = [] # (fd, which) where which is 0/1/2 for read/write/except
+    self.active = True
+
+
 #TODO: just merge this in with Scheduler?
 class SelectHub (object):
   """
   This class is a single select() loop that handles all Select() requests for
   a scheduler as well as timed wakes (i.e., Sleep()).
+
+  Timeouts live in a heap, and the waiters for each fd are kept in maps
+  which are updated as tasks come and go rather than being rebuilt from
+  all tasks every cycle.  With epoll, fds stay registered between waits,
+  including while the task that waits on them is off running between
+  Select()s.  They're registered one-shot so that an fd nobody is waiting
+  on doesn't keep the loop spinning, and are only re-armed when they've
+  fired or their interest has grown.  So a task that waits on the same
+  fds over and over only costs an epoll_ctl() for the ones that fired.
+
+  We remember which object each fd was armed for.  If a waiter turns up
+  with a different object for the same number, the fd was closed and its
+  number reused, so it gets registered afresh.  Raw fds and objects we
+  can't keep a weak reference to can't be told apart like that, so they
+  are always re-armed.  Registrations for objects which have gone away
+  or been closed are swept out once there are enough of them.
   """
   def __init__ (self, scheduler, useEpoll=False):
-    # We store tuples of (elapse-time, task)
+    self._woken = [] # Tasks to hand back to the scheduler
+    # We store tuples of (elapse-time, sequence number, _SelectRequest)
     self._sleepers = [] # Sleeping items stored as a heap
-    self._incoming = Queue() # Threadsafe queue for new items
+    self._sleeper_seq = 0
+    self._incoming = deque() # New requests, appended from any thread
+    self._incoming_pinged = False
+
+    # For read, write, and except: fd -> (_SelectRequest, object)
+    self._waiters = ({}, {}, {})
+    # fd -> (epoll mask currently armed (0 once it fired), weakref to the
+    # object it was armed for or None)
+    self._armed = {}
+    self._armed_limit = 64 # Sweep _armed when it grows past this
+    self._dirty = set() # fds which may need to be (re-)armed
 
     self._scheduler = scheduler
     self._pinger = pox.lib.util.makePinger()
-    self.epoll = EpollSelect() if useEpoll else None
+    self.epoll = None
+    if useEpoll:
+      self.epoll = EpollRegistry()
+      self.epoll.register(self._pinger.fileno(), select.EPOLLIN)
 
     self._ready = False
 
@@ -510,106 +709,219 @@ class SelectHub (object):
     #while self._ready == False:
 
   def _threadProc (self):
-    tasks = {}
-    timeouts = []
-    rets = {}
+    sleepers = self._sleepers
+    pinger = self._pinger
+    pinger_fd = pinger.fileno()
+    waiters = self._waiters
 
     while self._scheduler._hasQuit == False:
-      #print("SelectHub cycle")
-
-      if len(timeouts) == 0:
-        timeout = None
-      else:
-        timeout = self._sleepers[0][0] - time.time()
+      # Throw away timeouts for tasks which have already been woken
+      while sleepers and not sleepers[0][2].active:
+        heappop(sleepers)
+      if sleepers:
+        timeout = sleepers[0][0] - time.time()
         if timeout < 0: timeout = 0
+        elif timeout > CYCLE_MAXIMUM: timeout = CYCLE_MAXIMUM
+      else:
+        timeout = CYCLE_MAXIMUM
 
-      #NOTE: Everything you select on eventually boils down to file descriptors,
-      #      which are unique, obviously.  It might be possible to leverage this
-      #      to reduce hashing cost (i.e. by picking a really good hashing
-      #      function), though this is complicated by wrappers, etc...
-      rl = {}
-      wl = {}
-      xl = {}
-
-      timeout = None
-      timeoutTask = None
-
-      now = time.time()
-
-      expired = None
-
-      for t,trl,twl,txl,tto in tasks.itervalues():
-        if tto != None:
-          if tto <= now:
-            # Already expired
-            if expired is None: expired = []
-            expired.append(t)
-            if tto-now > 0.1: print("preexpired",tto,now,tto-now)
-            continue
-          tt = tto - now
-          if tt < timeout or timeout is None:
-            timeout = tt
-            timeoutTask = t
-
-        if trl:
-          for i in trl: rl[i] = t
-        if twl:
-          for i in twl: wl[i] = t
-        if txl:
-          for i in txl: xl[i] = t
-
-      if expired:
-        for t in expired:
-          del tasks[t]
-          self._return(t, ([],[],[]))
-
-      if timeout is None: timeout = CYCLE_MAXIMUM
       if self.epoll:
-        ro, wo, xo = self.epoll.select( rl.keys() + [self._pinger],
-                                  wl.keys(),
-                                  xl.keys(), timeout )
+        # epoll has millisecond resolution and truncates, which would spin
+        # until the first deadline rather than sleeping up to it
+        timeout = math.ceil(timeout * 1000) / 1000.0
+        ready = self._poll_epoll(timeout, pinger_fd)
       else:
-        ro, wo, xo = select.select( rl.keys() + [self._pinger],
-                                  wl.keys(),
-                                  xl.keys(), timeout )
-
-      if len(ro) == 0 and len(wo) == 0 and len(xo) == 0 and timeoutTask != None:
-        # IO is idle - dispatch timers / release timeouts
-        del tasks[timeoutTask]
-        self._return(timeoutTask, ([],[],[]))
-      else:
-        # We have IO events
-        if self._pinger in ro:
-          self._pinger.pongAll()
-          while not self._incoming.empty():
-            stuff = self._incoming.get(True)
-            task = stuff[0]
-            assert task not in tasks
-            tasks[task] = stuff
-            self._incoming.task_done()
-          if len(ro) == 1 and len(wo) == 0 and len(xo) == 0:
-            # Just recycle
+        ready = self._poll_select(timeout, pinger_fd)
+
+      # Wake tasks with IO events
+      rets = {}
+      pinged = False
+      for which,fds in enumerate(ready):
+        wmap = waiters[which]
+        for fd in fds:
+          if fd == pinger_fd:
+            pinged = True
             continue
-          ro.remove(self._pinger)
-
-        # At least one thread is going to be resumed
-        for i in ro:
-          task = rl[i]
-          if task not in rets: rets[task] = ([],[],[])
-          rets[task][0].append(i)
-        for i in wo:
-          task = wl[i]
-          if task not in rets: rets[task] = ([],[],[])
-          rets[task][1].append(i)
-        for i in xo:
-          task = xl[i]
-          if task not in rets: rets[task] = ([],[],[])
-          rets[task][2].append(i)
-
-        for t,v in rets.iteritems():
-          del tasks[t]
-          self._return(t, v)
-        rets.clear()
+          w = wmap.get(fd)
+          if w is None: continue
+          rv = rets.get(w[0])
+          if rv is None: rv = rets[w[0]] = ([],[],[])
+          rv[which].append(w[1])
+      for r,rv in rets.iteritems():
+        self._wake(r, rv)
+      self._flush_woken()
+
+      # Pick up new requests
+      if pinged:
+        pinger.pongAll()
+        self._incoming_pinged = False
+        incoming = self._incoming
+        while incoming:
+          self._add(incoming.popleft())
+
+      # Wake everything whose time has come
+      if sleepers:
+        now = time.time()
+        while sleepers and sleepers[0][0] <= now:
+          r = heappop(sleepers)[2]
+          if r.active:
+            self._wake(r, ([],[],[]))
+
+      if self.epoll and self._dirty:
+        self._rearm()
+      self._flush_woken()
+
+  def _poll_select (self, timeout, pinger_fd):
+    waiters = self._waiters
+    rl = list(waiters[0])
+    rl.append(pinger_fd)
+    try:
+      return select.select(rl, list(waiters[1]), list(waiters[2]), timeout)
+    except (select.error, socket.error, IOError, OSError, ValueError):
+      # Probably an fd got closed out from under its waiter
+      bad = []
+      for fd in set(waiters[0]).union(waiters[1], waiters[2]):
+        try:
+          select.select([fd], [], [], 0)
+        except Exception:
+          bad.append(fd)
+      return (bad, bad, bad)
+
+  def _poll_epoll (self, timeout, pinger_fd):
+    ro = []
+    wo = []
+    xo = []
+    armed = self._armed
+    dirty = self._dirty
+    error_mask = select.EPOLLERR | select.EPOLLHUP
+    read_mask = select.EPOLLIN | select.EPOLLPRI | error_mask
+    write_mask = select.EPOLLOUT | error_mask
+    for fd,event in self.epoll.poll(timeout):
+      if fd == pinger_fd:
+        ro.append(fd)
+        continue
+      # It's one-shot, so it's disarmed now
+      a = armed.get(fd)
+      if a is not None:
+        armed[fd] = (0, a[1])
+      dirty.add(fd)
+      if event & read_mask: ro.append(fd)
+      if event & write_mask: wo.append(fd)
+      if event & error_mask: xo.append(fd)
+    return (ro, wo, xo)
+
+  def _rearm (self):
+    """
+    Makes sure epoll is watching for whatever dirty fds are waited on
+    """
+    rwait, wwait, xwait = self._waiters
+    armed = self._armed
+    for fd in self._dirty:
+      mask = 0
+      w = xwait.get(fd)
+      r = rwait.get(fd)
+      if r is not None:
+        mask |= select.EPOLLIN | select.EPOLLPRI
+        w = r
+      r = wwait.get(fd)
+      if r is not None:
+        mask |= select.EPOLLOUT
+        w = r
+      if w is None:
+        # Nobody's waiting right now.  Leave it registered for when they
+        # come back; being one-shot, it fires at most once in the meantime.
+        continue
+      current = armed.get(fd)
+      if current is not None and current[0]:
+        if (current[0] | mask) == current[0]: continue
+      mask |= select.EPOLLONESHOT
+      try:
+        if current is None:
+          self.epoll.register(fd, mask)
+        else:
+          try:
+            self.epoll.modify(fd, mask)
+          except (IOError, OSError) as e:
+            # It was closed (so epoll forgot it), and the number reused
+            if e.errno != errno.ENOENT: raise
+            self.epoll.register(fd, mask)
+        try:
+          ref = weakref.ref(w[1])
+        except TypeError:
+          ref = None
+        armed[fd] = (mask, ref)
+      except (IOError, OSError):
+        # Bad fd; let whoever was waiting on it know
+        armed.pop(fd, None)
+        self.epoll.unregister(fd)
+        self._wake_bad_fd(fd)
+    self._dirty.clear()
+
+    if len(armed) > self._armed_limit:
+      self._sweep_armed()
+
+  def _sweep_armed (self):
+    """
+    Unregisters fds nobody waits on whose object is gone or closed
+    """
+    rwait, wwait, xwait = self._waiters
+    armed = self._armed
+    for fd,(mask,ref) in armed.items():
+      if fd in rwait or fd in wwait or fd in xwait: continue
+      obj = ref() if ref is not None else None
+      if obj is not None:
+        try:
+          if obj.fileno() == fd: continue
+        except Exception:
+          pass
+      del armed[fd]
+      self.epoll.unregister(fd)
+    self._armed_limit = max(64, 2 * len(armed))
+
+  def _wake_bad_fd (self, fd):
+    for which,wmap in enumerate(self._waiters):
+      w = wmap.get(fd)
+      if w is not None:
+        rv = ([],[],[])
+        rv[which].append(w[1])
+        self._wake(w[0], rv)
+
+  def _add (self, stuff):
+    task, rlist, wlist, xlist, timeout = stuff
+    r = _SelectRequest(task)
+    bad = None
+    for which,objs in enumerate((rlist, wlist, xlist)):
+      if not objs: continue
+      wmap = self._waiters[which]
+      for obj in objs:
+        try:
+          fd = obj if isinstance(obj, (int, long)) else obj.fileno()
+        except Exception:
+          if bad is None: bad = []
+          bad.append(obj)
+          continue
+        r.fds.append((fd, which))
+        wmap[fd] = (r, obj)
+        self._dirty.add(fd)
+        a = self._armed.get(fd)
+        if a is not None and (a[1] is None or a[1]() is not obj):
+          # Not what it was armed for, so the number may have been reused
+          self._armed[fd] = (0, None)
+    if bad:
+      self._wake(r, ([],[],bad))
+    elif timeout is not None:
+      self._sleeper_seq += 1
+      heappush(self._sleepers, (timeout, self._sleeper_seq, r))
+
+  def _wake (self, request, rv):
+    request.active = False
+    waiters = self._waiters
+    for fd,which in request.fds:
+      wmap = waiters[which]
+      w = wmap.get(fd)
+      if w is not None and w[0] is request:
+        del wmap[fd]
+    self._return(request.task, rv)
 
   def registerSelect (self, task, rlist = None, wlist = None, xlist = None,
                       timeout = None, timeIsAbsolute = False):
@@ -617,8 +929,11 @@ class SelectHub (object):
       if timeout != None:
         timeout += time.time()
 
-    self._incoming.put((task, rlist, wlist, xlist, timeout))
-    self._cycle()
+    self._incoming.append((task, rlist, wlist, xlist, timeout))
+    # One ping is enough for any number of requests until the hub wakes
+    if not self._incoming_pinged:
+      self._incoming_pinged = True
+      self._cycle()
 
   def _cycle (self):
     """
@@ -637,7 +952,15 @@ class SelectHub (object):
   def _return (self, sleepingTask, returnVal):
     #print("reschedule", sleepingTask)
     sleepingTask.rv = returnVal
-    self._scheduler.fast_schedule(sleepingTask)
+    self._woken.append(sleepingTask)
+
+  def _flush_woken (self):
+    """
+    Hands woken tasks back to the scheduler in one go
+    """
+    if self._woken:
+      self._scheduler.fast_schedule_many(self._woken)
+      self._woken = []
 
 
 class ScheduleTask (BaseTask):
@@ -656,6 +979,7 @@ class ScheduleTask (BaseTask):
     BaseTask.__init__(self)
     self._scheduler = scheduler
     self._task = task
+    self.scheduling_class = task.scheduling_class
 
   def run (self):
     #TODO: Refactor the following, since it is copy/pasted from schedule().
@@ -719,6 +1043,8 @@ class Timer (Task):
   started        If False, requires you to call .start() to begin timer
   selfStoppable  If True, the callback can return False to cancel the timer
   """
+  scheduling_class = 'timer'
+
   def __init__ (self, timeToWake, callback, absoluteTime = False,
                 recurring = False, args = (), kw = {}, scheduler = None,
                 started = True, selfStoppable = True):
@@ -754,32 +1080,259 @@ class Timer (Task):
     yield False # Quit
 
 
+class WheelTimer (object):
+  """
+  A timer run by a TimerWheel rather than by its own Task.
+
+  Takes the same arguments as Timer, so a Timer can be switched over when
+  the wheel's tick granularity is good enough for it.  Instead of a
+  scheduler, you can pass the TimerWheel to use (None means the default
+  one).  Like a Timer, it can be armed and cancelled from any thread.
+  """
+  def __init__ (self, timeToWake, callback, absoluteTime = False,
+                recurring = False, args = (), kw = {}, wheel = None,
+                started = True, selfStoppable = True):
+    if absoluteTime and recurring:
+      raise RuntimeError("Can't have a recurring timer for an absolute time!")
+    if wheel is None: wheel = get_default_timer_wheel()
+    self._wheel = wheel
+    self._self_stoppable = selfStoppable
+    self._next = timeToWake
+    self._interval = timeToWake if recurring else 0
+    if not absoluteTime:
+      self._next += time.time()
+
+    self._cancelled = False
+    self._due = None # Tick it's armed for
+
+    self._recurring = recurring
+    self._callback = callback
+    self._args = args
+    self._kw = kw
+
+    if started: self.start()
+
+  def start (self):
+    self._cancelled = False
+    self._wheel._arm(self)
+
+  def cancel (self):
+    self._cancelled = True
+    self._wheel._disarm(self)
+
+
+class _TimerWheelTask (BaseTask):
+  scheduling_class = 'timer'
+
+  def __init__ (self, wheel):
+    BaseTask.__init__(self)
+    self._wheel = wheel
+
+  def run (self):
+    wheel = self._wheel
+    while True:
+      with wheel._lock:
+        idle = not wheel._count
+        if idle: wheel._sleeping = True
+      if idle:
+        yield False # Until something gets armed
+        continue
+      now = wheel._tick_of(time.time())
+      wheel._advance(now)
+      if wheel._count:
+        yield Sleep((now + 1) * wheel.tick, absoluteTime=True)
+
+
+class TimerWheel (object):
+  """
+  Runs lots of timed callbacks from a single Task.
+
+  Rather than every timer being its own Task sleeping in the SelectHub,
+  timers are hashed into the slots of a wheel by the tick they expire on,
+  and one Task wakes up each tick to run the ones which are due.  Arming
+  and cancelling are O(1).  The price is that timers only fire on tick
+  boundaries, so this is meant for timeouts and housekeeping rather than
+  precise timing.
+
+  tick is the granularity in seconds.  Timers never fire early, but may
+  fire up to a tick late.
+
+  Timers may be armed and cancelled from any thread; the slots are
+  guarded by a lock, which isn't held while callbacks run.
+  """
+  def __init__ (self, tick = 0.1, slots = 512, scheduler = None,
+                isDefaultTimerWheel = None):
+    self.tick = tick
+    self._slots = [set() for _ in range(slots)]
+    self._count = 0
+    self._current = self._tick_of(time.time()) # Last tick processed
+    self._scheduler = scheduler
+    self._task = None
+    self._sleeping = True
+    self._lock = threading.Lock()
+
+    global defaultTimerWheel
+    if isDefaultTimerWheel or (isDefaultTimerWheel is None and
+                               defaultTimerWheel is None):
+      defaultTimerWheel = self
+
+  def __len__ (self):
+    return self._count
+
+  def callDelayed (_self, _seconds, _func, *args, **kw):
+    """
+    Calls the function after the given number of seconds (rounded up to
+    the tick).  Returns a WheelTimer which can be cancelled.
+    """
+    return WheelTimer(_seconds, _func, args=args, kw=kw, wheel=_self)
+
+  def _tick_of (self, t):
+    return int(t / self.tick)
+
+  def _arm (self, timer):
+    with self._lock:
+      if timer._due is not None: self._remove(timer)
+      due = int(math.ceil(timer._next / self.tick))
+      if due <= self._current: due = self._current + 1
+      timer._due = due
+      self._slots[due % len(self._slots)].add(timer)
+      self._count += 1
+      wake = self._sleeping
+      if wake:
+        self._sleeping = False
+        if self._task is None: self._task = _TimerWheelTask(self)
+    if wake:
+      # From another thread, this defers to the scheduler thread, which
+      # won't get to it until the task has actually gone to sleep
+      self._task.start(self._scheduler)
+
+  def _disarm (self, timer):
+    with self._lock:
+      self._remove(timer)
+
+  def _remove (self, timer):
+    # Must hold _lock
+    if timer._due is None: return
+    self._slots[timer._due % len(self._slots)].discard(timer)
+    timer._due = None
+    self._count -= 1
+
+  def _advance (self, now):
+    """
+    Runs everything due up to and including tick now
+    """
+    slots = self._slots
+    n = len(slots)
+    lock = self._lock
+    # If we've fallen a whole revolution behind, each slot only needs
+    # to be looked at once
+    start = max(self._current + 1, now - n + 1)
+    for tick in xrange(start, now + 1):
+      slot = slots[tick % n]
+      with lock:
+        self._current = tick
+        if not slot: continue
+        due = [t for t in slot if t._due <= now]
+      due.sort(key=lambda t: t._next)
+      for timer in due:
+        with lock:
+          if timer._due is None or timer._due > now:
+            continue # Cancelled or re-armed since
+          slot.discard(timer)
+          timer._due = None
+          self._count -= 1
+        self._fire(timer)
+    with lock:
+      self._current = now
+
+  def _fire (self, timer):
+    timer._next = time.time() + timer._interval
+    try:
+      rv = timer._callback(*timer._args, **timer._kw)
+    except:
+      import logging
+      logging.getLogger("recoco").exception("Exception in timer callback %s",
+                                            timer._callback)
+      rv = None
+    if timer._cancelled: return
+    if timer._self_stoppable and (rv is False): return
+    if timer._recurring and timer._due is None:
+      self._arm(timer)
+
+
+def get_default_timer_wheel ():
+  """
+  Returns the default TimerWheel, creating it if there isn't one
+  """
+  if defaultTimerWheel is None: TimerWheel()
+  return defaultTimerWheel
+
+
 class CallLaterTask (BaseTask):
+  """
+  Runs functions handed to it from other threads
+
+  Calls go in a deque (appending is atomic, so producers don't need a
+  lock).  The first call to arrive while the task is idle schedules it
+  directly; any more that arrive before it gets to run just ride along.
+  A non-blocking acquire of _wake_pending decides who does the waking.
+  """
+  scheduling_class = 'call_later'
+
   def __init__ (self):
     BaseTask.__init__(self)
-    self._pinger = pox.lib.util.makePinger()
-    from collections import deque
     self._calls = deque()
+    self._scheduler = None
+    # Held while the task is scheduled (or about to be), so that only
+    # one producer wakes it
+    self._wake_pending = threading.Lock()
+    self._wake_pending.acquire()
+
+  def start (self, scheduler = None, priority = None, fast = False):
+    if scheduler is None: scheduler = defaultScheduler
+    self._scheduler = scheduler
+    BaseTask.start(self, scheduler, priority, fast)
 
   def callLater (self, func, *args, **kw):
     assert callable(func)
     self._calls.append((func,args,kw))
-    self._pinger.ping()
+    if self._wake_pending.acquire(False):
+      self._scheduler.fast_schedule(self)
+
+  def callLaterMany (self, calls):
+    items = []
+    for c in calls:
+      if callable(c):
+        items.append((c, (), {}))
+      else:
+        assert callable(c[0])
+        items.append((c[0], c[1], c[2] if len(c) > 2 else {}))
+    if not items: return
+    self._calls.extend(items)
+    if self._wake_pending.acquire(False):
+      self._scheduler.fast_schedule(self)
 
   def run (self):
+    calls = self._calls
     while True:
-      yield Select([self._pinger], None, None)
-      self._pinger.pongAll()
-      try:
-        while True:
-          e = self._calls.popleft()
-          try:
-            e[0](*e[1], **e[2])
-          except:
-            import logging
-            logging.getLogger("recoco").exception("Exception calling %s", e[0])
-      except:
-        pass
+      # Only run what's here now, so a flood of calls can't starve
+      # everything else
+      for i in xrange(len(calls)):
+        e = calls.popleft()
+        try:
+          e[0](*e[1], **e[2])
+        except:
+          import logging
+          logging.getLogger("recoco").exception("Exception calling %s", e[0])
+      if calls:
+        yield 0 # Still scheduled, so _wake_pending stays held
+        continue
+      self._wake_pending.release()
+      # A producer may have added something just before the release and
+      # failed to get the lock; if so, whoever gets it now does the wake.
+      if calls and self._wake_pending.acquire(False):
+        continue
+      yield False
 
 
 class BlockingTask (BaseTask):
@@ -147,6 +147,25 @@ EventRemove = EventReturn(remove=True)
 EventHaltAndRemove = EventReturn(remove=True, halt=True)
 
 
+def _handleReturn (source, eid, rv):
+  """
+  Acts on a non-None value returned by an event handler
+
+  Removes the handler from source if it asked to be removed, and returns
+  True if it asked for the event to be halted.
+  """
+  if rv is False:
+    source.removeListener(eid)
+  elif rv is True:
+    return True
+  elif type(rv) == tuple:
+    if len(rv) >= 2 and rv[1] == True:
+      source.removeListener(eid)
+    if len(rv) == 0 or rv[0]:
+      return True
+  return False
+
+
 class Event (object):
   """
   Superclass for events
@@ -221,6 +240,32 @@ class EventMixin (object):
       setattr(self, "_eventMixin_events", True)
     if not hasattr(self, "_eventMixin_handlers"):
       setattr(self, "_eventMixin_handlers", {})
+    if not hasattr(self, "_eventMixin_chains"):
+      setattr(self, "_eventMixin_chains", {})
+
+  def _eventMixin_compile (self, eventType):
+    """
+    Builds and caches the dispatch chain for an event type
+
+    The chain is a tuple of (handler, once, eid) in the order they should
+    be called, plus a flag saying whether handlers can be called directly
+    or have to go through the event's _invoke().  It's thrown away
+    whenever the listeners change, so raiseEvent() doesn't need to check
+    the event type or copy the handler list for every event.
+    """
+    if (self._eventMixin_events is not True
+        and eventType not in self._eventMixin_events):
+      raise RuntimeError("Event %s not defined on object of type %s"
+                         % (eventType, type(self)))
+    direct = True
+    for c in getattr(eventType, '__mro__', ()):
+      if '_invoke' in c.__dict__:
+        direct = c is Event
+        break
+    handlers = self._eventMixin_handlers.get(eventType, ())
+    chain = (direct, tuple((h, once, eid) for (p, h, once, eid) in handlers))
+    self._eventMixin_chains[eventType] = chain
+    return chain
 
   def raiseEventNoErrors (self, event, *args, **kw):
     """
@@ -246,59 +291,46 @@ class EventMixin (object):
     Returns the event object, unless it was never created (because there
     were no listeners) in which case returns None.
     """
-    self._eventMixin_init()
+    try:
+      chains = self._eventMixin_chains
+    except AttributeError:
+      self._eventMixin_init()
+      chains = self._eventMixin_chains
 
-    classCall = False
     if isinstance(event, Event):
       eventType = event.__class__
-      classCall = True
+      chain = chains.get(eventType)
+      if chain is None: chain = self._eventMixin_compile(eventType)
       if event.source is None: event.source = self
-    elif issubclass(event, Event):
-      # Check for early-out
-      if event not in self._eventMixin_handlers:
-        return None
-      if len(self._eventMixin_handlers[event]) == 0:
-        return None
-
-      classCall = True
+    else:
       eventType = event
+      chain = chains.get(eventType)
+      if chain is None:
+        # Check for early-out
+        if not self._eventMixin_handlers.get(eventType):
+          return None
+        chain = self._eventMixin_compile(eventType)
+      if not chain[1]: return None
       event = eventType(*args, **kw)
       args = ()
       kw = {}
       if event.source is None:
         event.source = self
-    #print("raise",event,eventType)
-    if (self._eventMixin_events is not True
-        and eventType not in self._eventMixin_events):
-      raise RuntimeError("Event %s not defined on object of type %s"
-                         % (eventType, type(self)))
 
-    # Create a copy so that it can be modified freely during event
-    # processing.  It might make sense to change this.
-    handlers = self._eventMixin_handlers.get(eventType, [])
-    for (priority, handler, once, eid) in handlers:
-      if classCall:
-        rv = event._invoke(handler, *args, **kw)
-      else:
+    # The chain is a snapshot, so handlers can add and remove listeners
+    # freely while we're working through it.
+    direct, handlers = chain
+    for (handler, once, eid) in handlers:
+      if direct:
         rv = handler(event, *args, **kw)
+      else:
+        rv = event._invoke(handler, *args, **kw)
       if once: self.removeListener(eid)
       if rv is None: continue
-      if rv is False:
-        self.removeListener(eid)
-      if rv is True:
-        if classCall: event.halt = True
+      if _handleReturn(self, eid, rv):
+        event.halt = True
         break
-      if type(rv) == tuple:
-        if len(rv) >= 2 and rv[1] == True:
-          self.removeListener(eid)
-        if len(rv) >= 1 and rv[0]:
-          if classCall: event.halt = True
-          break
-        if len(rv) == 0:
-          if classCall: event.halt = True
-          break
-      #if classCall and hasattr(event, "halt") and event.halt:
-      if classCall and event.halt:
+      if event.halt:
         break
     return event
 
@@ -365,6 +397,7 @@ class EventMixin (object):
                                                 if x[1] != handler]
         altered = altered or l != len(self._eventMixin_handlers[eventType])
 
+    if altered: self._eventMixin_chains.clear()
     return altered
 
   def addListenerByName (self, *args, **kw):
@@ -438,6 +471,7 @@ class EventMixin (object):
     if priority is not None:
       # If priority is specified, sort the event handlers
       handlers.sort(reverse = True, key = operator.itemgetter(0))
+    self._eventMixin_chains.pop(eventType, None)
 
     return (eventType,eid)
 
@@ -468,6 +502,7 @@ class EventMixin (object):
     Remove all handlers from this object
     """
     self._eventMixin_handlers = {}
+    self._eventMixin_chains = {}
 
 
 def autoBindEvents (sink, source, prefix='', weak=False, priority=None):
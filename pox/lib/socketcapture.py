@@ -36,6 +36,11 @@ class SocketWedge (object):
     self._recv_out(r)
     return r
 
+  def recv_into (self, buffer, nbytes=0, *args, **kw):
+    r = self._socket.recv_into(buffer, nbytes, *args, **kw)
+    self._recv_out(memoryview(buffer)[:r].tobytes())
+    return r
+
   def __getattr__ (self, n):
     return getattr(self._socket, n)
 
@@ -177,19 +177,43 @@ class PacketIn (Event):
   port (int) - number of port the packet came in on
   data (bytes) - raw packet data
   parsed (packet subclasses) - pox.lib.packet's parsed version
+
+  The packet is parsed lazily, one layer at a time: only the Ethernet
+  header is parsed when "parsed" is first read, and each payload after
+  that is parsed the first time its containing layer's .next (or
+  .payload, .find(), etc.) is read.  See pox.lib.packet.lazy_stats.
   """
   def __init__ (self, connection, ofp):
     Event.__init__(self)
     self.connection = connection
     self.ofp = ofp
-    self.port = ofp.in_port
-    self.data = ofp.data
+    self._port = None
+    self._data = None
     self._parsed = None
     self.dpid = connection.dpid
 
+  # port and data come from the ofp on demand so that a lazily unpacked
+  # packet_in isn't decoded for listeners which never look at them.
+
+  @property
+  def port (self):
+    if self._port is None: return self.ofp.in_port
+    return self._port
+  @port.setter
+  def port (self, value):
+    self._port = value
+
+  @property
+  def data (self):
+    if self._data is None: return self.ofp.data
+    return self._data
+  @data.setter
+  def data (self, value):
+    self._data = value
+
   def parse (self):
     if self._parsed is None:
-      self._parsed = ethernet(self.data)
+      self._parsed = ethernet(self.data, lazy=True)
     return self._parsed
 
   @property
@@ -252,6 +276,26 @@ class BarrierIn (Event):
     self.dpid = connection.dpid
     self.xid = ofp.xid
 
+class ConnectionBackpressure (Event):
+  """
+  Raised when a connection's output buffer crosses a watermark
+
+  Output which doesn't fit into a switch's socket buffer is buffered on
+  its connection.  When more than the connection's send_high_water bytes
+  are waiting, this is raised with congested=True.  When the buffer has
+  drained below send_low_water, it is raised again with congested=False.
+  Components which send bursts of flow_mods can use this to back off from
+  a switch which isn't keeping up.
+  congested (bool) - True if the connection just became congested
+  buffered (int) - number of bytes waiting to be sent
+  """
+  def __init__ (self, connection, congested, buffered):
+    Event.__init__(self)
+    self.connection = connection
+    self.dpid = connection.dpid
+    self.congested = congested
+    self.buffered = buffered
+
 class ConnectionIn (Event):
   def __init__ (self, connection):
     super(ConnectionIn,self).__init__()
@@ -332,6 +376,7 @@ class OpenFlowNexus (EventMixin):
     PortStatsReceived,
     QueueStatsReceived,
     FlowRemoved,
+    ConnectionBackpressure,
   ])
 
   # Bytes to send to controller when a packet misses all flows
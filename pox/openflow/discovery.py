@@ -27,15 +27,18 @@ Discovery module, or a Discovery superclass.
 """
 
 from pox.lib.revent import *
-from pox.lib.recoco import Timer
+from pox.lib.recoco import Timer, WheelTimer
 from pox.lib.util import dpid_to_str, str_to_bool
+from pox.lib.addresses import EthAddr
 from pox.core import core
 import pox.openflow.libopenflow_01 as of
 import pox.lib.packet as pkt
 
 import struct
 import time
-from collections import namedtuple
+import math
+import heapq
+from collections import namedtuple, deque
 from random import shuffle
 
 log = core.getLogger()
@@ -48,11 +51,7 @@ class LLDPSender (object):
 
   SendItem = namedtuple("LLDPSenderItem", ('dpid','port_num','packet'))
 
-  #NOTE: This class keeps the packets to send in a flat list, which makes
-  #      adding/removing them on switch join/leave or (especially) port
-  #      status changes relatively expensive. Could easily be improved.
-
-  def __init__ (self, send_cycle_time, ttl = 120):
+  def __init__ (self, send_cycle_time, ttl = 120, tick = 0.1):
     """
     Initialize an LLDP packet sender
 
@@ -63,12 +62,36 @@ class LLDPSender (object):
     ttl is the time (in seconds) for which a receiving LLDP agent should
       consider the rest of the data to be valid.  We don't use this, but
       other LLDP agents might.  Can't be 0 (this means revoke).
+
+    tick is the shortest time (in seconds) between sends.  If there are
+      too many packets to send them one at a time that often, they're
+      sent in bursts every tick instead, with each switch's share of a
+      burst going out in a single write.
     """
-    # Packets remaining to be sent in this cycle
-    self._this_cycle = []
+    # Per-DPID LLDP TLVs which come before and after the port TLV
+    self._templates = {}
+
+    # Port TLVs, which are the same for every switch
+    self._port_tlvs = {}
+
+    # Chassis and port TLVs of the probes we're sending -> (dpid, port)
+    self._probe_origins = {}
+
+    self._tick = tick
+    self._burst = 1
+
+    self._stats = dict(packets=0, writes=0, cycles=0, cycle_time=None,
+                       busy_time=0.0)
+    self._cycle_start = None
 
-    # Packets we've already sent in this cycle
-    self._next_cycle = []
+    # Packets to send, bucketed by DPID and then port number, so that
+    # switch and port changes only touch the packets for that switch
+    self._packets = {} # dpid -> {port_num -> [SendItem]}
+    self._num_packets = 0
+
+    # Packets remaining to be sent in this cycle.  Packets for ports which
+    # have since gone away are skipped when they come up.
+    self._this_cycle = deque()
 
     self._timer = None
     self._ttl = ttl
@@ -98,53 +121,177 @@ class LLDPSender (object):
     self.del_switch(event.dpid)
 
   def del_switch (self, dpid, set_timer = True):
-    self._this_cycle = [p for p in self._this_cycle if p.dpid != dpid]
-    self._next_cycle = [p for p in self._next_cycle if p.dpid != dpid]
+    ports = self._packets.pop(dpid, None)
+    template = self._templates.pop(dpid, None)
+    if ports:
+      if template is not None:
+        for port_num in ports:
+          self._forget_probe(template, port_num)
+      self._num_packets -= sum(len(items) for items in ports.itervalues())
     if set_timer: self._set_timer()
 
   def del_port (self, dpid, port_num, set_timer = True):
     if port_num > of.OFPP_MAX: return
-    self._this_cycle = [p for p in self._this_cycle
-                        if p.dpid != dpid or p.port_num != port_num]
-    self._next_cycle = [p for p in self._next_cycle
-                        if p.dpid != dpid or p.port_num != port_num]
+    ports = self._packets.get(dpid)
+    if ports is None: return
+    items = ports.pop(port_num, None)
+    if items is not None:
+      self._num_packets -= len(items)
+      template = self._templates.get(dpid)
+      if template is not None: self._forget_probe(template, port_num)
+      if not ports: del self._packets[dpid]
     if set_timer: self._set_timer()
 
   def add_port (self, dpid, port_num, port_addr, set_timer = True):
     if port_num > of.OFPP_MAX: return
     self.del_port(dpid, port_num, set_timer = False)
-    self._next_cycle.append(LLDPSender.SendItem(dpid, port_num,
-          self.create_discovery_packet(dpid, port_num, port_addr, "LLDP")))
-    self._next_cycle.append(LLDPSender.SendItem(dpid, port_num,
-          self.create_discovery_packet(dpid, port_num, port_addr, "BDDP")))
+    items = [LLDPSender.SendItem(dpid, port_num,
+               self._build_discovery_packet(dpid, port_num, port_addr, t))
+             for t in ("LLDP", "BDDP")]
+    self._packets.setdefault(dpid, {})[port_num] = items
+    self._num_packets += len(items)
     if set_timer: self._set_timer()
 
   def _set_timer (self):
     if self._timer: self._timer.cancel()
     self._timer = None
-    num_packets = len(self._this_cycle) + len(self._next_cycle)
+    num_packets = self._num_packets
     if num_packets != 0:
-      self._timer = Timer(self._send_cycle_time / float(num_packets),
-                          self._timer_handler, recurring=True)
+      interval = self._send_cycle_time / float(num_packets)
+      self._burst = 1
+      if interval < self._tick:
+        self._burst = int(math.ceil(self._tick / interval))
+        interval = self._send_cycle_time * self._burst / float(num_packets)
+      self._timer = Timer(interval, self._timer_handler, recurring=True)
+
+  def _next_item (self):
+    """
+    Returns the next packet to send, or None if there aren't any
+
+    When this cycle's packets have all been sent, starts the next cycle
+    with all the current packets in a random order.
+    """
+    while True:
+      if not self._this_cycle:
+        items = [item for ports in self._packets.itervalues()
+                 for items in ports.itervalues() for item in items]
+        if not items: return None
+        shuffle(items)
+        self._this_cycle = deque(items)
+        now = time.time()
+        if self._cycle_start is not None:
+          self._stats['cycles'] += 1
+          self._stats['cycle_time'] = now - self._cycle_start
+        self._cycle_start = now
+      item = self._this_cycle.popleft()
+      current = self._packets.get(item.dpid, {}).get(item.port_num, ())
+      for i in current:
+        if i is item: return item
 
   def _timer_handler (self):
     """
     Called by a timer to actually send packets.
 
-    Picks the first packet off this cycle's list, sends it, and then puts
-    it on the next-cycle list.  When this cycle's list is empty, starts
-    the next cycle.
+    Sends the next burst of packets, one write per switch.
+    """
+    start = time.time()
+    by_dpid = {}
+    for _ in xrange(self._burst):
+      item = self._next_item()
+      if item is None: break
+      packets = by_dpid.get(item.dpid)
+      if packets is None:
+        by_dpid[item.dpid] = [item.packet]
+      else:
+        packets.append(item.packet)
+    stats = self._stats
+    for dpid, packets in by_dpid.iteritems():
+      core.openflow.sendToDPID(dpid, b''.join(packets))
+      stats['packets'] += len(packets)
+      stats['writes'] += 1
+    stats['busy_time'] += time.time() - start
+
+  def get_stats (self):
+    """
+    Returns a dict of statistics
+
+    packets and writes are the discovery packets sent and the number of
+    writes they took.  cycles is the number of complete send cycles, and
+    cycle_time is how long the last one took.  busy_time is the total time
+    (in seconds) spent sending.
+    """
+    stats = dict(self._stats)
+    stats['ports'] = sum(len(ports) for ports in self._packets.itervalues())
+    stats['burst'] = self._burst
+    return stats
+
+  def _build_discovery_packet (self, dpid, port_num, port_addr, discType):
+    """
+    Fast version of create_discovery_packet()
+
+    Produces the same bytes (other than the xid), but from pieces which
+    are built once per switch and once per port number.
+    """
+    template = self._templates.get(dpid)
+    if template is None:
+      lldp = self.create_discovery_packet(dpid, 0, None, "LLDP", raw = True)
+      template = (lldp.tlvs[0].pack(),
+                  b''.join(t.pack() for t in lldp.tlvs[2:]))
+      self._templates[dpid] = template
+    port_tlv = self._port_tlvs.get(port_num)
+    if port_tlv is None:
+      port_tlv = pkt.port_id(subtype=pkt.port_id.SUB_PORT,
+                             id=str(port_num)).pack()
+      self._port_tlvs[port_num] = port_tlv
+
+    self._probe_origins[template[0] + port_tlv] = (dpid, port_num)
+
+    if discType == "LLDP":
+      eth = pkt.ETHERNET.NDP_MULTICAST.toRaw()
+      eth_type = pkt.ethernet.LLDP_TYPE
+    else:
+      eth = pkt.ETHERNET.ETHER_BROADCAST.toRaw()
+      eth_type = pkt.ethernet.BDDP_TYPE
+    data = b''.join((eth, EthAddr(port_addr).toRaw(), struct.pack("!H", eth_type),
+                     template[0], port_tlv, template[1]))
+
+    return b''.join((
+      struct.pack("!BBHLLHHHHHH", of.OFP_VERSION, of.OFPT_PACKET_OUT,
+                  8 + 8 + 8 + len(data), of.generate_xid(),
+                  0xffFFffFF, of.OFPP_NONE, 8, # buffer, in_port, actions_len
+                  of.OFPAT_OUTPUT, 8, port_num, 0),
+      data))
+
+  def _forget_probe (self, template, port_num):
+    port_tlv = self._port_tlvs.get(port_num)
+    if port_tlv is not None:
+      self._probe_origins.pop(template[0] + port_tlv, None)
+
+  def probe_origin (self, frame):
+    """
+    Returns the (dpid, port) that one of our probes was sent from
+
+    frame is the raw Ethernet frame.  Rather than parsing the LLDP, this
+    just pulls out its chassis and port TLVs (using their lengths) and
+    looks them up.  Returns None if it's not one of ours.
     """
-    if len(self._this_cycle) == 0:
-      self._this_cycle = self._next_cycle
-      self._next_cycle = []
-      shuffle(self._this_cycle)
-    item = self._this_cycle.pop(0)
-    self._next_cycle.append(item)
-    core.openflow.sendToDPID(item.dpid, item.packet)
+    try:
+      # Chassis ID TLV with the local subtype, and then a port ID TLV
+      if frame[14] != b'\x02' or frame[16] != b'\x07': return None
+      end = 16 + ord(frame[15])
+      if frame[end] != b'\x04': return None
+      end += 2 + ord(frame[end + 1])
+    except IndexError:
+      return None
+    return self._probe_origins.get(frame[14:end])
+
+  def create_discovery_packet (self, dpid, port_num, port_addr, discType,
+                               raw = False):
+    """
+    Create LLDP packet
 
-  def create_discovery_packet (self, dpid, port_num, port_addr, discType):
-    """ Create LLDP packet """
+    If raw is True, just returns the lldp part.
+    """
 
     chassis_id = pkt.chassis_id(subtype=pkt.chassis_id.SUB_LOCAL)
     chassis_id.id = bytes('dpid:' + hex(long(dpid))[2:-1])
@@ -163,6 +310,7 @@ class LLDPSender (object):
     discovery_packet.tlvs.append(ttl)
     discovery_packet.tlvs.append(sysdesc)
     discovery_packet.tlvs.append(pkt.end_tlv())
+    if raw: return discovery_packet
 
     eth = pkt.ethernet()
     eth.src = port_addr
@@ -179,6 +327,16 @@ class LLDPSender (object):
     return po.pack()
 
 
+# Raw ethertypes and destinations of LLDP (and BDDP) packets
+_lldp_types = (struct.pack("!H", pkt.ethernet.LLDP_TYPE),
+               struct.pack("!H", pkt.ethernet.BDDP_TYPE))
+_lldp_dsts = (pkt.ETHERNET.NDP_MULTICAST.toRaw(),
+              pkt.ETHERNET.ETHER_BROADCAST.toRaw())
+
+# Raw ethertypes which might have LLDP inside (LLC ones are < 0x600)
+_maybe_lldp_types = (struct.pack("!H", pkt.ethernet.VLAN_TYPE),)
+
+
 class LinkEvent (Event):
   """
   Link up/down event
@@ -207,6 +365,7 @@ class Discovery (EventMixin):
   _flow_priority = 65000     # Priority of LLDP-catching flow (if any)
   _link_timeout = 10         # How long until we consider a link dead
   _timeout_check_period = 5  # How often to check for timeouts
+  _send_tick = 0.1           # Shortest time between LLDP sends
 
   _eventMixin_events = set([
     LinkEvent,
@@ -224,19 +383,37 @@ class Discovery (EventMixin):
     if link_timeout: self._link_timeout = link_timeout
 
     self.adjacency = {} # From Link to time.time() stamp
-    self._sender = LLDPSender(self.send_cycle_time)
+    self._links_by_port = {} # (dpid, port) -> set of Links using it
+    self._links_by_dpid = {} # dpid -> set of Links touching that switch
+
+    # Heap of (time, Link) saying when to look at a link to see if it has
+    # timed out, and the time each link is currently due to be looked at
+    # (anything else on the heap for it is stale).  Refreshing a link
+    # just updates its adjacency timestamp; if it's been refreshed when
+    # its time comes, it gets pushed back to its new deadline.
+    self._link_checks = []
+    self._link_check_time = {}
+
+    # When the links started changing and when they last changed, and
+    # how long it took them to settle last time (see get_stats())
+    self._converge_start = None
+    self._last_change = None
+    self._convergence_time = None
+
+    self._sender = LLDPSender(self.send_cycle_time, tick = self._send_tick)
 
     # Listen with a high priority (mostly so we get PacketIns early)
     core.listen_to_dependencies(self,
         listen_args={'openflow':{'priority':0xffffffff}})
 
-    Timer(self._timeout_check_period, self._expire_links, recurring=True)
+    WheelTimer(self._timeout_check_period, self._expire_links, recurring=True)
 
   @property
   def send_cycle_time (self):
     return self._link_timeout / 2.0
 
   def _handle_openflow_ConnectionUp (self, event):
+    self._note_change()
     if self._install_flow:
       # Make sure we get appropriate traffic
       log.debug("Installing flow for %s", dpid_to_str(event.dpid))
@@ -250,18 +427,54 @@ class Discovery (EventMixin):
 
   def _handle_openflow_ConnectionDown (self, event):
     # Delete all links on this switch
-    self._delete_links([link for link in self.adjacency
-                        if link.dpid1 == event.dpid
-                        or link.dpid2 == event.dpid])
+    self._delete_links(list(self._links_by_dpid.get(event.dpid, ())))
+
+  def _schedule_link_check (self, link, when):
+    self._link_check_time[link] = when
+    heapq.heappush(self._link_checks, (when, link))
+
+  def _note_change (self):
+    now = time.time()
+    if self._converge_start is None: self._converge_start = now
+    self._last_change = now
+
+  def get_stats (self):
+    """
+    Returns a dict of statistics
+
+    The links are considered to have converged once they've gone a link
+    timeout without changing.  convergence_time is how long they took to
+    settle the last time they did, counting from the first switch
+    connection or link change until the last link change.  sender has
+    the LLDPSender's stats.
+    """
+    return dict(links = len(self.adjacency),
+                converged = self._converge_start is None,
+                convergence_time = self._convergence_time,
+                sender = self._sender.get_stats())
 
-  def _expire_links (self):
+  def _expire_links (self, now = None):
     """
     Remove apparently dead links
     """
-    now = time.time()
+    if now is None: now = time.time()
+
+    if (self._converge_start is not None
+        and now - self._last_change > self._link_timeout):
+      self._convergence_time = self._last_change - self._converge_start
+      self._converge_start = None
+
+    expired = []
+    checks = self._link_checks
+    while checks and checks[0][0] < now:
+      when, link = heapq.heappop(checks)
+      if self._link_check_time.get(link) != when: continue
+      deadline = self.adjacency[link] + self._link_timeout
+      if deadline < now:
+        expired.append(link)
+      else:
+        self._schedule_link_check(link, deadline)
 
-    expired = [link for link,timestamp in self.adjacency.iteritems()
-               if timestamp + self._link_timeout < now]
     if expired:
       for link in expired:
         log.info('link timeout: %s.%i -> %s.%i' %
@@ -274,17 +487,22 @@ class Discovery (EventMixin):
     """
     Receive and process LLDP packets
     """
-
-    packet = event.parsed
-
-    if ((packet.effective_ethertype != pkt.ethernet.LLDP_TYPE and packet.effective_ethertype != pkt.ethernet.BDDP_TYPE)
-        or (packet.dst != pkt.ETHERNET.NDP_MULTICAST and packet.dst != pkt.ETHERNET.ETHER_BROADCAST)):
-      if not self._eat_early_packets: return
-      if not event.connection.connect_time: return
-      enable_time = time.time() - self.send_cycle_time - 1
-      if event.connection.connect_time > enable_time:
-        return EventHalt
-      return
+    data = event.data
+    eth_type = data[12:14]
+    origin = None
+    if eth_type in _lldp_types:
+      if data[:6] not in _lldp_dsts: return self._not_lldp(event)
+      # Our own probes are recognized without parsing them
+      origin = self._sender.probe_origin(data)
+    elif eth_type not in _maybe_lldp_types and eth_type >= b'\x06\x00':
+      return self._not_lldp(event)
+
+    if origin is None:
+      packet = event.parsed
+
+      if ((packet.effective_ethertype != pkt.ethernet.LLDP_TYPE and packet.effective_ethertype != pkt.ethernet.BDDP_TYPE)
+          or (packet.dst != pkt.ETHERNET.NDP_MULTICAST and packet.dst != pkt.ETHERNET.ETHER_BROADCAST)):
+        return self._not_lldp(event)
 
     if self._explicit_drop:
       if event.ofp.buffer_id is not None:
@@ -294,22 +512,63 @@ class Discovery (EventMixin):
         msg.in_port = event.port
         event.connection.send(msg)
 
+    if origin is None:
+      origin = self._parse_lldp(packet)
+      if origin is None: return EventHalt
+    originatorDPID, originatorPort = origin
+
+    if originatorDPID not in core.openflow.connections:
+      log.info('Received LLDP packet from unknown switch')
+      return EventHalt
+
+    if (event.dpid, event.port) == (originatorDPID, originatorPort):
+      log.warning("Port received its own LLDP packet; ignoring")
+      return EventHalt
+
+    link = Discovery.Link(originatorDPID, originatorPort, event.dpid,
+                          event.port)
+
+    if link not in self.adjacency:
+      self._add_link(link)
+    else:
+      # Just update timestamp
+      self.adjacency[link] = time.time()
+
+    return EventHalt # Probably nobody else needs this event
+
+  def _not_lldp (self, event):
+    """
+    Handles PacketIns which aren't LLDP
+    """
+    if not self._eat_early_packets: return
+    if not event.connection.connect_time: return
+    enable_time = time.time() - self.send_cycle_time - 1
+    if event.connection.connect_time > enable_time:
+      return EventHalt
+
+  def _parse_lldp (self, packet):
+    """
+    Finds the originating (dpid, port) in an LLDP packet the slow way
+
+    This handles foreign LLDP and anything else that the sender doesn't
+    recognize as one of its probes.  Returns None if it can't find them.
+    """
     lldph = packet.find(pkt.lldp)
     if lldph is None or not lldph.parsed:
       log.error("LLDP packet could not be parsed")
-      return EventHalt
+      return None
     if len(lldph.tlvs) < 3:
       log.error("LLDP packet without required three TLVs")
-      return EventHalt
+      return None
     if lldph.tlvs[0].tlv_type != pkt.lldp.CHASSIS_ID_TLV:
       log.error("LLDP packet TLV 1 not CHASSIS_ID")
-      return EventHalt
+      return None
     if lldph.tlvs[1].tlv_type != pkt.lldp.PORT_ID_TLV:
       log.error("LLDP packet TLV 2 not PORT_ID")
-      return EventHalt
+      return None
     if lldph.tlvs[2].tlv_type != pkt.lldp.TTL_TLV:
       log.error("LLDP packet TLV 3 not TTL")
-      return EventHalt
+      return None
 
     def lookInSysDesc ():
       r = None
@@ -355,16 +614,12 @@ class Discovery (EventMixin):
 
     if originatorDPID == None:
       log.warning("Couldn't find a DPID in the LLDP packet")
-      return EventHalt
-
-    if originatorDPID not in core.openflow.connections:
-      log.info('Received LLDP packet from unknown switch')
-      return EventHalt
+      return None
 
     # Get port number from port TLV
     if lldph.tlvs[1].subtype != pkt.port_id.SUB_PORT:
       log.warning("Thought we found a DPID, but packet didn't have a port")
-      return EventHalt
+      return None
     originatorPort = None
     if lldph.tlvs[1].id.isdigit():
       # We expect it to be a decimal value
@@ -378,42 +633,52 @@ class Discovery (EventMixin):
     if originatorPort is None:
       log.warning("Thought we found a DPID, but port number didn't " +
                   "make sense")
-      return EventHalt
+      return None
 
-    if (event.dpid, event.port) == (originatorDPID, originatorPort):
-      log.warning("Port received its own LLDP packet; ignoring")
-      return EventHalt
-
-    link = Discovery.Link(originatorDPID, originatorPort, event.dpid,
-                          event.port)
+    return originatorDPID, originatorPort
 
-    if link not in self.adjacency:
-      self.adjacency[link] = time.time()
-      log.info('link detected: %s.%i -> %s.%i' %
-               (dpid_to_str(link.dpid1), link.port1,
-                dpid_to_str(link.dpid2), link.port2))
-      self.raiseEventNoErrors(LinkEvent, True, link)
-    else:
-      # Just update timestamp
-      self.adjacency[link] = time.time()
-
-    return EventHalt # Probably nobody else needs this event
+  def _add_link (self, link):
+    now = time.time()
+    self.adjacency[link] = now
+    for key in ((link.dpid1, link.port1), (link.dpid2, link.port2)):
+      self._links_by_port.setdefault(key, set()).add(link)
+    for dpid in (link.dpid1, link.dpid2):
+      self._links_by_dpid.setdefault(dpid, set()).add(link)
+    self._schedule_link_check(link, now + self._link_timeout)
+    self._note_change()
+    log.info('link detected: %s.%i -> %s.%i' %
+             (dpid_to_str(link.dpid1), link.port1,
+              dpid_to_str(link.dpid2), link.port2))
+    self.raiseEventNoErrors(LinkEvent, True, link)
 
   def _delete_links (self, links):
     for link in links:
       del self.adjacency[link]
+      del self._link_check_time[link]
+      for index, key in ((self._links_by_port, (link.dpid1, link.port1)),
+                         (self._links_by_port, (link.dpid2, link.port2)),
+                         (self._links_by_dpid, link.dpid1),
+                         (self._links_by_dpid, link.dpid2)):
+        links_for_key = index.get(key)
+        if links_for_key is None: continue
+        links_for_key.discard(link)
+        if not links_for_key: del index[key]
+      self._note_change()
       self.raiseEventNoErrors(LinkEvent, False, link)
 
   def is_edge_port (self, dpid, port):
     """
     Return True if given port does not connect to another switch
     """
-    for link in self.adjacency:
-      if link.dpid1 == dpid and link.port1 == port:
-        return False
-      if link.dpid2 == dpid and link.port2 == port:
-        return False
-    return True
+    return (dpid, port) not in self._links_by_port
+
+  def get_links (self, dpid, port = None):
+    """
+    Returns the set of links touching a switch, or one port on it
+    """
+    if port is None:
+      return set(self._links_by_dpid.get(dpid, ()))
+    return set(self._links_by_port.get((dpid, port), ()))
 
 
 def launch (no_flow = False, explicit_drop = True, link_timeout = None,
@@ -21,8 +21,12 @@ Implementation of an OpenFlow flow table
 
 from libopenflow_01 import *
 from pox.lib.revent import *
+from pox.lib.addresses import EthAddr, IPAddr
+from pox.lib.packet import vlan, ipv4, udp, tcp, icmp, arp
 
 import time
+from heapq import heappush, heappop, heapify
+from operator import itemgetter
 
 # FlowTable Entries:
 #   match - ofp_match (13-tuple)
@@ -102,6 +106,27 @@ class TableEntry (object):
        return "priority=%s, cookie=%x, idle_timeoout=%d, hard_timeout=%d, match=%s, actions=%s buffer_id=%s" % (
           self.priority, self.cookie, self.idle_timeout, self.hard_timeout, self.match, repr(self.actions), str(self.buffer_id))
 
+  def expiry_time(self):
+    """ return the time after which this entry is expired, or None if it has no timeouts """
+    t = None
+    if self.hard_timeout > 0:
+      t = self.counters["created"] + self.hard_timeout
+    if self.idle_timeout > 0:
+      idle = self.counters["last_touched"] + self.idle_timeout
+      if t is None or idle < t: t = idle
+    return t
+
+  def to_flow_removed(self, reason, now=None, **kw):
+    if now == None: now = time.time()
+    duration = now - self.counters["created"]
+    return ofp_flow_removed(match = self.match, cookie = self.cookie,
+        priority = self.priority, reason = reason,
+        duration_sec = int(duration),
+        duration_nsec = int((duration - int(duration)) * 1e9),
+        idle_timeout = self.idle_timeout,
+        packet_count = self.counters["packets"],
+        byte_count = self.counters["bytes"], **kw)
+
   def flow_stats(self, now=None):
     if now == None: now = time.time()
     duration = now - self.counters["created"]
@@ -120,10 +145,159 @@ class TableEntry (object):
 
 
 class FlowTableModification (Event):
-  def __init__(self, added=[], removed=[]):
+  """
+  Entries were added to or removed from a FlowTable
+
+  Changes are reported in batches.  reason is the OFPRR_* reason the
+  removed entries went away for (entries removed for different reasons
+  are reported in separate events), or None when they weren't removed
+  in a way that should be reported to a controller (e.g., they were
+  replaced by an add).
+  """
+  def __init__(self, added=[], removed=[], reason=None):
     Event.__init__(self)
     self.added = added
     self.removed = removed
+    self.reason = reason
+
+
+# Priority used to order exact-match entries ahead of all wildcarded ones
+EXACT_MATCH_PRIORITY = (1<<16) + 1
+
+def _effective_priority(entry):
+  return entry.priority if entry.match.is_wildcarded else EXACT_MATCH_PRIORITY
+
+def _ip_value(addr):
+  if type(addr) is int or type(addr) is long:
+    return addr & 0xffFFffFF
+  return IPAddr(addr).toUnsigned()
+
+# The match fields in wire order, as they appear in match_key() values
+_match_fields = [(name, ofp_match_data[name]) for name in
+    ('in_port', 'dl_src', 'dl_dst', 'dl_vlan', 'dl_vlan_pcp', 'dl_type',
+     'nw_tos', 'nw_proto', 'nw_src', 'nw_dst', 'tp_src', 'tp_dst')]
+
+def match_key(match):
+  """
+  Returns a hashable, immutable key for an ofp_match
+
+  The key is (wildcards, values), where values holds the twelve match
+  fields in wire order.  Wildcarded fields are None, Ethernet addresses
+  are raw bytes and IP addresses are integers.  Two matches are equal
+  exactly when their keys are.
+  """
+  v = list(match._values())
+  for i in (1, 2):
+    if v[i] is not None:
+      v[i] = v[i].toRaw() if type(v[i]) is EthAddr else EthAddr(v[i]).toRaw()
+  for i in (8, 9):
+    if v[i] is not None:
+      v[i] = _ip_value(v[i])
+  return (match.wildcards, tuple(v))
+
+def packet_key(packet, in_port):
+  """
+  Returns the header values of a packet as a hashable tuple
+
+  This is the same as the values of match_key(ofp_match.from_packet(
+  packet, in_port)), but without building the match.
+  """
+  dl_vlan = OFP_VLAN_NONE
+  dl_vlan_pcp = 0
+  nw_tos = nw_proto = nw_src = nw_dst = tp_src = tp_dst = None
+  dl_type = packet.type
+  p = packet.next
+  if type(p) is vlan:
+    dl_type = p.eth_type
+    dl_vlan = p.id
+    dl_vlan_pcp = p.pcp
+    p = p.next
+  t = type(p)
+  if t is ipv4:
+    nw_src = p.srcip.toUnsigned()
+    nw_dst = p.dstip.toUnsigned()
+    nw_proto = p.protocol
+    nw_tos = p.tos
+    p = p.next
+    t = type(p)
+    if t is udp or t is tcp:
+      tp_src = p.srcport
+      tp_dst = p.dstport
+    elif t is icmp:
+      tp_src = p.type
+      tp_dst = p.code
+  elif t is arp:
+    if p.opcode <= 255:
+      nw_proto = p.opcode
+      nw_src = p.protosrc.toUnsigned()
+      nw_dst = p.protodst.toUnsigned()
+  return (in_port, packet.src.toRaw(), packet.dst.toRaw(), dl_vlan,
+          dl_vlan_pcp, dl_type, nw_tos, nw_proto, nw_src, nw_dst,
+          tp_src, tp_dst)
+
+
+class _WildcardGroup (object):
+  """
+  All entries of a FlowTable with the same wildcards
+
+  Entries are kept in a dict keyed on the values of the fields the
+  wildcards leave specified, so finding the ones that match a packet is
+  a single lookup.  This is the "tuple" of tuple space search.
+  """
+  def __init__(self, wildcards):
+    self.wildcards = wildcards
+    self.max_priority = -1 # Upper bound; may be stale after removals
+    self.entries = {} # key -> [(rank, entry)] sorted by descending rank
+
+    fields = []
+    for i,(name,(default,bits)) in enumerate(_match_fields):
+      if name == 'nw_src' or name == 'nw_dst':
+        shift = OFPFW_NW_SRC_SHIFT if name == 'nw_src' else OFPFW_NW_DST_SHIFT
+        w = (wildcards >> shift) & 0x3f
+        if w >= 32: continue
+        fields.append((i, (0xffFFffFF << w) & 0xffFFffFF))
+      elif not (wildcards & bits):
+        fields.append((i, None))
+
+    if not fields:
+      self.key = lambda values: ()
+    elif all(mask is None or mask == 0xffFFffFF for i,mask in fields):
+      self.key = itemgetter(*[i for i,mask in fields])
+    else:
+      def key(values):
+        return tuple(values[i] if mask is None or values[i] is None
+                     else values[i] & mask for i,mask in fields)
+      self.key = key
+
+  def __len__(self):
+    return len(self.entries)
+
+  def add(self, key, rank, entry):
+    l = self.entries.get(key)
+    if l is None:
+      self.entries[key] = [(rank, entry)]
+    else:
+      l.append((rank, entry))
+      l.sort(key=itemgetter(0), reverse=True)
+    if rank[0] > self.max_priority:
+      self.max_priority = rank[0]
+
+  def remove(self, key, entry):
+    l = self.entries[key]
+    for i,(rank,e) in enumerate(l):
+      if e is entry:
+        del l[i]
+        break
+    if not l:
+      del self.entries[key]
+
+  def lookup(self, values):
+    """
+    Returns (rank, entry) of the best entry matching values, or None
+    """
+    l = self.entries.get(self.key(values))
+    if l is None: return None
+    return l[0]
 
 
 class FlowTable (EventMixin):
@@ -132,41 +306,123 @@ class FlowTable (EventMixin):
   """
   General model of a flow table. Maintains an ordered list of flow entries, and finds
   matching entries for packets and other entries. Supports expiration of flows.
+
+  Lookups go through a classifier: entries are grouped by their wildcards
+  and hashed on their specified fields within each group (tuple space
+  search), with an additional index on (match, priority) for strict
+  matches.  Entry matches must not be modified while in the table.
   """
   def __init__(self):
     EventMixin.__init__(self)
-    # For now we represent the table as a multidimensional array.
-    #
-    # [ (cookie, match, counters, actions),
-    #   (cookie, match, counters, actions),
-    #    ...                        ]
-    #
-    # Implies O(N) lookup for now. TODO: fix
-    self._table = []
+    self._groups = {} # wildcards -> _WildcardGroup
+    self._group_order = None # groups by descending max_priority
+    self._strict = {} # (match_key, priority) -> [entry]
+    self._records = {} # entry -> (group, group key, strict key, rank)
+    self._seq = 0
+    self._entries = None # Cached list of entries in lookup order
+
+    # Heap of (expiry time, seq, entry) for entries with timeouts.  Items
+    # for removed entries are skipped when they come up, and idle entries
+    # that have been touched are pushed back with their new expiry time,
+    # so expiring flows costs O(log N) per expired (or touched) entry.
+    # Items for removed entries are counted, and the heap is rebuilt from
+    # the table when they start to outnumber the live ones.
+    self._expiry = []
+    self._expiry_stale = 0
 
   @property
   def entries(self):
-    return self._table
+    """
+    All entries in lookup order: descending priority, with exact matches
+    first, and in order of insertion within a priority.
+    """
+    if self._entries is None:
+      records = self._records
+      self._entries = sorted(records, key=lambda e: records[e][3],
+                             reverse=True)
+    return self._entries
+
+  _table = entries # For backwards compatibility
 
   def __len__(self):
-    return len(self._table)
+    return len(self._records)
+
+  def _index(self, entry):
+    prio = _effective_priority(entry)
+    self._seq += 1
+    rank = (prio, -self._seq)
+
+    mkey = match_key(entry.match)
+    wildcards,values = mkey
+    group = self._groups.get(wildcards)
+    if group is None:
+      group = _WildcardGroup(wildcards)
+      self._groups[wildcards] = group
+      self._group_order = None
+    old_max = group.max_priority
+    gkey = group.key(values)
+    group.add(gkey, rank, entry)
+    if group.max_priority != old_max:
+      self._group_order = None
+
+    skey = (mkey, entry.priority)
+    self._strict.setdefault(skey, []).append(entry)
+    self._records[entry] = (group, gkey, skey, rank)
+    self._entries = None
+
+    expires = entry.expiry_time()
+    if expires is not None:
+      heappush(self._expiry, (expires, self._seq, entry))
+
+  def _unindex(self, entry, queued=True):
+    """ queued is whether its expiry heap item (if any) is still there """
+    group,gkey,skey,rank = self._records.pop(entry)
+    group.remove(gkey, entry)
+    if not group:
+      del self._groups[group.wildcards]
+      self._group_order = None
+    l = self._strict[skey]
+    l.remove(entry)
+    if not l:
+      del self._strict[skey]
+    self._entries = None
+
+    if queued and entry.expiry_time() is not None:
+      # Its item in the expiry heap is stale now
+      self._expiry_stale += 1
+      if self._expiry_stale > len(self._records):
+        self._compact_expiry()
+
+  def _compact_expiry(self):
+    """ rebuild the expiry heap from the entries still in the table """
+    heap = self._expiry
+    # In place, since the expiry methods hold on to it while unindexing
+    heap[:] = [(expires, -rank[1], entry)
+               for entry,(group,gkey,skey,rank) in self._records.iteritems()
+               for expires in (entry.expiry_time(),) if expires is not None]
+    heapify(heap)
+    self._expiry_stale = 0
+
+  def _is_current(self, seq, entry):
+    """ whether an expiry heap item is for an entry still in the table """
+    r = self._records.get(entry)
+    return r is not None and r[3][1] == -seq
 
   def add_entry(self, entry):
     if not isinstance(entry, TableEntry):
       raise "Not an Entry type"
-    self._table.append(entry)
-
-    # keep table sorted by descending priority, with exact matches always going first
-    # note: python sort is stable
-    self._table.sort(key=lambda(e): (e.priority if e.match.is_wildcarded else (1<<16) + 1), reverse=True)
+    self._index(entry)
 
     self.raiseEvent(FlowTableModification(added=[entry]))
 
   def remove_entry(self, entry):
     if not isinstance(entry, TableEntry):
       raise "Not an Entry type"
-    self._table.remove(entry)
-    self.raiseEvent(FlowTableModification(removed=[entry]))
+    if entry not in self._records:
+      raise ValueError("entry not in table")
+    self._unindex(entry)
+    self.raiseEvent(FlowTableModification(removed=[entry],
+                                          reason=OFPRR_DELETE))
 
   def entries_for_port(self, port_no):
     entries = []
@@ -181,38 +437,124 @@ class FlowTable (EventMixin):
     return entries
 
   def matching_entries(self, match, priority=0, strict=False, out_port=None):
-    return [ entry for entry in self._table if entry.is_matched_by(match, priority, strict, out_port) ]
+    if strict:
+      candidates = self._strict.get((match_key(match), priority))
+      if not candidates: return []
+      if len(candidates) > 1:
+        candidates = sorted(candidates, key=lambda e: self._records[e][3],
+                            reverse=True)
+    else:
+      # Only entries at least as specific as match can be matched by it
+      bits = match.wildcards & ~(OFPFW_NW_SRC_MASK|OFPFW_NW_DST_MASK)
+      src = min(32, (match.wildcards & OFPFW_NW_SRC_MASK) >> OFPFW_NW_SRC_SHIFT)
+      dst = min(32, (match.wildcards & OFPFW_NW_DST_MASK) >> OFPFW_NW_DST_SHIFT)
+      groups = []
+      for w,group in self._groups.iteritems():
+        if (w & ~(OFPFW_NW_SRC_MASK|OFPFW_NW_DST_MASK)) | bits != bits:
+          continue
+        if min(32, (w & OFPFW_NW_SRC_MASK) >> OFPFW_NW_SRC_SHIFT) > src:
+          continue
+        if min(32, (w & OFPFW_NW_DST_MASK) >> OFPFW_NW_DST_SHIFT) > dst:
+          continue
+        groups.append(group)
+      if len(groups) == len(self._groups):
+        candidates = self.entries
+      else:
+        candidates = [(rank,e) for g in groups
+                      for l in g.entries.itervalues() for rank,e in l]
+        candidates.sort(reverse=True)
+        candidates = [e for rank,e in candidates]
+    return [ entry for entry in candidates if entry.is_matched_by(match, priority, strict, out_port) ]
 
   def flow_stats(self, match, out_port=None, now=None):
     return ( e.flow_stats() for e in self.matching_entries(match=match, strict=False, out_port=out_port))
 
+  def next_expiry(self):
+    """ return the earliest time at which an entry may expire, or None """
+    heap = self._expiry
+    while heap and not self._is_current(heap[0][1], heap[0][2]):
+      heappop(heap)
+      self._expiry_stale -= 1
+    return heap[0][0] if heap else None
+
   def expired_entries(self, now=None):
-    return [ entry for entry in self._table if entry.is_expired(now) ]
+    if now is None: now = time.time()
+    # Only the part of the heap holding times before now needs visiting
+    heap = self._expiry
+    expired = []
+    todo = [0] if heap else []
+    while todo:
+      i = todo.pop()
+      expires,seq,entry = heap[i]
+      if expires >= now: continue
+      if self._is_current(seq, entry) and entry.expiry_time() < now:
+        expired.append(entry)
+      todo.extend(c for c in (2*i+1, 2*i+2) if c < len(heap))
+    records = self._records
+    expired.sort(key=lambda e: records[e][3], reverse=True)
+    return expired
 
   def remove_expired_entries(self, now=None):
-    remove_flows = self.expired_entries(now)
-    for entry in remove_flows:
-        self._table.remove(entry)
-    self.raiseEvent(FlowTableModification(removed=remove_flows))
-    return remove_flows
-
-  def remove_matching_entries(self, match, priority=0, strict=False):
+    """ remove expired entries, raising a FlowTableModification for each
+    removal reason (idle or hard timeout) which had any """
+    if now is None: now = time.time()
+    heap = self._expiry
+    hard = []
+    idle = []
+    while heap and heap[0][0] < now:
+      expires,seq,entry = heappop(heap)
+      if not self._is_current(seq, entry):
+        self._expiry_stale -= 1
+        continue
+      expires = entry.expiry_time()
+      if expires >= now:
+        # Touched since it was scheduled
+        heappush(heap, (expires, seq, entry))
+        continue
+      rank = self._records[entry][3]
+      self._unindex(entry, queued=False)
+      if (entry.hard_timeout > 0 and
+          now - entry.counters["created"] > entry.hard_timeout):
+        hard.append((rank, entry))
+      else:
+        idle.append((rank, entry))
+    if hard:
+      self.raiseEvent(FlowTableModification(removed=[e for r,e in hard],
+                                            reason=OFPRR_HARD_TIMEOUT))
+    if idle:
+      self.raiseEvent(FlowTableModification(removed=[e for r,e in idle],
+                                            reason=OFPRR_IDLE_TIMEOUT))
+    remove_flows = hard + idle
+    remove_flows.sort(reverse=True)
+    return [e for r,e in remove_flows]
+
+  def remove_matching_entries(self, match, priority=0, strict=False,
+                              reason=OFPRR_DELETE):
     remove_flows = self.matching_entries(match, priority, strict)
     for entry in remove_flows:
-        self._table.remove(entry)
-    self.raiseEvent(FlowTableModification(removed=remove_flows))
+      self._unindex(entry)
+    self.raiseEvent(FlowTableModification(removed=remove_flows,
+                                          reason=reason))
     return remove_flows
 
   def entry_for_packet(self, packet, in_port):
     """ return the highest priority flow table entry that matches the given packet
     on the given in_port, or None if no matching entry is found. """
-    packet_match = ofp_match.from_packet(packet, in_port)
-
-    for entry in self._table:
-      if entry.match.matches_with_wildcards(packet_match, consider_other_wildcards=False):
-        return entry
-    else:
-      return None
+    return self.entry_for_key(packet_key(packet, in_port))
+
+  def entry_for_key(self, values):
+    """ like entry_for_packet(), but takes the packet's packet_key() """
+    if self._group_order is None:
+      self._group_order = sorted(self._groups.itervalues(),
+                                 key=lambda g: g.max_priority, reverse=True)
+    best = None
+    for group in self._group_order:
+      if best is not None and group.max_priority < best[0][0]:
+        break
+      hit = group.lookup(values)
+      if hit is not None and (best is None or hit[0] > best[0]):
+        best = hit
+    return best[1] if best is not None else None
 
 
 class SwitchFlowTable(FlowTable):
@@ -232,17 +574,17 @@ class SwitchFlowTable(FlowTable):
       raise NotImplementedError("flow_mod outport checking not implemented")
 
     if flow_mod.command == OFPFC_ADD:
-      # exactly matching entries have to be removed
-      self.remove_matching_entries(flow_mod.match,flow_mod.priority, strict=True)
+      # exactly matching entries have to be removed (and aren't reported
+      # to the controller as removed)
+      self.remove_matching_entries(flow_mod.match,flow_mod.priority, strict=True, reason=None)
       return ("added", self.add_entry(TableEntry.from_flow_mod(flow_mod)))
     elif flow_mod.command == OFPFC_MODIFY or flow_mod.command == OFPFC_MODIFY_STRICT:
       is_strict = (flow_mod.command == OFPFC_MODIFY_STRICT)
       modified = []
-      for entry in self._table:
+      for entry in self.matching_entries(flow_mod.match, priority=flow_mod.priority, strict=is_strict):
         # update the actions field in the matching flows
-        if(entry.is_matched_by(flow_mod.match, priority=flow_mod.priority, strict=is_strict)):
-          entry.actions = flow_mod.actions
-          modified.append(entry)
+        entry.actions = flow_mod.actions
+        modified.append(entry)
       if(len(modified) == 0):
         # if no matching entry is found, modify acts as add
         return ("added", self.add_entry(TableEntry.from_flow_mod(flow_mod)))
@@ -116,11 +116,11 @@ def _readzs (data, offset, length):
 
 def _readether (data, offset):
   (offset, d) = _read(data, offset, 6)
-  return (offset, EthAddr(d))
+  return (offset, EthAddr.from_raw(d))
 
-def _readip (data, offset, networkOrder = True):
+def _readip (data, offset):
   (offset, d) = _read(data, offset, 4)
-  return (offset, IPAddr(d, networkOrder = networkOrder))
+  return (offset, IPAddr.from_raw(d))
 
 # ----------------------------------------------------------------------
 
@@ -159,6 +159,7 @@ class ofp_base (object):
   attribute to your minimum length.
   """
   __metaclass__ = _ofp_meta
+  __slots__ = ()
 
   def _assert (self):
     r = self._validate()
@@ -889,7 +890,25 @@ class ofp_queue_prop_min_rate (ofp_base):
 
 ##2.3 Flow Match Structures
 class ofp_match (ofp_base):
+  """
+  An OpenFlow 1.0 match
+
+  Field values live in underscore-prefixed slots.  The public attributes
+  (in_port, dl_src, ...) are properties installed after ofp_match_data
+  is defined; they read as None when the field is wildcarded and update
+  the wildcards when set.  Other attributes can still be hung on a match;
+  they go in its __dict__, which is only created if that happens.
+  """
+  __slots__ = ('wildcards', '_in_port', '_dl_src', '_dl_dst', '_dl_vlan',
+               '_dl_vlan_pcp', '_dl_type', '_nw_tos', '_nw_proto',
+               '_nw_src', '_nw_dst', '_tp_src', '_tp_dst', '_lazy_addrs',
+               '__dict__')
+  _field_slots = __slots__[:-2] # What makes up the state of a match
+
   adjust_wildcards = True # Set to true to "fix" outgoing wildcards
+  lazy_unpack = True # Decode addresses on first access when unpacking
+  _unpack_struct = struct.Struct("!LH6s6sHBxHBBxx4s4sHH")
+  _pack_struct = struct.Struct("!LH6s6sHBxHBBxxLLHH")
 
   @classmethod
   def from_packet (cls, packet, in_port = None):
@@ -906,43 +925,55 @@ class ofp_match (ofp_base):
       packet = ethernet(packet.data)
     assert assert_type("packet", packet, ethernet, none_ok=False)
 
+    # This is what setting each field through its property would do, but
+    # it's done directly since it's called for nearly every packet_in.
     match = cls()
+    wc = match.wildcards
 
     if in_port is not None:
-      match.in_port = in_port
-
-    match.dl_src = packet.src
-    match.dl_dst = packet.dst
-    match.dl_type = packet.type
+      match._in_port = in_port
+      wc &= ~OFPFW_IN_PORT
+
+    match._dl_src = packet.src
+    match._dl_dst = packet.dst
+    match._dl_type = packet.type
+    wc &= ~(OFPFW_DL_SRC | OFPFW_DL_DST | OFPFW_DL_TYPE
+            | OFPFW_DL_VLAN | OFPFW_DL_VLAN_PCP)
     p = packet.next
     if isinstance(p, vlan):
-      match.dl_type = p.eth_type
-      match.dl_vlan = p.id
-      match.dl_vlan_pcp = p.pcp
+      match._dl_type = p.eth_type
+      match._dl_vlan = p.id
+      match._dl_vlan_pcp = p.pcp
       p = p.next
     else:
-      match.dl_vlan = OFP_VLAN_NONE
-      match.dl_vlan_pcp = 0
+      match._dl_vlan = OFP_VLAN_NONE
+      match._dl_vlan_pcp = 0
 
     if isinstance(p, ipv4):
-      match.nw_src = p.srcip
-      match.nw_dst = p.dstip
-      match.nw_proto = p.protocol
-      match.nw_tos = p.tos
+      match._nw_src = p.srcip
+      match._nw_dst = p.dstip
+      match._nw_proto = p.protocol
+      match._nw_tos = p.tos
+      wc &= ~(OFPFW_NW_SRC_MASK | OFPFW_NW_DST_MASK
+              | OFPFW_NW_PROTO | OFPFW_NW_TOS)
       p = p.next
 
       if isinstance(p, udp) or isinstance(p, tcp):
-        match.tp_src = p.srcport
-        match.tp_dst = p.dstport
+        match._tp_src = p.srcport
+        match._tp_dst = p.dstport
+        wc &= ~(OFPFW_TP_SRC | OFPFW_TP_DST)
       elif isinstance(p, icmp):
-        match.tp_src = p.type
-        match.tp_dst = p.code
+        match._tp_src = p.type
+        match._tp_dst = p.code
+        wc &= ~(OFPFW_TP_SRC | OFPFW_TP_DST)
     elif isinstance(p, arp):
       if p.opcode <= 255:
-        match.nw_proto = p.opcode
-        match.nw_src = p.protosrc
-        match.nw_dst = p.protodst
+        match._nw_proto = p.opcode
+        match._nw_src = p.protosrc
+        match._nw_dst = p.protodst
+        wc &= ~(OFPFW_NW_SRC_MASK | OFPFW_NW_DST_MASK | OFPFW_NW_PROTO)
 
+    match.wildcards = wc
     return match
 
   def optimize (self):
@@ -977,10 +1008,22 @@ class ofp_match (ofp_base):
     return self # for chaining
 
   def clone (self):
-    n = ofp_match()
-    for k,v in ofp_match_data.iteritems():
-      setattr(n, '_' + k, getattr(self, '_' + k))
+    if self._lazy_addrs is not None: self._decode_addrs()
+    n = ofp_match.__new__(ofp_match)
     n.wildcards = self.wildcards
+    n._in_port = self._in_port
+    n._dl_src = self._dl_src
+    n._dl_dst = self._dl_dst
+    n._dl_vlan = self._dl_vlan
+    n._dl_vlan_pcp = self._dl_vlan_pcp
+    n._dl_type = self._dl_type
+    n._nw_tos = self._nw_tos
+    n._nw_proto = self._nw_proto
+    n._nw_src = self._nw_src
+    n._nw_dst = self._nw_dst
+    n._tp_src = self._tp_src
+    n._tp_dst = self._tp_dst
+    n._lazy_addrs = None
     return n
 
   def flip (self):
@@ -994,15 +1037,26 @@ class ofp_match (ofp_base):
     return reversed
 
   def __init__ (self, **kw):
-    for k,v in ofp_match_data.iteritems():
-      setattr(self, '_' + k, v[0])
-
-    self.wildcards = self._normalize_wildcards(OFPFW_ALL)
+    self._in_port = 0
+    self._dl_src = EMPTY_ETH
+    self._dl_dst = EMPTY_ETH
+    self._dl_vlan = 0
+    self._dl_vlan_pcp = 0
+    self._dl_type = 0
+    self._nw_tos = 0
+    self._nw_proto = 0
+    self._nw_src = 0
+    self._nw_dst = 0
+    self._tp_src = 0
+    self._tp_dst = 0
+    self._lazy_addrs = None
+
+    self.wildcards = _match_all_wildcards
 
     # This is basically initHelper(), but tweaked slightly since this
     # class does some magic of its own.
     for k,v in kw.iteritems():
-      if not hasattr(self, '_'+k):
+      if k not in ofp_match_data:
         raise TypeError(self.__class__.__name__ + " constructor got "
           + "unexpected keyword argument '" + k + "'")
       setattr(self, k, v)
@@ -1072,35 +1126,24 @@ class ofp_match (ofp_base):
 
     return (ip, b)
 
-  def __setattr__ (self, name, value):
-    if name not in ofp_match_data:
-      self.__dict__[name] = value
-      return
+  def __getstate__ (self):
+    if self._lazy_addrs is not None: self._decode_addrs()
+    return (tuple(getattr(self, k) for k in self._field_slots),
+            self.__dict__ or None)
 
-    if name == 'nw_dst' or name == 'nw_src':
-      # Special handling
-      getattr(self, 'set_' + name)(value)
-      return value
-
-    if value is None:
-      setattr(self, '_' + name, ofp_match_data[name][0])
-      self.wildcards |= ofp_match_data[name][1]
-    else:
-      setattr(self, '_' + name, value)
-      self.wildcards = self.wildcards & ~ofp_match_data[name][1]
-
-    return value
+  def __setstate__ (self, state):
+    fields,extra = state
+    for k,v in zip(self._field_slots, fields):
+      setattr(self, k, v)
+    self._lazy_addrs = None
+    if extra: self.__dict__.update(extra)
 
   def __getattr__ (self, name):
-    if name in ofp_match_data:
-      if ( (self.wildcards & ofp_match_data[name][1])
-           == ofp_match_data[name][1] ):
-        # It's wildcarded -- always return None
-        return None
-      if name == 'nw_dst' or name == 'nw_src':
-        # Special handling
-        return getattr(self, 'get_' + name)()[0]
-      return self.__dict__['_' + name]
+    # Only reached for attributes which aren't set, which includes the
+    # address slots left empty by a lazy unpack().
+    if name in _match_addr_fields and self._lazy_addrs is not None:
+      self._decode_addrs()
+      return getattr(self, name)
     raise AttributeError("attribute not found: "+name)
 
   def _validate (self):
@@ -1110,50 +1153,36 @@ class ofp_match (ofp_base):
   def pack (self, flow_mod=False):
     assert self._assert()
 
-    packed = b""
     if self.adjust_wildcards and flow_mod:
       wc = self._wire_wildcards(self.wildcards)
     else:
       wc = self.wildcards
-    packed += struct.pack("!LH", wc, self.in_port or 0)
-    if self.dl_src == None:
-      packed += EMPTY_ETH.toRaw()
-    elif type(self.dl_src) is bytes:
-      packed += self.dl_src
-    else:
-      packed += self.dl_src.toRaw()
-    if self.dl_dst == None:
-      packed += EMPTY_ETH.toRaw()
-    elif type(self.dl_dst) is bytes:
-      packed += self.dl_dst
-    else:
-      packed += self.dl_dst.toRaw()
-
-    def check_ip(val):
-      return (val or 0) if self.dl_type == 0x0800 else 0
-    def check_ip_or_arp(val):
-      return (val or 0) if self.dl_type == 0x0800 \
-                           or self.dl_type == 0x0806 else 0
-    def check_tp(val):
-      return (val or 0) if self.dl_type == 0x0800 \
-                           and self.nw_proto in (1,6,17) else 0
-
-    packed += struct.pack("!HB", self.dl_vlan or 0, self.dl_vlan_pcp or 0)
-    packed += _PAD # Hardcode padding
-    packed += struct.pack("!HBB", self.dl_type or 0,
-        check_ip(self.nw_tos), check_ip_or_arp(self.nw_proto))
-    packed += _PAD2 # Hardcode padding
+
+    def eth (addr):
+      if addr is None: return EMPTY_ETH.toRaw()
+      if type(addr) is bytes: return addr
+      return addr.toRaw()
     def fix (addr):
       if addr is None: return 0
       if type(addr) is int: return addr & 0xffFFffFF
       if type(addr) is long: return addr & 0xffFFffFF
       return addr.toUnsigned()
 
-    packed += struct.pack("!LLHH", check_ip_or_arp(fix(self.nw_src)),
-        check_ip_or_arp(fix(self.nw_dst)),
-        check_tp(self.tp_src), check_tp(self.tp_dst))
-
-    return packed
+    dl_type = self.dl_type
+    nw_proto = self.nw_proto
+    is_ip = dl_type == 0x0800
+    is_ip_or_arp = is_ip or dl_type == 0x0806
+    is_tp = is_ip and nw_proto in (1,6,17)
+
+    return self._pack_struct.pack(wc, self.in_port or 0,
+        eth(self.dl_src), eth(self.dl_dst),
+        self.dl_vlan or 0, self.dl_vlan_pcp or 0, dl_type or 0,
+        (self.nw_tos or 0) if is_ip else 0,
+        (nw_proto or 0) if is_ip_or_arp else 0,
+        fix(self.nw_src) if is_ip_or_arp else 0,
+        fix(self.nw_dst) if is_ip_or_arp else 0,
+        (self.tp_src or 0) if is_tp else 0,
+        (self.tp_dst or 0) if is_tp else 0)
 
   def _normalize_wildcards (self, wildcards):
     """
@@ -1236,27 +1265,50 @@ class ofp_match (ofp_base):
     return not self.is_wildcarded
 
   def unpack (self, raw, offset=0, flow_mod=False):
-    _offset = offset
-    offset,(wildcards, self._in_port) = _unpack("!LH",raw, offset)
-    offset,self._dl_src = _readether(raw, offset)
-    offset,self._dl_dst = _readether(raw, offset)
-    offset,(self._dl_vlan, self._dl_vlan_pcp) = \
-        _unpack("!HB", raw, offset)
-    offset = _skip(raw, offset, 1)
-    offset,(self._dl_type, self._nw_tos, self._nw_proto) = \
-        _unpack("!HBB", raw, offset)
-    offset = _skip(raw, offset, 2)
-    offset,self._nw_src = _readip(raw, offset)
-    offset,self._nw_dst = _readip(raw, offset)
-    offset,(self._tp_src, self._tp_dst) = _unpack("!HH", raw, offset)
+    if (len(raw)-offset) < 40: raise UnderrunError()
+    (wildcards, self._in_port, dl_src, dl_dst, self._dl_vlan,
+     self._dl_vlan_pcp, self._dl_type, self._nw_tos, self._nw_proto,
+     nw_src, nw_dst, self._tp_src, self._tp_dst) = \
+        self._unpack_struct.unpack_from(raw, offset)
+    offset += 40
+
+    if self.lazy_unpack:
+      # Addresses are turned into EthAddr/IPAddr on first access (see
+      # __getattr__)
+      for k in _match_addr_fields:
+        try:
+          delattr(self, k)
+        except AttributeError:
+          pass
+      self._lazy_addrs = (dl_src, dl_dst, nw_src, nw_dst)
+    else:
+      self._dl_src = EthAddr.from_raw(dl_src)
+      self._dl_dst = EthAddr.from_raw(dl_dst)
+      self._nw_src = IPAddr.from_raw(nw_src)
+      self._nw_dst = IPAddr.from_raw(nw_dst)
+      self._lazy_addrs = None
 
     # Only unwire wildcards for flow_mod
     self.wildcards = self._normalize_wildcards(
         self._unwire_wildcards(wildcards) if flow_mod else wildcards)
 
-    assert offset - _offset == len(self)
     return offset
 
+  def _decode_addrs (self):
+    raw = self._lazy_addrs
+    self._lazy_addrs = None
+    # Any that were assigned since unpacking take precedence
+    cls = ofp_match
+    for name,factory,value in (('_dl_src', EthAddr.from_raw, raw[0]),
+                               ('_dl_dst', EthAddr.from_raw, raw[1]),
+                               ('_nw_src', IPAddr.from_raw, raw[2]),
+                               ('_nw_dst', IPAddr.from_raw, raw[3])):
+      slot = getattr(cls, name)
+      try:
+        slot.__get__(self, cls)
+      except AttributeError:
+        slot.__set__(self, factory(value))
+
   @staticmethod
   def __len__ ():
     return 40
@@ -1268,8 +1320,7 @@ class ofp_match (ofp_base):
     '''
 
     h = self.wildcards
-    for f in ofp_match_data:
-      v = getattr(self, f)
+    for v in self._values():
       if type(v) is int:
         h ^= v
       elif type(v) is long:
@@ -1277,6 +1328,14 @@ class ofp_match (ofp_base):
 
     return int(h & 0x7fFFffFF)
 
+  def _values (self):
+    """
+    The (non-wildcarded) field values as a tuple, in wire order
+    """
+    return (self.in_port, self.dl_src, self.dl_dst, self.dl_vlan,
+            self.dl_vlan_pcp, self.dl_type, self.nw_tos, self.nw_proto,
+            self.nw_src, self.nw_dst, self.tp_src, self.tp_dst)
+
   def matches_with_wildcards (self, other, consider_other_wildcards=True):
     """
     Test whether /this/ match completely encompasses the other match.
@@ -1312,34 +1371,34 @@ class ofp_match (ofp_base):
     if(self_nw_src[0] != None):
       other_nw_src = other.get_nw_src()
       if self_nw_src[1] > other_nw_src[1]: return False
-      if not IPAddr(other_nw_src[0]).inNetwork(
-            (self_nw_src[0], self_nw_src[1])): return False
+      other_ip = other_nw_src[0]
+      if type(other_ip) is not IPAddr: other_ip = IPAddr(other_ip)
+      if not other_ip.inNetwork(self_nw_src): return False
 
     self_nw_dst = self.get_nw_dst()
     if(self_nw_dst[0] != None):
       other_nw_dst = other.get_nw_dst()
       if self_nw_dst[1] > other_nw_dst[1]: return False
-      if not IPAddr(other_nw_dst[0]).inNetwork(
-            (self_nw_dst[0], self_nw_dst[1])): return False
+      other_ip = other_nw_dst[0]
+      if type(other_ip) is not IPAddr: other_ip = IPAddr(other_ip)
+      if not other_ip.inNetwork(self_nw_dst): return False
 
     return True
 
   def __eq__ (self, other):
     if type(self) != type(other): return False
     if self.wildcards != other.wildcards: return False
-    if self.in_port != other.in_port: return False
-    if self.dl_src != other.dl_src: return False
-    if self.dl_dst != other.dl_dst: return False
-    if self.dl_vlan != other.dl_vlan: return False
-    if self.dl_vlan_pcp != other.dl_vlan_pcp: return False
-    if self.dl_type != other.dl_type: return False
-    if self.nw_tos != other.nw_tos: return False
-    if self.nw_proto != other.nw_proto: return False
-    if self.nw_src != other.nw_src: return False
-    if self.nw_dst != other.nw_dst: return False
-    if self.tp_src != other.tp_src: return False
-    if self.tp_dst != other.tp_dst: return False
-    return True
+    return self._values() == other._values()
+
+  def __hash__ (self):
+    """
+    Hashes the wildcards and field values, consistently with __eq__
+
+    (EthAddr and IPAddr hash the same as the raw bytes or int they're
+    equal to.)  Matches are mutable, so don't change one while it's in a
+    set or used as a dict key.
+    """
+    return hash((self.wildcards,) + self._values())
 
   def __str__ (self):
     return self.__class__.__name__ + "\n  " + self.show('  ').strip()
@@ -1377,7 +1436,7 @@ class ofp_match (ofp_base):
     outstr += show_wildcards(self.wildcards)
     outstr += ' (%s = %x)\n' % (binstr(self.wildcards), self.wildcards)
     def append (f, formatter=str):
-      v = self.__getattr__(f)
+      v = getattr(self, f)
       if v is None: return ''
       return prefix + f + ": " + formatter(v) + "\n"
     outstr += append('in_port')
@@ -3576,12 +3635,21 @@ class ofp_barrier_request (ofp_header):
 @openflow_s_message("OFPT_PACKET_IN", 10)
 class ofp_packet_in (ofp_header):
   _MIN_LENGTH = 18
+  _fields_struct = struct.Struct("!LHHBx")
+
+  # When set, unpack() just remembers where the message is and decodes
+  # the body fields and copies out data on first access.
+  lazy_unpack = True
+
   def __init__ (self, **kw):
     ofp_header.__init__(self)
 
-    self.in_port = OFPP_NONE
+    self._lazy_fields = None # (raw, offset) of undecoded body fields
+    self._lazy_data = None   # (raw, start, end) of uncopied data
+
+    self._in_port = OFPP_NONE
     self._buffer_id = NO_BUFFER
-    self.reason = 0
+    self._reason = 0
     self.data = None
     self._total_len = None
 
@@ -3590,35 +3658,68 @@ class ofp_packet_in (ofp_header):
 
     initHelper(self, kw)
 
+  def _decode_fields (self):
+    raw,offset = self._lazy_fields
+    self._lazy_fields = None
+    (self._buffer_id, self._total_len, self._in_port,
+     self._reason) = self._fields_struct.unpack_from(raw, offset)
+
   def _validate (self):
     if self.data and (self.total_len < len(self.data)):
       return "total len less than data len"
 
+  @property
+  def in_port (self):
+    if self._lazy_fields is not None: self._decode_fields()
+    return self._in_port
+  @in_port.setter
+  def in_port (self, value):
+    if self._lazy_fields is not None: self._decode_fields()
+    self._in_port = value
+
+  @property
+  def reason (self):
+    if self._lazy_fields is not None: self._decode_fields()
+    return self._reason
+  @reason.setter
+  def reason (self, value):
+    if self._lazy_fields is not None: self._decode_fields()
+    self._reason = value
+
   @property
   def total_len (self):
+    if self._lazy_fields is not None: self._decode_fields()
     if self._total_len is None:
       return len(self.data) if self.data else 0
     return self._total_len
 
   @total_len.setter
   def total_len (self, value):
+    if self._lazy_fields is not None: self._decode_fields()
     self._total_len = value
 
   @property
   def buffer_id (self):
+    if self._lazy_fields is not None: self._decode_fields()
     if self._buffer_id == NO_BUFFER: return None
     return self._buffer_id
   @buffer_id.setter
   def buffer_id (self, val):
+    if self._lazy_fields is not None: self._decode_fields()
     if val is None: val = NO_BUFFER
     self._buffer_id = val
 
   @property
   def data (self):
+    if self._lazy_data is not None:
+      raw,start,end = self._lazy_data
+      self._lazy_data = None
+      self._data = raw[start:end]
     return self._data
   @data.setter
   def data (self, data):
     assert assert_type("data", data, (packet_base, str))
+    self._lazy_data = None
     if data is None:
       self._data = ''
     elif isinstance(data, packet_base):
@@ -3631,6 +3732,7 @@ class ofp_packet_in (ofp_header):
 
     packed = b""
     packed += ofp_header.pack(self)
+    if self._lazy_fields is not None: self._decode_fields()
     packed += struct.pack("!LHHBB", self._buffer_id, self.total_len,
                           self.in_port, self.reason, 0)
     packed += self.data
@@ -3643,8 +3745,16 @@ class ofp_packet_in (ofp_header):
     return len(self.data) == self.total_len
 
   def unpack (self, raw, offset=0):
+    start = offset
     offset,length = self._unpack_header(raw, offset)
-    offset,(self._buffer_id, self._total_len, self.in_port, self.reason,
+    if length < 18 or len(raw) - start < length:
+      raise UnderrunError("wanted %s bytes but only have %s"
+                          % (length, len(raw)-start))
+    if self.lazy_unpack:
+      self._lazy_fields = (raw, offset)
+      self._lazy_data = (raw, start + 18, start + length)
+      return start + length, length
+    offset,(self._buffer_id, self._total_len, self._in_port, self._reason,
             pad) = _unpack("!LHHBB", raw, offset)
     offset,self.data = _read(raw, offset, length-18)
     assert length == len(self)
@@ -3655,6 +3765,8 @@ class ofp_packet_in (ofp_header):
     #       spec what's supposed to be going on here.
     #if len(self.data) < 2:
     #  return 20 + len(self.data)
+    if self._lazy_data is not None:
+      return 18 + self._lazy_data[2] - self._lazy_data[1]
     return 18 + len(self.data)
 
   def __eq__ (self, other):
@@ -4309,3 +4421,39 @@ ofp_match_data = {
   'tp_src' : (0, OFPFW_TP_SRC),
   'tp_dst' : (0, OFPFW_TP_DST),
 }
+
+# ofp_match fields which a lazily unpacked match decodes on first access
+_match_addr_fields = frozenset(('_dl_src', '_dl_dst', '_nw_src', '_nw_dst'))
+
+def _make_match_property (name, wildcard_bits):
+  slot = getattr(ofp_match, '_' + name)
+  slot_get = slot.__get__
+  slot_set = slot.__set__
+  default = ofp_match_data[name][0]
+  def fget (self):
+    if self.wildcards & wildcard_bits == wildcard_bits: return None
+    try:
+      return slot_get(self, ofp_match)
+    except AttributeError:
+      # Left empty by a lazy unpack()
+      return getattr(self, '_' + name)
+  def fset (self, value):
+    if value is None:
+      slot_set(self, default)
+      self.wildcards |= wildcard_bits
+    else:
+      slot_set(self, value)
+      self.wildcards &= ~wildcard_bits
+  return property(fget, fset)
+
+for _name,(_default,_bits) in ofp_match_data.iteritems():
+  if _name in ('nw_src', 'nw_dst'): continue
+  setattr(ofp_match, _name, _make_match_property(_name, _bits))
+ofp_match.nw_src = property(lambda self: self.get_nw_src()[0],
+                            lambda self, value: self.set_nw_src(value))
+ofp_match.nw_dst = property(lambda self: self.get_nw_dst()[0],
+                            lambda self, value: self.set_nw_dst(value))
+del _name, _default, _bits
+
+_match_all_wildcards = ofp_match.__new__(ofp_match)._normalize_wildcards(
+    OFPFW_ALL)
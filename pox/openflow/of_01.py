@@ -36,22 +36,16 @@ log = core.getLogger()
 
 import socket
 import select
+import struct
 
 # List where the index is an OpenFlow message type (OFPT_xxx), and
 # the values are unpack functions that unpack the wire format of that
 # type into a message object.
 unpackers = make_type_to_unpacker_table()
 
-try:
-  PIPE_BUF = select.PIPE_BUF
-except:
-  try:
-    # Try to get it from where PyPy (sometimes) has it
-    import IN
-    PIPE_BUF = IN.PIPE_BUF
-  except:
-    # (Hopefully) reasonable default
-    PIPE_BUF = 512
+# The part of the OpenFlow header we need in order to frame messages
+# (version, type, length)
+_ofp_header_prefix = struct.Struct("!BBH")
 
 import pox.openflow.libopenflow_01 as of
 
@@ -59,6 +53,7 @@ import threading
 import os
 import sys
 import exceptions
+from collections import deque
 from errno import EAGAIN, ECONNRESET
 
 
@@ -183,9 +178,14 @@ def handle_PORT_STATUS (con, msg): #A
     con.raiseEventNoErrors(OFMessage, con, full_msg)
 
 def handle_PACKET_IN (con, msg): #A
+  # The nexus and the connection share one event (if anyone's listening),
+  # so the packet is parsed at most once no matter who looks at it.
   e = con.ofnexus.raiseEventNoErrors(PacketIn, con, msg)
-  if e is None or e.halt != True:
+  if e is None:
     con.raiseEventNoErrors(PacketIn, con, msg)
+  elif e.halt != True:
+    e.source = None
+    con.raiseEventNoErrors(e)
   full_msg = (of.OFPT_PACKET_IN, msg)
   e = con.ofnexus.raiseEventNoErrors(OFMessage, con, full_msg)
   if e is None or e.halt != True:
@@ -292,114 +292,6 @@ statsHandlerMap = {
   of.OFPST_QUEUE : handle_OFPST_QUEUE,
 }
 
-# Deferred sending should be unusual, so don't worry too much about
-# efficiency
-class DeferredSender (threading.Thread):
-  """
-  Class that handles sending when a socket write didn't complete
-  """
-  def __init__ (self):
-    # Threads, not recoco?
-    threading.Thread.__init__(self)
-    self._dataForConnection = {}
-    self._lock = threading.RLock()
-    self._waker = pox.lib.util.makePinger()
-    self.daemon = True
-    self.sending = False
-
-    self.start()
-
-  def _sliceup (self, data):
-    """
-    Takes an array of data bytes, and slices into elements of
-    PIPE_BUF bytes each
-    """
-    out = []
-    while len(data) > PIPE_BUF:
-      out.append(data[0:PIPE_BUF])
-      data = data[PIPE_BUF:]
-    if len(data) > 0:
-      out.append(data)
-    return out
-
-  def send (self, con, data):
-    with self._lock:
-      self.sending = True
-
-      data = self._sliceup(data)
-
-      if con not in self._dataForConnection:
-        self._dataForConnection[con] = data
-      else:
-        self._dataForConnection[con].extend(data)
-
-      self._waker.ping()
-
-  def kill (self, con):
-    with self._lock:
-      try:
-        del self._dataForConnection[con]
-      except:
-        pass
-
-      self._waker.ping()
-
-  def run (self):
-    while core.running:
-
-      with self._lock:
-        cons = self._dataForConnection.keys()
-
-      rlist, wlist, elist = select.select([self._waker], cons, cons, 1)
-      if not core.running: break
-
-      with self._lock:
-        if len(rlist) > 0:
-          self._waker.pongAll()
-
-        for con in elist:
-          try:
-            del self._dataForConnection[con]
-          except:
-            pass
-
-        for con in wlist:
-          try:
-            alldata = self._dataForConnection[con]
-            while len(alldata):
-              data = alldata[0]
-              try:
-                l = con.sock.send(data)
-                if l != len(data):
-                  alldata[0] = data[l:]
-                  break
-                del alldata[0]
-              except socket.error as (errno, strerror):
-                if errno != EAGAIN:
-                  con.msg("DeferredSender/Socket error: " + strerror)
-                  con.disconnect()
-                  del self._dataForConnection[con]
-                break
-              except:
-                con.msg("Unknown error doing deferred sending")
-                break
-            if len(alldata) == 0:
-              try:
-                del self._dataForConnection[con]
-                if len(self._dataForConnection) == 0:
-                  self.sending = False
-                  break
-              except:
-                pass
-          except:
-            try:
-              del self._dataForConnection[con]
-            except:
-              pass
-
-# Used by the Connection class below
-deferredSender = DeferredSender()
-
 class DummyOFNexus (object):
   def raiseEventNoErrors (self, event, *args, **kw):
     log.warning("%s raised on dummy OpenFlow nexus" % event)
@@ -607,11 +499,25 @@ class Connection (EventMixin):
     PortStatsReceived,
     QueueStatsReceived,
     FlowRemoved,
+    ConnectionBackpressure,
   ])
   
   # Globally unique identifier for the Connection instance
   ID = 0
 
+  # Maximum number of bytes pulled off the socket by a single read()
+  read_size = 2048
+
+  # When more than send_high_water bytes are waiting to be written to the
+  # switch, a ConnectionBackpressure event is raised with congested=True.
+  # Once it has drained below send_low_water, one is raised with
+  # congested=False.
+  send_high_water = 1024 * 1024
+  send_low_water = 256 * 1024
+
+  # Small queued messages are joined into writes of up to this many bytes
+  send_chunk = 256 * 1024
+
   def msg (self, m):
     #print str(self), m
     log.debug(str(self) + " " + str(m))
@@ -623,12 +529,20 @@ class Connection (EventMixin):
     #print str(self), m
     log.info(str(self) + " " + str(m))
 
-  def __init__ (self, sock):
+  def __init__ (self, sock, io_loop = None):
     self._previous_stats = []
 
     self.ofnexus = _dummyOFNexus
     self.sock = sock
-    self.buf = ''
+
+    # Receive buffer.  Data between _rbuf_start and _rbuf_end hasn't been
+    # framed yet.  The buffer is reused (and the unframed tail slid back
+    # to the front) rather than being reallocated on every read, and we
+    # keep a memoryview of it to recv_into() directly.
+    self._rbuf = bytearray()
+    self._rview = memoryview(self._rbuf)
+    self._rbuf_start = 0
+    self._rbuf_end = 0
     Connection.ID += 1
     self.ID = Connection.ID
     # TODO: dpid and features don't belong here; they should be eventually
@@ -639,6 +553,16 @@ class Connection (EventMixin):
     self.connect_time = None
     self.idle_time = time.time()
 
+    # Output which doesn't fit into the socket buffer is queued here until
+    # the I/O loop sees that the socket is writable and calls _flush().
+    # If we have an io_loop, we let it know when that happens by calling
+    # its _want_write().
+    self._io_loop = io_loop
+    self._send_queue = deque()
+    self._send_queued = 0 # Bytes in _send_queue
+    self._send_offset = 0 # Bytes of _send_queue[0] already sent
+    self.congested = False
+
     self.send(of.ofp_hello())
 
     self.original_ports = PortCollection()
@@ -676,11 +600,10 @@ class Connection (EventMixin):
       self.ofnexus.raiseEventNoErrors(ConnectionDown, self)
       self.raiseEventNoErrors(ConnectionDown, self)
 
-    try:
-      #deferredSender.kill(self)
-      pass
-    except:
-      pass
+    # Anything still buffered is never going to make it
+    self._send_queue.clear()
+    self._send_queued = 0
+    self._send_offset = 0
     try:
       self.sock.shutdown(socket.SHUT_RDWR)
     except:
@@ -706,24 +629,113 @@ class Connection (EventMixin):
       assert isinstance(data, of.ofp_header)
       data = data.pack()
 
-    if deferredSender.sending:
-      log.debug("deferred sender is sending!")
-      deferredSender.send(self, data)
+    q = self._send_queue
+    if q:
+      # Already backed up; preserve ordering
+      q.append(data)
+      self._send_queued += len(data)
+      self._check_backpressure()
       return
     try:
       l = self.sock.send(data)
-      if l != len(data):
-        self.msg("Didn't send complete buffer.")
-        data = data[l:]
-        deferredSender.send(self, data)
     except socket.error as (errno, strerror):
-      if errno == EAGAIN:
-        self.msg("Out of send buffer space.  " +
-                 "Consider increasing SO_SNDBUF.")
-        deferredSender.send(self, data)
-      else:
+      if errno != EAGAIN:
+        self.msg("Socket error: " + strerror)
+        self.disconnect()
+        return
+      l = 0
+    if l != len(data):
+      q.append(data)
+      self._send_offset = l
+      self._send_queued += len(data) - l
+      if self._io_loop is not None:
+        self._io_loop._want_write(self)
+      self._check_backpressure()
+
+  def _check_backpressure (self):
+    """
+    Raise ConnectionBackpressure when crossing a watermark
+    """
+    if self.congested:
+      if self._send_queued > self.send_low_water: return
+      self.congested = False
+    else:
+      if self._send_queued <= self.send_high_water: return
+      self.congested = True
+    if self.congested:
+      self.msg("Output congested (%i bytes buffered)" % (self._send_queued,))
+    else:
+      self.msg("Output no longer congested")
+    e = self.ofnexus.raiseEventNoErrors(ConnectionBackpressure, self,
+                                        self.congested, self._send_queued)
+    if e is None or e.halt != True:
+      self.raiseEventNoErrors(ConnectionBackpressure, self, self.congested,
+                              self._send_queued)
+
+  def _flush (self):
+    """
+    Try to send queued output
+
+    Called by the I/O loop when the socket becomes writable.  Returns True
+    if there's still output waiting.
+    """
+    q = self._send_queue
+    if not q: return False
+    data = q[0]
+    offset = self._send_offset
+    chunk = self.send_chunk
+    if len(q) > 1 and len(data) - offset + len(q[1]) <= chunk:
+      # Coalesce small messages so the socket gets as much as it'll take in
+      # one go.  Only up to a chunk, so a big backlog isn't copied over and
+      # over while it drains.
+      q.popleft()
+      parts = [data[offset:]]
+      size = len(parts[0])
+      while q and size + len(q[0]) <= chunk:
+        size += len(q[0])
+        parts.append(q.popleft())
+      data = b''.join(parts)
+      q.appendleft(data)
+      offset = 0
+    try:
+      l = self.sock.send(buffer(data, offset))
+    except socket.error as (errno, strerror):
+      if errno != EAGAIN:
         self.msg("Socket error: " + strerror)
         self.disconnect()
+        self._send_queued = 0
+        return False
+      l = 0
+    offset += l
+    if offset == len(data):
+      q.popleft()
+      offset = 0
+    self._send_offset = offset
+    self._send_queued -= l
+    if self.congested:
+      self._check_backpressure()
+    return len(q) != 0
+
+  def _make_room (self):
+    """
+    Make sure there's at least read_size free at the end of the buffer
+    """
+    buf = self._rbuf
+    start = self._rbuf_start
+    end = self._rbuf_end
+    pending = end - start
+    if len(buf) - end >= self.read_size: return
+    if pending + self.read_size <= len(buf):
+      # Slide the unframed data back to the front
+      buf[:pending] = buf[start:end]
+    else:
+      # Have to grow it
+      new_buf = bytearray(max(len(buf) * 2, pending + self.read_size))
+      new_buf[:pending] = self._rview[start:end]
+      self._rbuf = new_buf
+      self._rview = memoryview(new_buf)
+    self._rbuf_start = 0
+    self._rbuf_end = pending
 
   def read (self):
     """
@@ -732,43 +744,52 @@ class Connection (EventMixin):
 
     Note: This function will block if data is not available.
     """
-    d = self.sock.recv(2048)
-    if len(d) == 0:
+    self._make_room()
+    view = self._rview
+    end = self._rbuf_end
+    n = self.sock.recv_into(view[end:end+self.read_size], self.read_size)
+    if n == 0:
       return False
-    self.buf += d
-    buf_len = len(self.buf)
-
-    offset = 0
-    while buf_len - offset >= 8: # 8 bytes is minimum OF message size
-      # We pull the first four bytes of the OpenFlow header off by hand
-      # (using ord) to find the version/length/type so that we can
-      # correctly call libopenflow to unpack it.
-      
-      # OpenFlow parsing occurs here:
-      if ord(self.buf[offset]) == of.OFP_VERSION:
-        ofp_type = ord(self.buf[offset+1])
-        msg_length = ord(self.buf[offset+2]) << 8 | ord(self.buf[offset+3])
-        if buf_len - offset < msg_length: break
-        
-        new_offset,msg = unpackers[ofp_type](self.buf, offset)
-        assert new_offset - offset == msg_length
-        offset = new_offset
-
-        try:
-          h = handlers[ofp_type]
-          h(self, msg)
-        except:
-          log.exception("%s: Exception while handling OpenFlow message:\n" +
-                        "%s %s", self,self,
-                        ("\n" + str(self) + " ").join(str(msg).split('\n')))
-          continue
-      else:
-        log.warning("Bad OpenFlow version (" + str(ord(self.buf[0])) +
+    end += n
+    buf = self._rbuf
+    offset = self._rbuf_start
+
+    while end - offset >= 8: # 8 bytes is minimum OF message size
+      # We pull the first four bytes of the OpenFlow header off to find
+      # the version/length/type so that we can correctly call libopenflow
+      # to unpack it.
+      version,ofp_type,msg_length = \
+          _ofp_header_prefix.unpack_from(buf, offset)
+      if version != of.OFP_VERSION or msg_length < 8:
+        # We have no way to get back in sync with the stream
+        log.warning("Bad OpenFlow version (" + str(version) +
                     ") on connection " + str(self))
+        self._rbuf_start = self._rbuf_end = 0
+        return False
+      if end - offset < msg_length: break
+
+      # OpenFlow parsing occurs here.  The unpacker gets its own copy of
+      # exactly this message -- never the whole buffer.
+      new_offset,msg = unpackers[ofp_type](
+          view[offset:offset+msg_length].tobytes(), 0)
+      assert new_offset == msg_length
+      offset += msg_length
+
+      try:
+        h = handlers[ofp_type]
+        h(self, msg)
+      except:
+        log.exception("%s: Exception while handling OpenFlow message:\n" +
+                      "%s %s", self,self,
+                      ("\n" + str(self) + " ").join(str(msg).split('\n')))
+        continue
+
+    if offset == end:
+      # Consumed everything; start over at the front
+      offset = end = 0
+    self._rbuf_start = offset
+    self._rbuf_end = end
 
-    if offset != 0:
-      self.buf = self.buf[offset:]
-  
     return True
 
   def _incoming_stats_reply (self, ofp):
@@ -836,40 +857,79 @@ class OpenFlow_01_Task (Task):
   """
   The main recoco thread for listening to openflow messages
   """
+  scheduling_class = 'io'
+
   def __init__ (self, port = 6633, address = '0.0.0.0'):
     Task.__init__(self)
     self.port = int(port)
     self.address = address
 
+    # Connections with output waiting for their sockets to be writable
+    self._writers = set()
+    self._pinger = None
+
     core.addListener(pox.core.GoingUpEvent, self._handle_GoingUpEvent)
 
   def _handle_GoingUpEvent (self, event):
     self.start()
 
-  def run (self):
-    # List of open sockets/connections to select on
-    sockets = []
-
+  def _listen (self):
     listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     listener.bind((self.address, self.port))
     listener.listen(16)
-    sockets.append(listener)
 
     log.debug("Listening on %s:%s" %
               (self.address, self.port))
+    return listener
+
+  def _accept (self, listener, **kw):
+    """
+    Accepts a new switch connection
+
+    Extra keyword arguments are passed to the Connection.
+    """
+    new_sock = listener.accept()[0]
+    if pox.openflow.debug.pcap_traces:
+      new_sock = wrap_socket(new_sock)
+    new_sock.setblocking(0)
+    # Note that instantiating a Connection object fires a
+    # ConnectionUp event (after negotation has completed)
+    return Connection(new_sock, io_loop=self, **kw)
+
+  def _want_write (self, con):
+    """
+    Called by a Connection when it has output waiting
+    """
+    if con not in self._writers:
+      self._writers.add(con)
+      # We may be blocked in a Select() that doesn't know about it yet
+      self._pinger.ping()
+
+  def run (self):
+    # List of open sockets/connections to select on
+    sockets = []
+
+    listener = self._listen()
+    sockets.append(listener)
+
+    # Woken when a connection wants to write
+    self._pinger = pinger = pox.lib.util.makePinger()
+    sockets.append(pinger)
+    writers = self._writers
 
     con = None
     while core.running:
       try:
         while True:
           con = None
-          rlist, wlist, elist = yield Select(sockets, [], sockets, 5)
+          rlist, wlist, elist = yield Select(sockets, list(writers),
+                                             sockets, 5)
           if len(rlist) == 0 and len(wlist) == 0 and len(elist) == 0:
             if not core.running: break
 
           for con in elist:
-            if con is listener:
+            if con is listener or con is pinger:
               raise RuntimeError("Error on listener socket")
             else:
               try:
@@ -880,24 +940,26 @@ class OpenFlow_01_Task (Task):
                 sockets.remove(con)
               except:
                 pass
+              writers.discard(con)
+
+          for con in wlist:
+            if con._flush() is False:
+              writers.discard(con)
 
           timestamp = time.time()
           for con in rlist:
             if con is listener:
-              new_sock = listener.accept()[0]
-              if pox.openflow.debug.pcap_traces:
-                new_sock = wrap_socket(new_sock)
-              new_sock.setblocking(0)
-              # Note that instantiating a Connection object fires a
-              # ConnectionUp event (after negotation has completed)
-              newcon = Connection(new_sock)
+              newcon = self._accept(listener)
               sockets.append( newcon )
               #print str(newcon) + " connected"
+            elif con is pinger:
+              pinger.pongAll()
             else:
               con.idle_time = timestamp
               if con.read() is False:
                 con.close()
                 sockets.remove(con)
+                writers.discard(con)
       except exceptions.KeyboardInterrupt:
         break
       except:
@@ -921,12 +983,138 @@ class OpenFlow_01_Task (Task):
           sockets.remove(con)
         except:
           pass
+        writers.discard(con)
 
     log.debug("No longer listening for connections")
 
     #pox.core.quit()
 
 
+class OpenFlow_01_EpollTask (OpenFlow_01_Task):
+  """
+  A recoco task for OpenFlow connections which uses edge-triggered epoll
+
+  OpenFlow_01_Task hands its whole socket list to Select() on every pass,
+  so each wakeup costs O(connections).  This task keeps every socket
+  registered with a single epoll object and only ever waits on the epoll
+  fd itself, so a pass costs O(ready connections).
+
+  Since it's edge-triggered, a readable socket has to be read until it
+  would block.  To keep one busy switch from starving the rest, at most
+  max_reads large reads are done per connection per pass; connections
+  which still have data are serviced again on the next pass without
+  waiting.  Sockets are registered for EPOLLOUT from the start, so a
+  Connection's buffered output is flushed when epoll reports that its
+  socket has become writable again.
+
+  Linux only.
+  """
+  def __init__ (self, port = 6633, address = '0.0.0.0', read_size = 65536,
+                max_reads = 4, max_events = 1024):
+    OpenFlow_01_Task.__init__(self, port = port, address = address)
+    self.read_size = int(read_size)
+    self.max_reads = int(max_reads)
+    self.max_events = int(max_events)
+
+  def _want_write (self, con):
+    # Edge-triggered EPOLLOUT will tell us when there's room
+    pass
+
+  def run (self):
+    from pox.lib.epoll_select import EpollRegistry
+    EPOLLIN = select.EPOLLIN
+    EPOLLOUT = select.EPOLLOUT
+    EPOLLERR = select.EPOLLERR | select.EPOLLHUP
+    con_mask = EPOLLIN | EPOLLOUT | select.EPOLLET
+
+    poller = EpollRegistry()
+    listener = self._listen()
+    listener.setblocking(0)
+    poller.register(listener, EPOLLIN)
+
+    # Connections which may still have unread data on their sockets
+    readable = set()
+
+    def drop (con):
+      readable.discard(con)
+      poller.unregister(con)
+      try:
+        con.close()
+      except:
+        pass
+
+    while core.running:
+      if readable:
+        # Just give other tasks a turn
+        yield 0
+      else:
+        rlist, wlist, elist = yield Select([poller], [], [poller], 5)
+        if not rlist and not elist:
+          continue
+
+      try:
+        events = poller.poll(0, self.max_events)
+      except IOError:
+        # EINTR and friends; just try again
+        continue
+
+      for con, event in events:
+        if con is listener:
+          if event & EPOLLERR:
+            log.error("Error on OpenFlow listener.  Aborting.")
+            poller.close()
+            return
+          while True:
+            try:
+              newcon = self._accept(listener)
+            except socket.error as (errno, strerror):
+              if errno != EAGAIN:
+                log.error("Error accepting connection: %s", strerror)
+              break
+            newcon.read_size = self.read_size
+            poller.register(newcon, con_mask)
+          continue
+
+        if event & EPOLLIN:
+          readable.add(con)
+        elif event & EPOLLERR:
+          # Nothing left to read and the socket is dead
+          drop(con)
+          continue
+        if event & EPOLLOUT:
+          con._flush()
+
+      timestamp = time.time()
+      for con in list(readable):
+        con.idle_time = timestamp
+        try:
+          for _ in xrange(self.max_reads):
+            if con.read() is False or con.disconnected:
+              drop(con)
+              break
+          # If we get here without an exception, there may be more to read
+          # and it stays in the readable set.
+        except socket.error as e:
+          if e.args[0] == EAGAIN:
+            readable.discard(con)
+          else:
+            if e.args[0] == ECONNRESET:
+              con.info("Connection reset")
+            else:
+              log.exception("Exception reading connection " + str(con))
+            drop(con)
+        except Exception:
+          log.exception("Exception reading connection " + str(con))
+          drop(con)
+
+    poller.close()
+    try:
+      listener.close()
+    except:
+      pass
+    log.debug("No longer listening for connections")
+
+
 def _set_handlers ():
   handlers.extend([None] * (1 + sorted(handlerMap.keys(),reverse=True)[0]))
   for h in handlerMap:
@@ -935,10 +1123,28 @@ def _set_handlers ():
 _set_handlers()
 
 
-def launch (port = 6633, address = "0.0.0.0"):
+def launch (port = 6633, address = "0.0.0.0", reactor = "select",
+            read_size = 65536):
+  """
+  Listen for OpenFlow 1.0 switches
+
+  reactor selects how switch sockets are serviced.  "select" (the default)
+  passes them all to recoco's select() loop.  "epoll" uses a dedicated
+  edge-triggered epoll set with large reads, which scales much better to
+  hundreds of switches (Linux only).  read_size is only used by the epoll
+  reactor.
+  """
   if core.hasComponent('of_01'):
     return None
-  l = OpenFlow_01_Task(port = int(port), address = address)
+  if reactor == "epoll":
+    if not hasattr(select, "epoll"):
+      raise RuntimeError("The epoll reactor is not available on this platform")
+    l = OpenFlow_01_EpollTask(port = int(port), address = address,
+                              read_size = int(read_size))
+  elif reactor == "select":
+    l = OpenFlow_01_Task(port = int(port), address = address)
+  else:
+    raise RuntimeError("Unknown reactor '%s'" % (reactor,))
   core.register("of_01", l)
   return l
 
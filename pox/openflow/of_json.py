@@ -192,7 +192,7 @@ def dict_to_flow_mod (flow):
   actions = [dict_to_action(a) for a in actions]
   if 'output' in flow:
     a = of.ofp_action_output(port=_fix_of_int(flow['output']))
-    po.actions.append(a)
+    actions.append(a)
 
   fm = of.ofp_flow_mod(match = match)
   fm.actions = actions
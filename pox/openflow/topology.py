@@ -35,11 +35,14 @@ from pox.topology.topology import *
 from pox.openflow.discovery import *
 from pox.openflow.libopenflow_01 import xid_generator
 from pox.openflow.flow_table import FlowTable,FlowTableModification,TableEntry
+from pox.openflow.flow_table import match_key
 from pox.lib.util import dpidToStr
 from pox.lib.addresses import *
 
 import pickle
 import itertools
+import time
+from collections import deque
 
 # After a switch disconnects, it has this many seconds to reconnect in
 # order to reactivate the same OpenFlowSwitch object.  After this, if
@@ -299,24 +302,45 @@ class OFSyncFlowTable (EventMixin):
   _eventMixin_events = set([FlowTableModification])
   """
   A flow table that keeps in sync with a switch
+
+  Pending changes are sent to the switch as flow_mods followed by a
+  barrier, and applied to our copy of the table when the barrier reply
+  comes back.  Big batches get a barrier every BARRIER_WINDOW flow_mods
+  (so they're confirmed -- or retried -- a window at a time) and are
+  packed into a single write.
   """
   ADD = of.OFPFC_ADD
   REMOVE = of.OFPFC_DELETE
   REMOVE_STRICT = of.OFPFC_DELETE_STRICT
   TIME_OUT = 2
 
+  # Maximum number of flow_mods covered by one barrier
+  BARRIER_WINDOW = 1000
+
+  # Syncs with at least this many flow_mods are packed into one write
+  # instead of being sent message by message
+  PACK_THRESHOLD = 16
+
   def __init__ (self, switch=None, **kw):
     EventMixin.__init__(self)
     self.flow_table = FlowTable()
     self.switch = switch
 
-    # a list of pending flow table entries : tuples (ADD|REMOVE, entry)
-    self._pending = []
+    # pending flow table ops -- tuples (ADD|REMOVE|REMOVE_STRICT, entry) --
+    # mapped to a sequence number giving the order they were requested in
+    self._pending = {}
+    self._seq = itertools.count()
+    # pending ADD ops by (match_key, priority) -> [op1, op2, ...]
+    self._pending_adds = {}
+    # pending ops which haven't been sent yet
+    self._unsent = []
 
-    # a map of pending barriers barrier_xid-> ([entry1,entry2])
+    # a map of pending barriers barrier_xid-> [op1, op2, ...]
     self._pending_barrier_to_ops = {}
-    # a map of pending barriers per request entry -> (barrier_xid, time)
+    # a map of in-flight ops op -> (barrier_xid, time)
     self._pending_op_to_barrier = {}
+    # (time, barrier_xid) in the order the barriers were sent
+    self._barrier_times = deque()
 
     self.listenTo(switch)
 
@@ -358,60 +382,114 @@ class OFSyncFlowTable (EventMixin):
   def __len__ (self):
     return len(self.flow_table)
 
+  @staticmethod
+  def _key (entry):
+    return (match_key(entry.match), entry.priority)
+
+  def _add_pending (self, op):
+    if op in self._pending: return
+    self._pending[op] = self._seq.next()
+    if op[0] == OFSyncFlowTable.ADD:
+      self._pending_adds.setdefault(self._key(op[1]), []).append(op)
+    self._unsent.append(op)
+
+  def _drop_pending (self, op):
+    if op not in self._pending: return
+    del self._pending[op]
+    if op[0] == OFSyncFlowTable.ADD:
+      key = self._key(op[1])
+      ops = self._pending_adds[key]
+      ops.remove(op)
+      if not ops: del self._pending_adds[key]
+
   def _mod (self, entries, command):
     if isinstance(entries, TableEntry):
       entries = [ entries ]
 
     for entry in entries:
+      # Removals supersede pending adds of the entries they remove
       if(command == OFSyncFlowTable.REMOVE):
-        self._pending = [(cmd,pentry) for cmd,pentry in self._pending
-                         if not (cmd == OFSyncFlowTable.ADD
-                                 and entry.matches_with_wildcards(pentry))]
+        cancelled = [op for ops in self._pending_adds.itervalues()
+                     for op in ops if op[1].is_matched_by(entry.match)]
       elif(command == OFSyncFlowTable.REMOVE_STRICT):
-        self._pending = [(cmd,pentry) for cmd,pentry in self._pending
-                         if not (cmd == OFSyncFlowTable.ADD
-                                 and entry == pentry)]
+        cancelled = self._pending_adds.get(self._key(entry), [])[:]
+      else:
+        cancelled = ()
+      for op in cancelled:
+        self._drop_pending(op)
 
-      self._pending.append( (command, entry) )
+      self._add_pending( (command, entry) )
 
     self._sync_pending()
 
+  def _flow_mod (self, op):
+    command,entry = op
+    return entry.to_flow_mod(xid=self.switch._xid_generator(),
+                             command=command,
+                             flags=entry.flags | of.OFPFF_SEND_FLOW_REM)
+
+  def _timed_out (self, now):
+    """
+    Returns in-flight ops whose barrier reply is overdue
+    """
+    ops = []
+    times = self._barrier_times
+    while times and times[0][0] + self.TIME_OUT < now:
+      xid = times.popleft()[1]
+      for op in self._pending_barrier_to_ops.get(xid, ()):
+        if (op in self._pending
+            and self._pending_op_to_barrier.get(op, (None,))[0] == xid):
+          ops.append(op)
+    return ops
+
   def _sync_pending (self, clear=False):
     if not self.switch.connected:
       return False
 
+    now = time.time()
+    msgs = []
+
     # resync the switch
     if clear:
       self._pending_barrier_to_ops = {}
       self._pending_op_to_barrier = {}
-      self._pending = filter(lambda(op): op[0] == OFSyncFlowTable.ADD,
-                             self._pending)
-
-      self.switch.send(of.ofp_flow_mod(command=of.OFPFC_DELETE,
-                                       match=of.ofp_match()))
-      self.switch.send(of.ofp_barrier_request())
-
-      todo = map(lambda(e): (OFSyncFlowTable.ADD, e),
-                 self.flow_table.entries) + self._pending
+      self._barrier_times.clear()
+      for op in self._pending.keys():
+        if op[0] != OFSyncFlowTable.ADD:
+          self._drop_pending(op)
+      todo = sorted(self._pending, key=self._pending.get)
+
+      msgs.append(of.ofp_flow_mod(command=of.OFPFC_DELETE,
+                                  match=of.ofp_match()))
+      msgs.append(of.ofp_barrier_request())
+
+      # Entries we already have just need putting back on the switch
+      for entry in self.flow_table.entries:
+        msgs.append(self._flow_mod((OFSyncFlowTable.ADD, entry)))
     else:
-      todo = [op for op in self._pending
-              if op not in self._pending_op_to_barrier
-              or (self._pending_op_to_barrier[op][1]
-                  + OFSyncFlowTable.TIME_OUT) < time.time() ]
-
-    for op in todo:
-      fmod_xid = self.switch._xid_generator()
-      flow_mod = op[1].to_flow_mod(xid=fmod_xid, command=op[0],
-                                   flags=op[1].flags | of.OFPFF_SEND_FLOW_REM)
-      self.switch.send(flow_mod)
-
-    barrier_xid = self.switch._xid_generator()
-    self.switch.send(of.ofp_barrier_request(xid=barrier_xid))
-    now = time.time()
-    self._pending_barrier_to_ops[barrier_xid] = todo
-
-    for op in todo:
-      self._pending_op_to_barrier[op] = (barrier_xid, now)
+      # Retries go first so changes still reach the switch in order
+      todo = self._timed_out(now)
+      todo.extend(op for op in self._unsent if op in self._pending)
+    self._unsent = []
+
+    window = self.BARRIER_WINDOW
+    for i in xrange(0, len(todo), window):
+      ops = todo[i:i+window]
+      for op in ops:
+        msgs.append(self._flow_mod(op))
+
+      barrier_xid = self.switch._xid_generator()
+      msgs.append(of.ofp_barrier_request(xid=barrier_xid))
+      self._pending_barrier_to_ops[barrier_xid] = ops
+      self._barrier_times.append((now, barrier_xid))
+      for op in ops:
+        self._pending_op_to_barrier[op] = (barrier_xid, now)
+
+    if len(msgs) >= self.PACK_THRESHOLD:
+      self.switch.send(b''.join(m.pack() for m in msgs))
+    else:
+      for msg in msgs:
+        self.switch.send(msg)
 
   def _handle_SwitchConnectionUp (self, event):
     # sync all_flows
@@ -421,42 +499,42 @@ class OFSyncFlowTable (EventMixin):
     # connection down. too bad for our unconfirmed entries
     self._pending_barrier_to_ops = {}
     self._pending_op_to_barrier = {}
+    self._barrier_times.clear()
 
   def _handle_BarrierIn (self, barrier):
     # yeah. barrier in. time to sync some of these flows
-    if barrier.xid in self._pending_barrier_to_ops:
-      added = []
-      removed = []
-      #print "barrier in: pending for barrier: %d: %s" % (barrier.xid,
-      #    self._pending_barrier_to_ops[barrier.xid])
-      for op in self._pending_barrier_to_ops[barrier.xid]:
-        (command, entry) = op
-        if(command == OFSyncFlowTable.ADD):
-          self.flow_table.add_entry(entry)
-          added.append(entry)
-        else:
-          removed.extend(self.flow_table.remove_matching_entries(entry.match,
-              entry.priority, strict=command == OFSyncFlowTable.REMOVE_STRICT))
-        #print "op: %s, pending: %s" % (op, self._pending)
-        if op in self._pending: self._pending.remove(op)
-        self._pending_op_to_barrier.pop(op, None)
-      del self._pending_barrier_to_ops[barrier.xid]
-      self.raiseEvent(FlowTableModification(added = added, removed=removed))
-      return EventHalt
-    else:
+    ops = self._pending_barrier_to_ops.pop(barrier.xid, None)
+    if ops is None:
       return EventContinue
 
+    added = []
+    removed = []
+    in_flight = self._pending_op_to_barrier
+    for op in ops:
+      # Ops which were retried may be confirmed by an earlier barrier
+      if in_flight.pop(op, None) is None: continue
+      (command, entry) = op
+      if(command == OFSyncFlowTable.ADD):
+        self.flow_table.add_entry(entry)
+        added.append(entry)
+      else:
+        removed.extend(self.flow_table.remove_matching_entries(entry.match,
+            entry.priority, strict=command == OFSyncFlowTable.REMOVE_STRICT))
+      self._drop_pending(op)
+    self.raiseEvent(FlowTableModification(added = added, removed=removed))
+    return EventHalt
+
   def _handle_FlowRemoved (self, event):
     """
     process a flow removed event -- remove the matching flow from the table.
     """
     flow_removed = event.ofp
-    for entry in self.flow_table.entries:
-      if (flow_removed.match == entry.match
-          and flow_removed.priority == entry.priority):
-        self.flow_table.remove_entry(entry)
-        self.raiseEvent(FlowTableModification(removed=[entry]))
-        return EventHalt
+    for entry in self.flow_table.matching_entries(flow_removed.match,
+                                                  flow_removed.priority,
+                                                  strict=True):
+      self.flow_table.remove_entry(entry)
+      self.raiseEvent(FlowTableModification(removed=[entry]))
+      return EventHalt
     return EventContinue
 
 
@@ -28,6 +28,9 @@ Current commands include:
     Sets the flow table on a switch.
     dpid - a string dpid
     flows - a list of flow entries
+    The whole table is sent to the switch in one go.  If any flows are
+    bad or rejected by the switch, the error's data is a list of
+    {"index":<position in flows>,"message":...} for each of them.
   get_switch_desc
     Gets switch details.
     dpid - a string dpid
@@ -47,6 +50,7 @@ curl -i -X POST -d '{"method":"set_table","params":{"dpid":
 """
 
 import sys
+import struct
 from pox.lib.util import dpidToStr, strToDPID, fields_of
 from pox.core import core
 import pox.openflow.libopenflow_01 as of
@@ -62,6 +66,9 @@ class OFConRequest (object):
   Superclass for requests that send commands to a connection and
   wait for responses.
   """
+  # Seconds to wait for a response
+  timeout = 5
+
   def __init__ (self, con, *args, **kw):
     self._response = None
     self._sync = threading.Event()
@@ -80,7 +87,7 @@ class OFConRequest (object):
     pass
 
   def get_response (self):
-    if not self._sync.wait(5):
+    if not self._sync.wait(self.timeout):
       # Whoops; timeout!
       self._aborted = True
       self._finish()
@@ -139,7 +146,43 @@ class OFFlowStatsRequest (OFConRequest):
     self._finish(make_error("OpenFlow Error", data=event.asString()))
 
 
+_pack_xid = struct.Struct("!L").pack
+
+def pack_flows (flows):
+  """
+  Validates and packs flow entries for OFSetTableRequest
+
+  Each entry is converted with dict_to_flow_mod() and packed (with an xid
+  of zero for now), all in one pass.  Returns (packed, errors), where
+  errors lists {'index':i,'message':m} for every bad entry.
+  """
+  if not isinstance(flows, list):
+    return [], [{'index':None, 'message':'flows should be a list'}]
+  packed = []
+  errors = []
+  for i,flow in enumerate(flows):
+    try:
+      if not isinstance(flow, dict):
+        raise TypeError("flow should be an object")
+      fm = dict_to_flow_mod(flow)
+      fm.xid = 0
+      packed.append(fm.pack())
+    except Exception as e:
+      errors.append({'index':i, 'message':"%s: %s" % (type(e).__name__, e)})
+  return packed, errors
+
+
 class OFSetTableRequest (OFConRequest):
+  """
+  Replaces the flow table on a switch
+
+  Takes flow_mods already packed by pack_flows().  They're sent in a
+  single write along with a delete of the old table and are followed by
+  one barrier.  Each flow_mod gets an xid of its own so that errors from
+  the switch can be traced back to the flows which caused them.
+  """
+  # Extra seconds to wait per flow
+  timeout_per_flow = 0.001
 
   def clear_table (self, xid = None):
     fm = of.ofp_flow_mod()
@@ -153,34 +196,48 @@ class OFSetTableRequest (OFConRequest):
 
   def _init (self, flows = []):
     self.done = False
+    self.errors = []
 
-    xid = of.generate_xid()
-    self.xid = xid
-    self.clear_table(xid=xid)
+    clear = of.ofp_flow_mod(command = of.OFPFC_DELETE)
+    self.xid = clear.xid
+    data = [clear.pack()]
 
-    self.count = 1 + len(flows)
+    # xid -> index into flows
+    self._flow_xids = {}
+    for i,raw in enumerate(flows):
+      xid = of.generate_xid()
+      self._flow_xids[xid] = i
+      data.append(raw[:4] + _pack_xid(xid) + raw[8:])
 
-    for flow in flows:
-      fm = dict_to_flow_mod(flow)
-      fm.xid = xid
+    bar = of.ofp_barrier_request()
+    self.barrier_xid = bar.xid
+    data.append(bar.pack())
 
-      self._con.send(fm)
-      self._con.send(of.ofp_barrier_request(xid=xid))
+    self._con.send(b''.join(data))
 
   def _handle_BarrierIn (self, event):
-    if event.ofp.xid != self.xid: return
+    if event.ofp.xid != self.barrier_xid: return
     if self.done: return
-    self.count -= 1
-    if self.count <= 0:
+    self.done = True
+    if self.errors:
+      self.clear_table()
+      self.errors.sort(key=lambda e: e['index'])
+      self._finish(make_error("OpenFlow Error", data=self.errors))
+    else:
       self._result('flowmod', True)
-      self.done = True
 
   def _handle_ErrorIn (self, event):
-    if event.ofp.xid != self.xid: return
     if self.done: return
-    self.clear_table()
-    self.done = True
-    self._finish(make_error("OpenFlow Error", data=event.asString()))
+    xid = event.ofp.xid
+    if xid == self.xid:
+      # Couldn't even clear the table
+      self.clear_table()
+      self.done = True
+      self._finish(make_error("OpenFlow Error", data=event.asString()))
+    elif xid in self._flow_xids:
+      # The switch carries on with the rest; report them all at the barrier
+      self.errors.append({'index':self._flow_xids[xid],
+                          'message':event.asString()})
 
 
 class OFRequestHandler (JSONRPCHandler):
@@ -191,7 +248,14 @@ class OFRequestHandler (JSONRPCHandler):
     if con is None:
       return make_error("No such switch")
 
-    return OFSetTableRequest(con, flows).get_response()
+    flows,errors = pack_flows(flows)
+    if errors:
+      return make_error("Invalid flows", code=self.ERR_INVALID_PARAMS,
+                        data=errors)
+
+    r = OFSetTableRequest(con, flows)
+    r.timeout += len(flows) * r.timeout_per_flow
+    return r.get_response()
 
   def _exec_get_switch_desc (self, dpid):
     dpid = strToDPID(dpid)
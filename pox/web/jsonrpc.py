@@ -183,6 +183,34 @@ class JSONRPCHandler (SplitRequestHandler):
                            'code':self.ERR_INTERNAL_ERROR}
       return response
 
+  def _read_body (self):
+    """
+    Reads the request body
+
+    Besides plain bodies, this takes chunked ones, so clients can stream
+    big requests (like large flow tables) without sizing them up front.
+    """
+    if self.headers.get("Expect", "").lower() == "100-continue":
+      self.wfile.write("%s 100 Continue\r\n\r\n" % (self.protocol_version,))
+      self.wfile.flush()
+
+    if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+      chunks = []
+      while True:
+        size = int(self.rfile.readline().split(";", 1)[0].strip(), 16)
+        if size == 0: break
+        chunks.append(self.rfile.read(size))
+        self.rfile.readline() # The CRLF ending the chunk
+      # Skip any trailers
+      while self.rfile.readline().strip():
+        pass
+      return ''.join(chunks)
+
+    l = self.headers.get("Content-Length", "")
+    if l == "":
+      return self.rfile.read()
+    return self.rfile.read(int(l))
+
   def do_POST (self):
     if not self._do_auth():
       return
@@ -228,14 +256,8 @@ class JSONRPCHandler (SplitRequestHandler):
         return False
       return True
 
-    l = self.headers.get("Content-Length", "")
-    data = ''
-    if l == "":
-      data = self.rfile.read()
-    else:
-      data = self.rfile.read(int(l))
     try:
-      data = json.loads(data)
+      data = json.loads(self._read_body())
     except:
       response = {}
       response['error'] = {'code':self.ERR_PARSE_ERROR,
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+#
+# This file is part of POX.
+#
+# POX is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# POX is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with POX.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark for address handling on the packet path
+
+Parses UDP/IPv4 frames exchanged between a set of hosts, builds an exact
+ofp_match for each and checks it against a handful of wildcarded rules
+with matches_with_wildcards().  Also reports the raw cost of building
+EthAddr/IPAddr objects through their constructors.
+"""
+
+import os.path
+import sys
+import time
+import random
+import struct
+from optparse import OptionParser
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+import pox.lib.packet as pkt
+import pox.openflow.libopenflow_01 as of
+from pox.lib.addresses import EthAddr, IPAddr
+
+
+def make_frames (hosts, count):
+  frames = []
+  for i in xrange(count):
+    a = random.randrange(hosts)
+    b = random.randrange(hosts)
+    u = pkt.udp(srcport=1000 + a, dstport=2000 + b, payload="x" * 18)
+    ip = pkt.ipv4(srcip=IPAddr(0x0a000000 + a), dstip=IPAddr(0x0a000000 + b),
+                  protocol=pkt.ipv4.UDP_PROTOCOL, payload=u)
+    e = pkt.ethernet(src=EthAddr(struct.pack("!HI", 2, a)),
+                     dst=EthAddr(struct.pack("!HI", 2, b)),
+                     type=pkt.ethernet.IP_TYPE, payload=ip)
+    frames.append(e.pack())
+  return frames
+
+
+def make_rules ():
+  rules = []
+  for i in range(4):
+    m = of.ofp_match(dl_type=pkt.ethernet.IP_TYPE)
+    m.nw_dst = "10.0.%i.0/24" % (i,)
+    rules.append(m)
+  m = of.ofp_match(dl_type=pkt.ethernet.IP_TYPE, nw_proto=17)
+  m.nw_src = "10.0.0.0/8"
+  rules.append(m)
+  return rules
+
+
+def run_parse (frames):
+  start = time.time()
+  for f in frames:
+    pkt.ethernet(f).next
+  return len(frames) / (time.time() - start)
+
+
+def run_match (frames, rules):
+  hits = 0
+  start = time.time()
+  for f in frames:
+    m = of.ofp_match.from_packet(pkt.ethernet(f))
+    for r in rules:
+      if r.matches_with_wildcards(m):
+        hits += 1
+  return len(frames) / (time.time() - start)
+
+
+def run_ctor (count):
+  raws = [struct.pack("!HI", 2, i) for i in xrange(256)] * (count // 256)
+  start = time.time()
+  for r in raws:
+    EthAddr(r)
+  eth = len(raws) / (time.time() - start)
+  ints = range(0x0a000000, 0x0a000100) * (count // 256)
+  start = time.time()
+  for i in ints:
+    IPAddr(i)
+  ip = len(ints) / (time.time() - start)
+  return eth, ip
+
+
+def main ():
+  parser = OptionParser()
+  parser.add_option("--hosts", type="int", default=256,
+                    help="number of distinct hosts in the traffic")
+  parser.add_option("--frames", type="int", default=50000)
+  parser.add_option("--samples", type="int", default=3)
+  options, args = parser.parse_args()
+
+  random.seed(0)
+  frames = make_frames(options.hosts, options.frames)
+  rules = make_rules()
+
+  parse = max(run_parse(frames) for _ in range(options.samples))
+  match = max(run_match(frames, rules) for _ in range(options.samples))
+  ctor = [run_ctor(options.frames) for _ in range(options.samples)]
+
+  print "%-28s %12.0f" % ("parse frames/s", parse)
+  print "%-28s %12.0f" % ("parse+match frames/s", match)
+  print "%-28s %12.0f" % ("EthAddr(raw) /s", max(c[0] for c in ctor))
+  print "%-28s %12.0f" % ("IPAddr(int) /s", max(c[1] for c in ctor))
+
+
+if __name__ == '__main__':
+  main()
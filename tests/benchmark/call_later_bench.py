@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+#
+# This file is part of POX.
+#
+# POX is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# POX is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with POX.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark for calling into a recoco Scheduler from other threads
+
+Has a number of producer threads (as the web server's request threads
+would be) hand calls to the scheduler with callLater() as fast as they
+can, and reports the number of calls per second that get run.  Also
+measures the latency from callLater() to the call running when the
+scheduler is otherwise idle.
+"""
+
+import os.path
+import sys
+import threading
+import time
+from optparse import OptionParser
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from pox.lib.recoco import Scheduler
+
+
+def throughput (sched, producers, calls, batch):
+  count = [0]
+  done = threading.Event()
+  total = producers * calls
+  def f ():
+    count[0] += 1
+    if count[0] == total: done.set()
+
+  def produce ():
+    if batch > 1:
+      for i in xrange(0, calls, batch):
+        sched.callLaterMany([f] * batch)
+    else:
+      for i in xrange(calls):
+        sched.callLater(f)
+
+  threads = [threading.Thread(target=produce) for i in xrange(producers)]
+  t = time.time()
+  for th in threads: th.start()
+  for th in threads: th.join()
+  done.wait(60)
+  return total / (time.time() - t)
+
+
+def latency (sched, samples):
+  results = []
+  done = threading.Event()
+  def f (sent):
+    results.append(time.time() - sent)
+    done.set()
+  for i in xrange(samples):
+    done.clear()
+    sched.callLater(f, time.time())
+    done.wait(5)
+    time.sleep(0.002)
+  results.sort()
+  return results[len(results) // 2], results[int(len(results) * 0.99)]
+
+
+def main ():
+  parser = OptionParser()
+  parser.add_option("--producers", default="1,4,16")
+  parser.add_option("--calls", type="int", default=20000,
+                    help="Calls per producer")
+  parser.add_option("--batch", type="int", default=1,
+                    help="Use callLaterMany() with batches of this size")
+  parser.add_option("--samples", type="int", default=500)
+  options,_ = parser.parse_args()
+
+  sched = Scheduler(daemon=True)
+
+  print "%-10s %14s" % ("producers", "calls/sec")
+  for n in [int(x) for x in options.producers.split(",")]:
+    calls = options.calls
+    if options.batch > 1: calls -= calls % options.batch
+    r = throughput(sched, n, calls, options.batch)
+    print "%-10i %14.0f" % (n, r)
+
+  median, p99 = latency(sched, options.samples)
+  print
+  print "wake latency: median %.1f us, 99th percentile %.1f us" % (
+      median * 1e6, p99 * 1e6)
+
+  sched.quit()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+#
+# This file is part of POX.
+#
+# POX is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# POX is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with POX.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark for the Internet checksum
+
+For a range of sizes, reports checksums per second over a raw buffer and
+UDP/IPv4 packets packed per second (which checksums both the IP header
+and the UDP segment under its pseudo-header).
+"""
+
+import os.path
+import sys
+import time
+from optparse import OptionParser
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+import pox.lib.packet as pkt
+from pox.lib.packet.packet_utils import checksum
+from pox.lib.addresses import IPAddr
+
+
+def run_raw (size, count):
+  data = b'\xa5' * size
+  start = time.time()
+  for i in xrange(count):
+    checksum(data)
+  return count / (time.time() - start)
+
+
+def run_pack (size, count):
+  u = pkt.udp(srcport=1000, dstport=2000, payload=b'\xa5' * size)
+  ip = pkt.ipv4(srcip=IPAddr("10.0.0.1"), dstip=IPAddr("10.0.0.2"),
+                protocol=pkt.ipv4.UDP_PROTOCOL, payload=u)
+  start = time.time()
+  for i in xrange(count):
+    ip.pack()
+  return count / (time.time() - start)
+
+
+def main ():
+  parser = OptionParser()
+  parser.add_option("--sizes", default="20,64,256,576,1500,9000",
+                    help="comma-separated buffer/payload sizes")
+  parser.add_option("--count", type="int", default=20000)
+  parser.add_option("--samples", type="int", default=3)
+  options, args = parser.parse_args()
+
+  try:
+    from pox.lib.packet import inet_checksum
+    engine = "numpy" if inet_checksum.numpy is not None else "array+sum"
+  except ImportError:
+    engine = "legacy"
+  print "engine:", engine
+
+  print "%6s %14s %10s %14s" % ("bytes", "checksums/s", "MB/s", "udp packs/s")
+  for size in [int(x) for x in options.sizes.split(",")]:
+    raw = max(run_raw(size, options.count) for _ in range(options.samples))
+    pack = max(run_pack(size, options.count // 4)
+               for _ in range(options.samples))
+    print "%6i %14.0f %10.1f %14.0f" % (size, raw, raw * size / 1e6, pack)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+#
+# This file is part of POX.
+#
+# POX is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# POX is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with POX.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark for discovery's handling of LLDP packet_ins
+
+Feeds PacketIn events straight to openflow.discovery and reports how many
+it handles per second for our own probes (links already known, which is
+the steady state), for LLDP from some other sender, and for ordinary
+traffic which discovery just has to pass on.
+"""
+
+import logging
+import os.path
+import random
+import sys
+import time
+from optparse import OptionParser
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from pox.core import core
+import pox.openflow.libopenflow_01 as of
+from pox.openflow import PacketIn
+from pox.openflow.discovery import Discovery, LLDPSender
+from pox.lib.packet import ethernet, ipv4
+from pox.lib.addresses import EthAddr, IPAddr
+
+
+class FakeNexus (object):
+  def __init__ (self, dpids):
+    self.connections = dict((dpid, None) for dpid in dpids)
+
+
+class FakeConnection (object):
+  def __init__ (self, dpid):
+    self.dpid = dpid
+    self.connect_time = 0
+
+
+def probes (sender, dpids, ports):
+  """
+  Returns a list of (dpid, port, frame) for probes from sender
+  """
+  addr = EthAddr("00:00:00:00:00:01")
+  r = []
+  for dpid in dpids:
+    for port in range(1, ports + 1):
+      sender.add_port(dpid, port, addr, set_timer = False)
+      for item in sender._packets[dpid][port]:
+        r.append((dpid, port, item.packet[24:]))
+  return r
+
+
+def make_events (frames, count, connections):
+  rng = random.Random(0)
+  events = []
+  for i in xrange(count):
+    dpid, port, frame = rng.choice(frames)
+    # Pretend everything is wired to the next switch up
+    con = connections[dpid % len(connections) + 1]
+    events.append(PacketIn(con, of.ofp_packet_in(in_port = port,
+                                                 data = frame)))
+  return events
+
+
+def run (discovery, events):
+  handler = discovery._handle_openflow_PacketIn
+  start = time.time()
+  for e in events:
+    handler(e)
+  return len(events) / (time.time() - start)
+
+
+def main ():
+  parser = OptionParser()
+  parser.add_option("--switches", type="int", default=100)
+  parser.add_option("--ports", type="int", default=48)
+  parser.add_option("--events", type="int", default=100000)
+  options, args = parser.parse_args()
+  logging.disable(logging.WARNING)
+
+  dpids = range(1, options.switches + 1)
+  # Switches being probed by someone else (another controller, say)
+  foreign_dpids = range(1001, 1001 + options.switches)
+  core.register("openflow", FakeNexus(dpids + foreign_dpids))
+  connections = dict((dpid, FakeConnection(dpid)) for dpid in dpids)
+  discovery = Discovery(explicit_drop = False, link_timeout = 3600)
+
+  ours = probes(discovery._sender, dpids, options.ports)
+  foreign = probes(LLDPSender(5), foreign_dpids, options.ports)
+  ip = ethernet(src=EthAddr("00:00:00:00:00:01"),
+                dst=EthAddr("00:00:00:00:00:02"), type=ethernet.IP_TYPE,
+                payload=ipv4(srcip=IPAddr("10.0.0.1"),
+                             dstip=IPAddr("10.0.0.2"), payload=b'x' * 32))
+  other = [(1, 1, ip.pack())]
+
+  # Learn the links first, so we measure the steady state
+  run(discovery, make_events(ours, len(ours) * 4, connections))
+
+  print "%-10s %12s" % ("packets", "per sec")
+  for name, frames in (("ours", ours), ("foreign", foreign),
+                       ("non-lldp", other)):
+    events = make_events(frames, options.events, connections)
+    print "%-10s %12.0f" % (name, run(discovery, events))
+  print "links:", len(discovery.adjacency)
+  core.quit()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+#
+# This file is part of POX.
+#
+# POX is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# POX is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with POX.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark for FlowTable insertion and lookup as the table grows
+
+Fills a table with a mix of exact-match entries (as a reactive
+forwarding component would install) and a few kinds of wildcarded ones
+(by destination MAC, by destination subnet, by in_port), then times
+entry_for_packet() for packets that hit and miss, and a strict
+matching_entries() as used by flow_mods.
+"""
+
+import os.path
+import random
+import sys
+import time
+from optparse import OptionParser
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+import pox.openflow.libopenflow_01 as of
+from pox.openflow.flow_table import FlowTable, TableEntry
+from pox.lib.packet import ethernet, ipv4, udp
+from pox.lib.addresses import EthAddr, IPAddr
+
+
+def mac (i):
+  return EthAddr("02:00:%02x:%02x:%02x:%02x" % ((i >> 24) & 0xff,
+      (i >> 16) & 0xff, (i >> 8) & 0xff, i & 0xff))
+
+def ip (i):
+  return IPAddr(0x0a000000 | (i & 0xffFFff))
+
+def make_packet (i):
+  e = ethernet(src=mac(i), dst=mac(i+1), type=ethernet.IP_TYPE,
+               payload=ipv4(srcip=ip(i), dstip=ip(i+1), protocol=17,
+                            payload=udp(srcport=1000, dstport=2000,
+                                        payload="x")))
+  return ethernet(e.pack())
+
+
+def fill (table, size, rng):
+  packets = []
+  t = time.time()
+  for i in xrange(size):
+    kind = rng.random()
+    if kind < 0.7:
+      p = make_packet(i)
+      packets.append(p)
+      m = of.ofp_match.from_packet(p, 1)
+    elif kind < 0.8:
+      m = of.ofp_match(dl_dst=mac(i))
+    elif kind < 0.9:
+      m = of.ofp_match(dl_type=0x800, nw_dst="10.%i.%i.0/24"
+                       % ((i >> 8) & 0xff, i & 0xff))
+    else:
+      m = of.ofp_match(in_port=i % 48 + 1, dl_src=mac(i))
+    table.add_entry(TableEntry(priority=rng.randint(1, 10), match=m,
+                               actions=[of.ofp_action_output(port=2)]))
+  return time.time() - t, packets
+
+
+def main ():
+  parser = OptionParser()
+  parser.add_option("--sizes", default="1000,10000,100000")
+  parser.add_option("--lookups", type="int", default=20000)
+  options,_ = parser.parse_args()
+
+  rng = random.Random(0)
+  print "%8s %12s %14s %14s %14s" % ("entries", "adds/sec", "hit usec",
+                                     "miss usec", "strict usec")
+  for size in [int(s) for s in options.sizes.split(",")]:
+    table = FlowTable()
+    add_time,packets = fill(table, size, rng)
+
+    hits = [rng.choice(packets) for i in xrange(1000)]
+    misses = [make_packet(size * 10 + i) for i in xrange(1000)]
+    n = options.lookups
+
+    t = time.time()
+    for i in xrange(n):
+      table.entry_for_packet(hits[i % 1000], 1)
+    hit = (time.time() - t) / n
+
+    t = time.time()
+    for i in xrange(n):
+      table.entry_for_packet(misses[i % 1000], 1)
+    miss = (time.time() - t) / n
+
+    entries = [rng.choice(table.entries) for i in xrange(1000)]
+    t = time.time()
+    for i in xrange(n):
+      e = entries[i % 1000]
+      table.matching_entries(e.match, e.priority, strict=True)
+    strict = (time.time() - t) / n
+
+    print "%8i %12.0f %14.1f %14.1f %14.1f" % (size, size / add_time,
+        hit * 1e6, miss * 1e6, strict * 1e6)
+
+
+if __name__ == '__main__':
+  main()
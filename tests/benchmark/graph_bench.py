@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+#
+# This file is part of POX.
+#
+# POX is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# POX is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with POX.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark for link queries on pox.lib.graph.Graph
+
+Builds a random topology of switches with a fixed number of ports each,
+then times find_links()/has_link() for queries which pin a node, a node
+and port, or both ends, as well as one which has to look at every link.
+"""
+
+import os.path
+import sys
+import time
+import random
+from optparse import OptionParser
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from pox.lib.graph.graph import Graph, Node, Is, Equal, And, Port, F
+
+
+class Switch (Node):
+  def __init__ (self, num):
+    self.num = num
+
+
+def make_graph (switches, ports):
+  g = Graph()
+  nodes = [Switch(i) for i in range(switches)]
+  for n in nodes:
+    g.add(n)
+  for n in nodes:
+    for p in range(1, ports + 1):
+      if g.port_for_node(n, p) is not None: continue
+      other = random.choice(nodes)
+      if other is n: continue
+      for op in range(1, ports + 1):
+        if g.port_for_node(other, op) is None:
+          g.link((n, p), (other, op))
+          break
+  return g, nodes
+
+
+def run (count, query):
+  start = time.time()
+  for i in xrange(count):
+    query(i)
+  return count / (time.time() - start)
+
+
+def main ():
+  parser = OptionParser()
+  parser.add_option("--switches", type="int", default=500)
+  parser.add_option("--ports", type="int", default=8)
+  parser.add_option("--queries", type="int", default=2000)
+  parser.add_option("--samples", type="int", default=3)
+  options, args = parser.parse_args()
+
+  random.seed(0)
+  start = time.time()
+  g, nodes = make_graph(options.switches, options.ports)
+  build = time.time() - start
+  links = g.find_links()
+  pairs = [(l[0][0], l[1][0]) for l in links]
+
+  def node (i):
+    g.find_links(Is(nodes[i % len(nodes)]))
+  def node_port (i):
+    g.find_links(And(Is(nodes[i % len(nodes)]),
+                     Equal(Port(), i % options.ports + 1)))
+  def both_ends (i):
+    a,b = pairs[i % len(pairs)]
+    g.has_link(Is(a), Is(b))
+  def scan (i):
+    g.find_links(Equal(F('num'), i % len(nodes)))
+
+  print "%-28s %12i" % ("links", len(links))
+  print "%-28s %12.3f" % ("build s", build)
+  for name,query,count in (("pinned node /s", node, options.queries),
+                           ("pinned node+port /s", node_port,
+                            options.queries),
+                           ("has_link both ends /s", both_ends,
+                            options.queries),
+                           ("unpinned field /s", scan,
+                            max(1, options.queries // 20))):
+    rate = max(run(count, query) for _ in range(options.samples))
+    print "%-28s %12.1f" % (name, rate)
+
+
+if __name__ == '__main__':
+  main()
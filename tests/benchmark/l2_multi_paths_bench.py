@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+#
+# This file is part of POX.
+#
+# POX is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# POX is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with POX.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark for l2_multi's shortest path computation on fat-tree topologies
+
+Builds a k-ary fat-tree (5k^2/4 switches) and times, for both the old
+Floyd-Warshall recomputation and the incremental PathEngine, how long it
+takes to get paths between random edge switches again after a link
+goes down and comes back up.
+"""
+
+import os.path
+import random
+import sys
+import time
+from collections import defaultdict
+from optparse import OptionParser
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from pox.forwarding.l2_multi import PathEngine
+
+
+def fat_tree (k):
+  """
+  Returns (edge switches, links) of a k-ary fat-tree
+  """
+  half = k // 2
+  core = [("core", i) for i in range(half * half)]
+  edges = []
+  links = []
+  for pod in range(k):
+    aggs = [("agg", pod, i) for i in range(half)]
+    pod_edges = [("edge", pod, i) for i in range(half)]
+    edges.extend(pod_edges)
+    for i,agg in enumerate(aggs):
+      for e in pod_edges:
+        links.append((agg, e))
+      for j in range(half):
+        links.append((core[i * half + j], agg))
+  return edges, links
+
+
+class FloydWarshall (object):
+  """
+  The way l2_multi used to do it: recompute everything on any change
+  """
+  def __init__ (self):
+    self.adjacency = defaultdict(lambda:defaultdict(lambda:None))
+    self.path_map = defaultdict(lambda:defaultdict(lambda:(None,None)))
+
+  def add_link (self, a, b):
+    self.adjacency[a][b] = 1
+    self.adjacency[b][a] = 1
+    self.path_map.clear()
+
+  def remove_link (self, a, b):
+    del self.adjacency[a][b]
+    del self.adjacency[b][a]
+    self.path_map.clear()
+
+  def _calc_paths (self):
+    path_map = self.path_map
+    sws = self.adjacency.keys()
+    for k in sws:
+      for j,port in self.adjacency[k].iteritems():
+        if port is None: continue
+        path_map[k][j] = (1,None)
+      path_map[k][k] = (0,None)
+    for k in sws:
+      for i in sws:
+        for j in sws:
+          if path_map[i][k][0] is not None:
+            if path_map[k][j][0] is not None:
+              ikj_dist = path_map[i][k][0]+path_map[k][j][0]
+              if path_map[i][j][0] is None or ikj_dist < path_map[i][j][0]:
+                path_map[i][j] = (ikj_dist, k)
+
+  def _get_raw_path (self, src, dst):
+    if len(self.path_map) == 0: self._calc_paths()
+    if src is dst: return []
+    if self.path_map[src][dst][0] is None: return None
+    intermediate = self.path_map[src][dst][1]
+    if intermediate is None: return []
+    return (self._get_raw_path(src, intermediate) + [intermediate] +
+            self._get_raw_path(intermediate, dst))
+
+  def get_path (self, src, dst):
+    p = self._get_raw_path(src, dst)
+    if p is None: return None
+    return [src] + p + [dst]
+
+
+def run (engine, edges, links, changes, lookups):
+  rng = random.Random(0)
+  t = time.time()
+  for a,b in links:
+    engine.add_link(a, b)
+  engine.get_path(edges[0], edges[-1])
+  build = time.time() - t
+
+  pairs = [rng.sample(edges, 2) for i in range(lookups)]
+  t = time.time()
+  for i in range(changes):
+    a,b = rng.choice(links)
+    engine.remove_link(a, b)
+    for src,dst in pairs:
+      assert engine.get_path(src, dst) is not None
+    engine.add_link(a, b)
+    for src,dst in pairs:
+      engine.get_path(src, dst)
+  change = (time.time() - t) / (changes * 2)
+  return build, change
+
+
+def main ():
+  parser = OptionParser()
+  parser.add_option("--k", default="4,6,8,10")
+  parser.add_option("--changes", type="int", default=3)
+  parser.add_option("--lookups", type="int", default=100)
+  parser.add_option("--skip-fw", action="store_true", default=False,
+                    help="Only run the incremental engine")
+  options,_ = parser.parse_args()
+
+  print "%-4s %-9s %-14s %12s %16s" % ("k", "switches", "engine",
+                                       "build (ms)", "per change (ms)")
+  for k in [int(x) for x in options.k.split(",")]:
+    edges, links = fat_tree(k)
+    switches = 5 * k * k // 4
+    engines = [("incremental", PathEngine)]
+    if not options.skip_fw: engines.insert(0, ("floyd-warshall",
+                                               FloydWarshall))
+    for name,engine in engines:
+      build, change = run(engine(), edges, links, options.changes,
+                          options.lookups)
+      print "%-4i %-9i %-14s %12.2f %16.2f" % (k, switches, name,
+                                               build * 1000, change * 1000)
+
+
+if __name__ == '__main__':
+  main()
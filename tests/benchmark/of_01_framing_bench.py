@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+#
+# This file is part of POX.
+#
+# POX is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# POX is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with POX.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Microbenchmark for of_01's OpenFlow framing (Connection.read)
+
+Feeds a stream of switch-to-controller messages through a Connection on
+a fake socket and reports messages/second.  The stream is either read
+from a file of raw OpenFlow bytes (--stream) or generated: a mix of
+packet_ins of various sizes, echo requests, barrier replies, port status
+and flow removed messages.  --save writes the generated stream out so
+that runs can be repeated against the same data.
+
+For comparison, the same stream is also framed the way of_01 used to do
+it (appending each read to a string and handing the whole buffer to the
+unpacker).  Handlers are replaced with no-ops so that only framing and
+unpacking are measured.
+"""
+
+import os.path
+import random
+import sys
+import time
+from optparse import OptionParser
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+import pox.openflow.libopenflow_01 as of
+import pox.openflow.of_01 as of_01
+from pox.lib.addresses import EthAddr
+
+
+def generate_stream (count, seed = 0):
+  rng = random.Random(seed)
+  port = of.ofp_phy_port(port_no=1, hw_addr=EthAddr("00:00:00:00:00:01"),
+                         name="eth1")
+  fixed = [
+    of.ofp_echo_request(xid=1).pack(),
+    of.ofp_barrier_reply(xid=2).pack(),
+    of.ofp_port_status(xid=3, reason=of.OFPPR_MODIFY, desc=port).pack(),
+    of.ofp_flow_removed(xid=4, match=of.ofp_match(in_port=1)).pack(),
+  ]
+  packet_ins = [of.ofp_packet_in(xid=5, in_port=1, buffer_id=7,
+                                 data=b'\xaa' * size).pack()
+                for size in (60, 128, 512, 1500)]
+  out = []
+  for i in xrange(count):
+    if rng.random() < 0.8:
+      out.append(rng.choice(packet_ins))
+    else:
+      out.append(rng.choice(fixed))
+  return b''.join(out)
+
+
+class StreamSocket (object):
+  def __init__ (self, data):
+    self.data = data
+    self.offset = 0
+
+  def recv (self, size):
+    d = self.data[self.offset:self.offset+size]
+    self.offset += len(d)
+    return d
+
+  def recv_into (self, buf, size):
+    d = self.data[self.offset:self.offset+size]
+    self.offset += len(d)
+    buf[:len(d)] = d
+    return len(d)
+
+  def send (self, data):
+    return len(data)
+
+
+def legacy_read (con, buf):
+  """
+  Framing as of_01 used to do it
+  """
+  d = con.sock.recv(con.read_size)
+  if len(d) == 0:
+    return False, buf
+  buf += d
+  buf_len = len(buf)
+  offset = 0
+  while buf_len - offset >= 8:
+    ofp_type = ord(buf[offset+1])
+    msg_length = ord(buf[offset+2]) << 8 | ord(buf[offset+3])
+    if buf_len - offset < msg_length: break
+    new_offset,msg = of_01.unpackers[ofp_type](buf, offset)
+    offset = new_offset
+    of_01.handlers[ofp_type](con, msg)
+  if offset != 0:
+    buf = buf[offset:]
+  return True, buf
+
+
+def run (data, read_size, legacy):
+  con = of_01.Connection(StreamSocket(b''))
+  con.read_size = read_size
+  con.sock = StreamSocket(data)
+  buf = b''
+  start = time.time()
+  if legacy:
+    more = True
+    while more:
+      more,buf = legacy_read(con, buf)
+  else:
+    while con.read():
+      pass
+  return time.time() - start
+
+
+def main ():
+  parser = OptionParser()
+  parser.add_option("--count", type="int", default=100000)
+  parser.add_option("--stream", help="file of raw OpenFlow messages")
+  parser.add_option("--save", help="write the generated stream here")
+  parser.add_option("--read-sizes", dest="read_sizes",
+                    default="2048,65536")
+  options,_ = parser.parse_args()
+
+  if options.stream:
+    data = open(options.stream, "rb").read()
+  else:
+    data = generate_stream(options.count)
+    if options.save:
+      open(options.save, "wb").write(data)
+
+  count = [0]
+  def noop (con, msg):
+    count[0] += 1
+  of_01.handlers[:] = [noop] * len(of_01.handlers)
+
+  print "%i bytes" % (len(data),)
+  print "%-8s %10s %12s" % ("framing", "read size", "msgs/sec")
+  for read_size in [int(x) for x in options.read_sizes.split(",")]:
+    for legacy in (True, False):
+      count[0] = 0
+      t = run(data, read_size, legacy)
+      print "%-8s %10i %12.0f" % ("legacy" if legacy else "current",
+                                  read_size, count[0] / t)
+
+
+if __name__ == '__main__':
+  main()
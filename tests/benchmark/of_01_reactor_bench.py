@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+#
+# This file is part of POX.
+#
+# POX is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# POX is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with POX.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measures controller CPU against the number of connected switches
+
+For each reactor and switch count, this starts POX in a subprocess,
+connects the given number of fake switches (which complete the OpenFlow
+handshake and then each send echo requests at a fixed rate), and reports
+the CPU time the controller process used per wall-clock second.
+
+Linux only (it reads /proc).  Run from the top of the tree:
+  ./tests/benchmark/of_01_reactor_bench.py --switches=10,100,400
+"""
+
+import itertools
+import os
+import os.path
+import select
+import socket
+import struct
+import subprocess
+import sys
+import time
+from optparse import OptionParser
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+import pox.openflow.libopenflow_01 as of
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+_header = struct.Struct("!BBHL")
+
+
+class FakeSwitch (object):
+  """
+  Just enough of a switch to get through the of_01 handshake
+  """
+  def __init__ (self, dpid, port):
+    self.dpid = dpid
+    self.sock = socket.create_connection(("127.0.0.1", port))
+    self.sock.setblocking(0)
+    self.buf = b''
+    self.out = b''
+    self.up = False
+    self.echoes = 0
+    self.send(of.ofp_hello(xid=0).pack())
+
+  def fileno (self):
+    return self.sock.fileno()
+
+  def send (self, data):
+    self.out += data
+    self.flush()
+
+  def flush (self):
+    try:
+      l = self.sock.send(self.out)
+      self.out = self.out[l:]
+    except socket.error:
+      pass
+
+  def read (self):
+    try:
+      d = self.sock.recv(65536)
+    except socket.error:
+      return
+    if not d:
+      raise RuntimeError("Controller closed connection")
+    self.buf += d
+    while len(self.buf) >= 8:
+      _,t,length,xid = _header.unpack_from(self.buf, 0)
+      if len(self.buf) < length: break
+      self.buf = self.buf[length:]
+      if t == of.OFPT_FEATURES_REQUEST:
+        self.send(of.ofp_features_reply(xid=xid, datapath_id=self.dpid,
+                                        ports=[]).pack())
+      elif t == of.OFPT_BARRIER_REQUEST:
+        self.send(of.ofp_barrier_reply(xid=xid).pack())
+        self.up = True
+      elif t == of.OFPT_ECHO_REPLY:
+        self.echoes += 1
+
+  def close (self):
+    self.sock.close()
+
+
+def cpu_seconds (pid):
+  with open("/proc/%i/stat" % (pid,)) as f:
+    fields = f.read().rsplit(")", 1)[1].split()
+  ticks = os.sysconf(os.sysconf_names['SC_CLK_TCK'])
+  return (int(fields[11]) + int(fields[12])) / float(ticks)
+
+
+def run_one (reactor, count, rate, duration, port):
+  pox = subprocess.Popen([sys.executable, os.path.join(ROOT, "pox.py"),
+                          "openflow.of_01", "--port=%i" % (port,),
+                          "--reactor=" + reactor,
+                          "log.level", "--WARNING"], cwd=ROOT)
+  switches = []
+  try:
+    time.sleep(1.5)
+    for dpid in xrange(1, count+1):
+      switches.append(FakeSwitch(dpid, port))
+
+    def pump (until, send_echo=False):
+      echo = of.ofp_echo_request(xid=1).pack()
+      interval = 1.0 / rate
+      next_send = time.time()
+      while time.time() < until:
+        now = time.time()
+        if send_echo and now >= next_send:
+          for s in switches:
+            s.send(echo)
+          next_send += interval
+        r,_,_ = select.select(switches, [], [],
+                              max(0, min(next_send - now, until - now)))
+        for s in r:
+          s.read()
+
+    # Finish handshakes
+    deadline = time.time() + 30
+    while not all(s.up for s in switches):
+      if time.time() > deadline:
+        raise RuntimeError("Handshakes didn't complete")
+      pump(time.time() + 0.1)
+
+    start_cpu = cpu_seconds(pox.pid)
+    start = time.time()
+    pump(start + duration, send_echo=True)
+    elapsed = time.time() - start
+    used = cpu_seconds(pox.pid) - start_cpu
+    echoes = sum(s.echoes for s in switches)
+    return used / elapsed, echoes / elapsed
+  finally:
+    for s in switches:
+      s.close()
+    pox.terminate()
+    pox.wait()
+
+
+def main ():
+  parser = OptionParser()
+  parser.add_option("--switches", default="10,50,100,200,400")
+  parser.add_option("--reactors", default="select,epoll")
+  parser.add_option("--rate", type="float", default=20,
+                    help="echo requests per switch per second")
+  parser.add_option("--duration", type="float", default=5)
+  parser.add_option("--port", type="int", default=16633)
+  options,_ = parser.parse_args()
+
+  counts = [int(x) for x in options.switches.split(",")]
+  reactors = options.reactors.split(",")
+  ports = itertools.count(options.port)
+
+  print "%-8s %8s %10s %12s" % ("reactor", "switches", "cpu", "echoes/sec")
+  for reactor in reactors:
+    for count in counts:
+      cpu,eps = run_one(reactor, count, options.rate, options.duration,
+                        next(ports))
+      print "%-8s %8i %9.1f%% %12.0f" % (reactor, count, cpu * 100, eps)
+      sys.stdout.flush()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+#
+# This file is part of POX.
+#
+# POX is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# POX is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with POX.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Microbenchmark for ofp_match
+
+Times the operations forwarding components do for nearly every
+packet_in: building an exact match with from_packet() and packing it
+into a flow_mod, plus unpack/clone/compare.  The packets are a mix of
+TCP, UDP, ICMP and ARP.  Run it against two revisions to compare them.
+"""
+
+import os.path
+import sys
+import timeit
+from optparse import OptionParser
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+import pox.openflow.libopenflow_01 as of
+from pox.lib.packet import ethernet, ipv4, tcp, udp, icmp, echo, arp
+from pox.lib.addresses import EthAddr, IPAddr
+
+
+def make_packets ():
+  def eth (t, payload):
+    return ethernet(src=EthAddr("00:00:00:00:00:01"),
+                    dst=EthAddr("00:00:00:00:00:02"), type=t,
+                    payload=payload)
+  def ip (proto, payload):
+    return ipv4(srcip=IPAddr("10.0.0.1"), dstip=IPAddr("10.0.0.2"),
+                protocol=proto, payload=payload)
+  t = tcp(srcport=1234, dstport=80)
+  t.off = 5
+  packets = [
+    eth(ethernet.IP_TYPE, ip(ipv4.TCP_PROTOCOL, t)),
+    eth(ethernet.IP_TYPE, ip(ipv4.UDP_PROTOCOL,
+                             udp(srcport=1234, dstport=53, payload="x"))),
+    eth(ethernet.IP_TYPE, ip(ipv4.ICMP_PROTOCOL, icmp(payload=echo()))),
+    eth(ethernet.ARP_TYPE, arp(protosrc=IPAddr("10.0.0.1"),
+                               protodst=IPAddr("10.0.0.2"))),
+  ]
+  # Reparse them so they look like they came off the wire
+  return [ethernet(p.pack()) for p in packets]
+
+
+def main ():
+  parser = OptionParser()
+  parser.add_option("--count", type="int", default=20000,
+                    help="iterations per packet")
+  options,_ = parser.parse_args()
+  n = options.count
+
+  packets = make_packets()
+  matches = [of.ofp_match.from_packet(p, 1) for p in packets]
+  packed = [m.pack() for m in matches]
+
+  def from_packet ():
+    for p in packets:
+      of.ofp_match.from_packet(p, 1)
+  def pack ():
+    for m in matches:
+      m.pack(flow_mod=True)
+  def from_packet_pack ():
+    for p in packets:
+      of.ofp_match.from_packet(p, 1).pack(flow_mod=True)
+  def unpack ():
+    for raw in packed:
+      of.ofp_match().unpack(raw)
+  def clone ():
+    for m in matches:
+      m.clone()
+  def eq ():
+    for m in matches:
+      m == m.clone()
+
+  print "%-20s %12s" % ("operation", "ops/sec")
+  for f in (from_packet, pack, from_packet_pack, unpack, clone, eq):
+    t = min(timeit.repeat(f, number=n, repeat=3))
+    print "%-20s %12.0f" % (f.__name__, n * len(packets) / t)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+#
+# This file is part of POX.
+#
+# POX is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# POX is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with POX.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark for the packet_in path exercised by oflops cbench
+
+Pushes a stream of packet_ins through a Connection (framing, unpacking,
+PacketIn events) with the misc.cbench listener attached, which answers
+each one with a flow_mod.  It's run with lazy packet_in unpacking on and
+off, and also with listeners that parse the packet, which is what
+most real components do: one that only looks at the Ethernet header,
+one on both the nexus and the connection (as when, e.g., host_tracker
+and a forwarding component are both running), and one that goes all the
+way down to UDP.
+"""
+
+import os.path
+import sys
+import time
+from optparse import OptionParser
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+import pox.openflow.libopenflow_01 as of
+from pox.openflow import OpenFlowNexus
+from pox.openflow.of_01 import Connection
+from pox.misc.cbench import CBench
+from pox.lib.packet import ethernet, ipv4, udp, lazy_stats
+from pox.lib.addresses import EthAddr, IPAddr
+
+
+class StreamSocket (object):
+  def __init__ (self, data):
+    self.data = data
+    self.offset = 0
+
+  def recv_into (self, buf, size):
+    d = self.data[self.offset:self.offset+size]
+    self.offset += len(d)
+    buf[:len(d)] = d
+    return len(d)
+
+  def send (self, data):
+    return len(data)
+
+
+class Parser (object):
+  """
+  A listener which looks at the destination like a learning switch would
+  """
+  def __init__ (self, connection):
+    connection.addListeners(self)
+
+  def _handle_PacketIn (self, event):
+    event.parsed.dst
+
+
+class SharedParser (Parser):
+  """
+  Listeners on both the nexus and the connection
+  """
+  def __init__ (self, connection):
+    Parser.__init__(self, connection)
+    connection.ofnexus.addListeners(self)
+
+
+class DeepParser (object):
+  """
+  A listener which looks at the UDP header
+  """
+  def __init__ (self, connection):
+    connection.addListeners(self)
+
+  def _handle_PacketIn (self, event):
+    event.parsed.find('udp').dstport
+
+
+def make_stream (count, size):
+  e = ethernet(src=EthAddr("00:00:00:00:00:01"),
+               dst=EthAddr("00:00:00:00:00:02"), type=ethernet.IP_TYPE)
+  ip = ipv4(srcip=IPAddr("10.0.0.1"), dstip=IPAddr("10.0.0.2"),
+            protocol=ipv4.UDP_PROTOCOL)
+  ip.payload = udp(srcport=1234, dstport=5678, payload=b'x' * size)
+  e.payload = ip
+  data = e.pack()
+  msg = of.ofp_packet_in(in_port=1, buffer_id=1, reason=of.OFPR_NO_MATCH,
+                         data=data).pack()
+  return msg * count
+
+
+def run (data, lazy, listener):
+  of.ofp_packet_in.lazy_unpack = lazy
+  con = Connection(StreamSocket(b''))
+  con.ofnexus = OpenFlowNexus()
+  con.dpid = 1
+  con.read_size = 65536
+  con.sock = StreamSocket(data)
+  listener(con)
+  start = time.time()
+  while con.read():
+    pass
+  return time.time() - start
+
+
+def main ():
+  parser = OptionParser()
+  parser.add_option("--count", type="int", default=100000)
+  parser.add_option("--size", type="int", default=64,
+                    help="UDP payload size")
+  options,_ = parser.parse_args()
+
+  data = make_stream(options.count, options.size)
+  print "%-10s %-8s %12s" % ("listener", "unpack", "msgs/sec")
+  for name,listener in (("cbench", CBench), ("parse", Parser),
+                        ("shared", SharedParser), ("deep", DeepParser)):
+    for lazy in (False, True):
+      t = run(data, lazy, listener)
+      print "%-10s %-8s %12.0f" % (name, "lazy" if lazy else "eager",
+                                   options.count / t)
+  print
+  print "payloads deferred:", lazy_stats['deferred']
+  print "payloads parsed:  ", lazy_stats['parsed'],
+  print lazy_stats['layers']
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+#
+# This file is part of POX.
+#
+# POX is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# POX is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with POX.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark for recoco's SelectHub with many timers and sockets
+
+Starts a scheduler with a lot of recurring Timers (as components
+like discovery and host_tracker create) and a lot of tasks each waiting
+on a socket, then pokes a few random sockets at a time and measures
+how quickly the waiting tasks get woken.  Also reports how much CPU the
+process burns while only the timers are active.
+"""
+
+import os.path
+import random
+import resource
+import socket
+import sys
+import threading
+import time
+from optparse import OptionParser
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from pox.lib.recoco import Scheduler, Task, Timer, Select
+
+
+def cpu_time ():
+  r = resource.getrusage(resource.RUSAGE_SELF)
+  return r.ru_utime + r.ru_stime
+
+
+class Reader (Task):
+  def __init__ (self, sock, counter):
+    Task.__init__(self)
+    self.sock = sock
+    self.counter = counter
+
+  def run (self):
+    while True:
+      rl,wl,xl = yield Select([self.sock], None, [self.sock])
+      if xl or not self.sock.recv(100): break
+      self.counter.hit()
+
+
+class Counter (object):
+  def __init__ (self):
+    self.count = 0
+    self.target = None
+    self.event = threading.Event()
+
+  def hit (self):
+    self.count += 1
+    if self.count == self.target: self.event.set()
+
+  def expect (self, n):
+    self.event.clear()
+    self.target = self.count + n
+
+
+def main ():
+  parser = OptionParser()
+  parser.add_option("--timers", type="int", default=10000)
+  parser.add_option("--sockets", type="int", default=1000)
+  parser.add_option("--rounds", type="int", default=500)
+  parser.add_option("--batch", type="int", default=10,
+                    help="Sockets written to per round")
+  parser.add_option("--idle", type="float", default=3,
+                    help="Seconds to measure CPU with only timers running")
+  parser.add_option("--select", action="store_true", default=False,
+                    help="Use select() instead of epoll")
+  options,_ = parser.parse_args()
+
+  sched = Scheduler(daemon=True,
+                    useEpoll=not options.select)
+  rng = random.Random(0)
+
+  fired = [0]
+  def tick ():
+    fired[0] += 1
+  for i in xrange(options.timers):
+    Timer(rng.uniform(0.5, 5), tick, recurring=True, scheduler=sched)
+
+  counter = Counter()
+  pairs = [socket.socketpair() for i in xrange(options.sockets)]
+  for a,b in pairs:
+    Reader(a, counter).start(sched)
+  # Let everything start up and settle into the hub
+  time.sleep(1)
+  while sched._ready:
+    time.sleep(0.5)
+
+  fired[0] = 0
+  c = cpu_time()
+  time.sleep(options.idle)
+  idle_cpu = (cpu_time() - c) / options.idle
+  timer_rate = fired[0] / options.idle
+
+  t = time.time()
+  for i in xrange(options.rounds):
+    counter.expect(options.batch)
+    for a,b in rng.sample(pairs, options.batch):
+      b.send("x")
+    if not counter.event.wait(10):
+      print "Timed out waiting for readers"
+      return
+  t = time.time() - t
+
+  print "%-28s %12.0f" % ("timer callbacks/sec", timer_rate)
+  print "%-28s %11.1f%%" % ("idle CPU", idle_cpu * 100)
+  print "%-28s %12.0f" % ("socket wakeups/sec",
+                          options.rounds * options.batch / t)
+  print "%-28s %12.3f" % ("ms per round", t * 1000 / options.rounds)
+
+  sched.quit()
+  sched._thread.join()
+  sched._selectHub._thread.join()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+#
+# This file is part of POX.
+#
+# POX is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# POX is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with POX.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark for revent event dispatch
+
+Raises events on an EventMixin with a varying number of listeners and
+reports events per second, both for raiseEvent(EventClass, args...) and
+for raising an already-constructed event.
+"""
+
+import os.path
+import sys
+import time
+from optparse import OptionParser
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from pox.lib.revent import Event, EventMixin
+
+
+class PacketIn (Event):
+  def __init__ (self, connection, ofp):
+    Event.__init__(self)
+    self.connection = connection
+    self.ofp = ofp
+
+
+class Source (EventMixin):
+  _eventMixin_events = set([PacketIn])
+
+
+class Sink (object):
+  def __init__ (self):
+    self.count = 0
+
+  def _handle_PacketIn (self, event):
+    self.count += 1
+
+
+def run (listeners, count, prebuilt):
+  source = Source()
+  for i in range(listeners):
+    source.addListeners(Sink())
+
+  raiseEvent = source.raiseEvent
+  if prebuilt:
+    events = [PacketIn(None, i) for i in xrange(count)]
+    start = time.time()
+    for e in events:
+      raiseEvent(e)
+  else:
+    start = time.time()
+    for i in xrange(count):
+      raiseEvent(PacketIn, None, i)
+  return count / (time.time() - start)
+
+
+def main ():
+  parser = OptionParser()
+  parser.add_option("--listeners", default="0,1,2,5,10",
+                    help="comma-separated listener counts")
+  parser.add_option("--events", type="int", default=200000)
+  parser.add_option("--samples", type="int", default=3)
+  options, args = parser.parse_args()
+
+  print "%9s %14s %14s" % ("listeners", "class ev/s", "instance ev/s")
+  for n in [int(x) for x in options.listeners.split(",")]:
+    by_class = max(run(n, options.events, False)
+                   for _ in range(options.samples))
+    by_instance = max(run(n, options.events, True)
+                      for _ in range(options.samples))
+    print "%9i %14.0f %14.0f" % (n, by_class, by_instance)
+
+
+if __name__ == '__main__':
+  main()
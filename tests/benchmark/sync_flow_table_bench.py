@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+#
+# This file is part of POX.
+#
+# POX is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# POX is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with POX.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark for proactive installs through OFSyncFlowTable
+
+Installs a number of flows (either in one call or one call per flow),
+answers the barriers, and then has the switch report every flow as
+removed.  Messages are packed as they would be for a real connection,
+and the time and number of writes for each phase are reported.
+
+Barrier replies only come in after the install, so the retry timeout is
+raised to keep retries out of the picture.
+"""
+
+import os.path
+import sys
+import time
+import itertools
+import struct
+from optparse import OptionParser
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from pox.core import core
+from pox.lib.revent import EventMixin
+from pox.lib.addresses import EthAddr, IPAddr
+from pox.openflow import BarrierIn, FlowRemoved
+from pox.openflow.topology import SwitchConnectionUp, SwitchConnectionDown
+import pox.openflow.libopenflow_01 as of
+from pox.openflow.topology import OFSyncFlowTable
+from pox.openflow.flow_table import TableEntry
+
+
+class FakeSwitch (EventMixin):
+  _eventMixin_events = set([FlowRemoved, BarrierIn, SwitchConnectionUp,
+                            SwitchConnectionDown])
+
+  def __init__ (self):
+    EventMixin.__init__(self)
+    self.connected = True
+    self._xid_generator = itertools.count(1).next
+    self.writes = 0
+    self.barriers = []
+
+  def send (self, data):
+    if type(data) is not bytes:
+      data = data.pack()
+    self.writes += 1
+    # Pick out the barrier requests to answer later
+    offset = 0
+    while offset < len(data):
+      t,length,xid = struct.unpack_from("!xBHL", data, offset)
+      if t == of.OFPT_BARRIER_REQUEST:
+        self.barriers.append(xid)
+      offset += length
+
+
+class FakeConnection (object):
+  dpid = 1
+
+
+def make_entries (count):
+  entries = []
+  for i in xrange(count):
+    match = of.ofp_match(dl_type=0x800, nw_dst=IPAddr(0x0a000000 + i))
+    entries.append(TableEntry(priority=100, match=match,
+                              actions=[of.ofp_action_output(port=1)]))
+  return entries
+
+
+def run (count, batched):
+  switch = FakeSwitch()
+  table = OFSyncFlowTable(switch)
+  entries = make_entries(count)
+
+  start = time.time()
+  if batched:
+    table.install(entries)
+  else:
+    for e in entries:
+      table.install(e)
+  install = time.time() - start
+  writes = switch.writes
+
+  start = time.time()
+  conn = FakeConnection()
+  for xid in switch.barriers:
+    switch.raiseEvent(BarrierIn(conn, of.ofp_barrier_reply(xid=xid)))
+  confirm = time.time() - start
+  assert len(table) == count, len(table)
+  assert table.num_pending == 0
+
+  start = time.time()
+  for e in entries:
+    switch.raiseEvent(FlowRemoved(conn, of.ofp_flow_removed(
+        match=e.match, priority=e.priority)))
+  removed = time.time() - start
+  assert len(table) == 0
+
+  return install, writes, confirm, removed
+
+
+def main ():
+  OFSyncFlowTable.TIME_OUT = 3600
+
+  parser = OptionParser()
+  parser.add_option("--flows", default="1000,10000,20000",
+                    help="comma-separated flow counts")
+  options, args = parser.parse_args()
+
+  print "%7s %8s %10s %8s %10s %10s" % ("flows", "batched", "install s",
+                                        "writes", "barriers s", "removed s")
+  for count in [int(x) for x in options.flows.split(",")]:
+    for batched in (True, False):
+      install,writes,confirm,removed = run(count, batched)
+      print "%7i %8s %10.2f %8i %10.2f %10.2f" % (count, batched, install,
+                                                 writes, confirm, removed)
+
+  core.quit()
+
+
+if __name__ == '__main__':
+  main()
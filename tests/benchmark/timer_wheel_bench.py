@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+#
+# This file is part of POX.
+#
+# POX is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# POX is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with POX.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark for recoco Timers versus WheelTimers
+
+Runs a lot of recurring timers with each kind and reports the CPU the
+process uses to keep them going, as well as the cost of arming and
+cancelling a timer (as, e.g., a flow expiry timer gets rescheduled).
+"""
+
+import os.path
+import random
+import resource
+import sys
+import threading
+import time
+from optparse import OptionParser
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from pox.lib.recoco import Scheduler, Timer, TimerWheel, WheelTimer
+
+
+def cpu_time ():
+  r = resource.getrusage(resource.RUSAGE_SELF)
+  return r.ru_utime + r.ru_stime
+
+
+def in_scheduler (sched, func):
+  done = threading.Event()
+  rv = []
+  def f ():
+    rv.append(func())
+    done.set()
+  sched.callLater(f)
+  done.wait()
+  return rv[0]
+
+
+def run (kind, sched, wheel, options):
+  rng = random.Random(0)
+  fired = [0]
+  def tick ():
+    fired[0] += 1
+
+  def arm ():
+    timers = []
+    for i in xrange(options.timers):
+      interval = rng.uniform(0.5, 5)
+      if kind == "Timer":
+        timers.append(Timer(interval, tick, recurring=True, scheduler=sched))
+      else:
+        timers.append(WheelTimer(interval, tick, recurring=True, wheel=wheel))
+    return timers
+  timers = in_scheduler(sched, arm)
+  time.sleep(1)
+  while sched._ready:
+    time.sleep(0.5)
+
+  fired[0] = 0
+  c = cpu_time()
+  time.sleep(options.duration)
+  cpu = (cpu_time() - c) / options.duration
+  rate = fired[0] / options.duration
+
+  def cancel ():
+    for t in timers: t.cancel()
+  in_scheduler(sched, cancel)
+
+  def churn ():
+    t = time.time()
+    for i in xrange(options.churn):
+      if kind == "Timer":
+        Timer(60, tick, scheduler=sched).cancel()
+      else:
+        WheelTimer(60, tick, wheel=wheel).cancel()
+    return (time.time() - t) / options.churn
+  churn_time = in_scheduler(sched, churn)
+
+  return cpu, rate, churn_time
+
+
+def main ():
+  parser = OptionParser()
+  parser.add_option("--timers", type="int", default=10000)
+  parser.add_option("--duration", type="float", default=3)
+  parser.add_option("--churn", type="int", default=10000,
+                    help="Number of timers to arm and cancel")
+  parser.add_option("--tick", type="float", default=0.1)
+  options,_ = parser.parse_args()
+
+  sched = Scheduler(daemon=True, useEpoll=True)
+  wheel = TimerWheel(tick=options.tick, scheduler=sched)
+
+  print "%-12s %10s %14s %18s" % ("kind", "CPU", "callbacks/sec",
+                                  "arm+cancel (us)")
+  for kind in ("Timer", "WheelTimer"):
+    cpu, rate, churn_time = run(kind, sched, wheel, options)
+    print "%-12s %9.1f%% %14.0f %18.2f" % (kind, cpu * 100, rate,
+                                           churn_time * 1e6)
+
+  sched.quit()
+  sched._thread.join()
+  sched._selectHub._thread.join()
+
+
+if __name__ == '__main__':
+  main()
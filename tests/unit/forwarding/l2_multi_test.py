@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+#
+# This file is part of POX.
+#
+# POX is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# POX is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with POX.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import sys
+import os.path
+import random
+from collections import deque
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+import pox.forwarding.l2_multi as l2_multi
+from pox.forwarding.l2_multi import PathEngine, Switch
+import pox.openflow.libopenflow_01 as of
+
+
+def bfs (links, src):
+  dist = {src:0}
+  queue = deque([src])
+  while queue:
+    n = queue.popleft()
+    for a,b in links:
+      for x,y in ((a,b),(b,a)):
+        if x == n and y not in dist:
+          dist[y] = dist[n] + 1
+          queue.append(y)
+  return dist
+
+
+class PathEngineTest (unittest.TestCase):
+  def test_incremental_matches_bfs (self):
+    r = random.Random(0)
+    nodes = range(12)
+    links = set()
+    paths = PathEngine()
+
+    for i in range(300):
+      if links and r.random() < 0.4:
+        a,b = r.choice(sorted(links))
+        links.discard((a,b))
+        paths.remove_link(a, b)
+      else:
+        a,b = sorted(r.sample(nodes, 2))
+        links.add((a,b))
+        paths.add_link(a, b)
+
+      for src in nodes:
+        dist = bfs(links, src)
+        for dst in nodes:
+          path = paths.get_path(src, dst)
+          if dst not in dist:
+            self.assertEqual(path, None)
+            continue
+          self.assertEqual(paths.distance(src, dst), dist[dst])
+          self.assertEqual(len(path), dist[dst] + 1)
+          self.assertEqual(path[0], src)
+          self.assertEqual(path[-1], dst)
+          for a,b in zip(path[:-1], path[1:]):
+            self.assertTrue((min(a,b),max(a,b)) in links)
+
+  def test_parallel_links (self):
+    paths = PathEngine()
+    paths.add_link(1, 2)
+    paths.add_link(2, 1)
+    self.assertEqual(paths.get_path(1, 2), [1, 2])
+    paths.remove_link(2, 1)
+    self.assertEqual(paths.get_path(1, 2), None)
+    paths.remove_link(1, 2)
+    self.assertEqual(paths.get_path(1, 1), [1])
+
+
+class MockConnection (object):
+  def __init__ (self):
+    self.sent = []
+  def send (self, msg):
+    self.sent.append(msg)
+
+class MockEvent (object):
+  def __init__ (self, buffer_id):
+    self.port = 1
+    self.ofp = of.ofp_packet_in(in_port=1, buffer_id=buffer_id)
+
+class CongestionTest (unittest.TestCase):
+  def setUp (self):
+    self.sw = sw = Switch()
+    sw.dpid = 1
+    sw.connection = MockConnection()
+    sw._congested = True
+    self._get_path = l2_multi._get_path
+    l2_multi._get_path = lambda *args: [(sw, 1, 2)]
+    self.warnings = []
+    self._warning = l2_multi.log.warning
+    l2_multi.log.warning = lambda *args: self.warnings.append(args)
+
+  def tearDown (self):
+    l2_multi._get_path = self._get_path
+    l2_multi.log.warning = self._warning
+
+  def test_drop_frees_buffer (self):
+    sw = self.sw
+    match = of.ofp_match(dl_type=0x800)
+    for buffer_id in (5, 6, None):
+      sw.install_path(sw, 2, match, MockEvent(buffer_id))
+    # The buffered ones are released without being forwarded, and there's
+    # no flow_mod
+    self.assertEqual([(m.buffer_id, m.actions) for m in sw.connection.sent],
+                     [(5, []), (6, [])])
+    self.assertTrue(all(isinstance(m, of.ofp_packet_out)
+                        for m in sw.connection.sent))
+    # Logged once for the episode
+    self.assertEqual(len(self.warnings), 1)
+    self.assertEqual(sw._congestion_drops, 3)
+
+
+if __name__ == '__main__':
+  unittest.main()
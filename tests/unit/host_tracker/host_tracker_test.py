@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+#
+# This file is part of POX.
+#
+# POX is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# POX is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with POX.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import sys
+import os.path
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.host_tracker.host_tracker import host_tracker, timeoutSec, PingCtrl
+from pox.openflow.discovery import Discovery, LinkEvent
+from pox.lib.packet import ethernet, ipv4, arp
+from pox.lib.addresses import EthAddr, IPAddr
+
+
+class FakeConnection (object):
+  def __init__ (self, dpid):
+    self.dpid = dpid
+
+class FakePacketIn (object):
+  def __init__ (self, dpid, port, packet):
+    self.connection = FakeConnection(dpid)
+    self.port = port
+    self.packet = ethernet(packet.pack())
+
+  def parse (self):
+    return self.packet
+
+
+class Tracker (host_tracker):
+  """
+  host_tracker that records pings instead of sending them
+  """
+  def __init__ (self):
+    host_tracker.__init__(self)
+    self._t.cancel()
+    self.pinged = []
+
+  def sendPings (self, dpid, pings):
+    for macEntry, ipAddr in pings:
+      self.pinged.append((dpid, macEntry.macaddr, ipAddr))
+      macEntry.ipAddrs[ipAddr].pings.sent()
+
+
+def ip_packet (mac, ip):
+  e = ethernet(src=EthAddr(mac), dst=EthAddr("ff:ff:ff:ff:ff:ff"),
+               type=ethernet.IP_TYPE)
+  e.payload = ipv4(srcip=IPAddr(ip), dstip=IPAddr("10.0.0.254"),
+                   payload=b'x' * 8)
+  return e
+
+def arp_packet (mac, ip):
+  a = arp(hwsrc=EthAddr(mac), hwdst=EthAddr("ff:ff:ff:ff:ff:ff"),
+          protosrc=IPAddr(ip), protodst=IPAddr("10.0.0.254"),
+          opcode=arp.REQUEST)
+  e = ethernet(src=EthAddr(mac), dst=EthAddr("ff:ff:ff:ff:ff:ff"),
+               type=ethernet.ARP_TYPE)
+  e.payload = a
+  return e
+
+
+class HostTrackerTest (unittest.TestCase):
+  def setUp (self):
+    self.ht = Tracker()
+
+  def test_indexes (self):
+    ht = self.ht
+    ht._handle_PacketIn(FakePacketIn(1, 1, ip_packet("00:00:00:00:00:01",
+                                                     "10.0.0.1")))
+    ht._handle_PacketIn(FakePacketIn(1, 2, ip_packet("00:00:00:00:00:02",
+                                                     "10.0.0.1")))
+    ht._handle_PacketIn(FakePacketIn(1, 1, ip_packet("00:00:00:00:00:01",
+                                                     "10.0.0.3")))
+    macs = sorted(str(e.macaddr)
+                  for e in ht.getMacEntriesByIP(IPAddr("10.0.0.1")))
+    self.assertEqual(macs, ["00:00:00:00:00:01", "00:00:00:00:00:02"])
+    self.assertEqual(ht.getMacEntriesByIP(IPAddr("10.0.0.2")), [])
+
+    e = ht.getMacEntry(EthAddr("00:00:00:00:00:01"))
+    ht._removeMAC(e)
+    self.assertEqual(len(ht.getMacEntriesByIP(IPAddr("10.0.0.1"))), 1)
+    self.assertEqual(ht.getMacEntriesByIP(IPAddr("10.0.0.3")), [])
+
+  def test_switch_ports (self):
+    ht = self.ht
+    link = Discovery.Link(1, 5, 2, 6)
+    ht._handle_openflow_discovery_LinkEvent(LinkEvent(True, link))
+    ht._handle_openflow_discovery_LinkEvent(
+        LinkEvent(True, Discovery.Link(2, 6, 1, 5)))
+    ht._handle_PacketIn(FakePacketIn(1, 5, ip_packet("00:00:00:00:00:01",
+                                                     "10.0.0.1")))
+    self.assertEqual(ht.entryByMAC, {})
+
+    # Still a switch port while the link the other way is up
+    ht._handle_openflow_discovery_LinkEvent(LinkEvent(False, link))
+    ht._handle_PacketIn(FakePacketIn(1, 5, ip_packet("00:00:00:00:00:01",
+                                                     "10.0.0.1")))
+    self.assertEqual(ht.entryByMAC, {})
+
+    ht._handle_openflow_discovery_LinkEvent(
+        LinkEvent(False, Discovery.Link(2, 6, 1, 5)))
+    ht._handle_PacketIn(FakePacketIn(1, 5, ip_packet("00:00:00:00:00:01",
+                                                     "10.0.0.1")))
+    self.assertEqual(len(ht.entryByMAC), 1)
+
+  def test_expiry (self):
+    ht = self.ht
+    mac = EthAddr("00:00:00:00:00:01")
+    ip = IPAddr("10.0.0.1")
+    ht._handle_PacketIn(FakePacketIn(1, 1, arp_packet(str(mac), str(ip))))
+    e = ht.getMacEntry(mac)
+    start = e.lastTimeSeen
+
+    # Traffic pushes the deadline back
+    now = start + timeoutSec['arpAware'] / 2.0
+    e.refresh(); e.lastTimeSeen = now
+    e.ipAddrs[ip].refresh(); e.ipAddrs[ip].lastTimeSeen = now
+    ht._check_timeouts(start + timeoutSec['arpAware'] + 1)
+    self.assertEqual(ht.pinged, [])
+    self.assertTrue(ht.getMacEntry(mac) is e)
+
+    # Then it goes quiet and gets pinged until it's given up on
+    now += timeoutSec['arpAware'] + 1
+    for i in range(PingCtrl.pingLim + 1):
+      ht._check_timeouts(now)
+      self.assertEqual(len(ht.pinged), i + 1)
+      self.assertTrue(ht.getMacEntry(mac) is e)
+      now += timeoutSec['arpReply']
+    ht._check_timeouts(now)
+    self.assertEqual(len(ht.pinged), PingCtrl.pingLim + 1)
+    self.assertEqual(e.ipAddrs, {})
+    self.assertEqual(ht.getMacEntriesByIP(ip), [])
+    now += timeoutSec['arpReply']
+    ht._check_timeouts(now)
+    self.assertEqual(ht.getMacEntry(mac), None)
+    self.assertEqual(ht._checks, [])
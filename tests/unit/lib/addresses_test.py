@@ -27,6 +27,32 @@ class MockEthAddrTest(unittest.TestCase):
   def test_basic(self):
     self.assertEqual("00:11:22:33:44:55", str(EthAddr("00:11:22:33:44:55")), "str(eth) doesn't match original string")
 
+  def test_from_raw (self):
+    a = EthAddr.from_raw(b"\x00\x11\x22\x33\x44\x55")
+    self.assertEqual(a, EthAddr("00:11:22:33:44:55"))
+    self.assertEqual(hash(a), hash(EthAddr("00:11:22:33:44:55")))
+    self.assertTrue(a.is_global)
+
+  def test_immutable (self):
+    a = EthAddr("00:11:22:33:44:55")
+    self.assertRaises(TypeError, setattr, a, "_value", b"\x00" * 6)
+    self.assertRaises(TypeError, setattr, a, "foo", 1)
+
+  def test_ordering (self):
+    a = EthAddr("00:00:00:00:00:01")
+    b = EthAddr("00:00:00:00:00:02")
+    self.assertTrue(a < b)
+    self.assertTrue(b > a)
+    self.assertEqual(sorted([b, a]), [a, b])
+    self.assertNotEqual(a, b)
+
+  def test_copy_and_pickle (self):
+    import pickle
+    a = EthAddr("00:11:22:33:44:55")
+    self.assertEqual(copy(a), a)
+    self.assertEqual(pickle.loads(pickle.dumps(a, 0)), a)
+    self.assertEqual(pickle.loads(pickle.dumps(a, 2)), a)
+
 #  def test_int_ctor(self):
 #    int_val = EthAddr("00:00:00:00:01:00").toInt()
 #    self.assertEqual(int_val, 1<<8)
@@ -37,4 +63,66 @@ class MockEthAddrTest(unittest.TestCase):
 class MockIPAddrTest (unittest.TestCase):
   def test_in_network (self):
     self.assertTrue(IPAddr("192.168.1.1").inNetwork("192.168.1.0/24"))
+    self.assertFalse(IPAddr("192.168.2.1").inNetwork("192.168.1.0/24"))
+
+  def test_byte_order (self):
+    a = IPAddr("255.0.0.1")
+    self.assertEqual(a, IPAddr(0xff000001))
+    self.assertEqual(a, IPAddr(0x010000ff, networkOrder = True))
+    self.assertEqual(a.toUnsigned(), 0xff000001)
+    self.assertEqual(a.toUnsigned(networkOrder = True), 0x010000ff)
+    self.assertEqual(a.toSigned(), -16777215)
+    self.assertEqual(a.toSigned(networkOrder = True), 16777471)
+    self.assertEqual(a.toRaw(), b"\xff\x00\x00\x01")
+
+  def test_from_int (self):
+    self.assertEqual(IPAddr.from_int(0x0a000001), IPAddr("10.0.0.1"))
+    self.assertEqual(IPAddr.from_int(0x0100000a, networkOrder = True),
+                     IPAddr("10.0.0.1"))
+    self.assertEqual(IPAddr.from_raw(b"\x0a\x00\x00\x01"),
+                     IPAddr("10.0.0.1"))
+    self.assertEqual(hash(IPAddr.from_int(0x0a000001)),
+                     hash(IPAddr("10.0.0.1")))
+
+  def test_immutable (self):
+    a = IPAddr("10.0.0.1")
+    self.assertRaises(TypeError, setattr, a, "_value", 0)
+
+  def test_copy_and_pickle (self):
+    import pickle
+    a = IPAddr("10.0.0.1")
+    self.assertEqual(copy(a), a)
+    self.assertEqual(pickle.loads(pickle.dumps(a, 0)), a)
+
+  def test_compare (self):
+    self.assertTrue(IPAddr("10.0.0.1") < IPAddr("10.0.0.2"))
+    self.assertEqual(IPAddr("10.0.0.1"), "10.0.0.1")
+    self.assertNotEqual(IPAddr("10.0.0.1"), None)
+
+class InternTest (unittest.TestCase):
+  def tearDown (self):
+    import pox.lib.addresses
+    set_intern_limit(pox.lib.addresses._intern_limit_default)
+
+  def test_shared (self):
+    set_intern_limit(16)
+    self.assertTrue(EthAddr.from_raw(b"\x02" * 6)
+                    is EthAddr.from_raw(b"\x02" * 6))
+    self.assertTrue(IPAddr.from_int(1) is IPAddr.from_int(1))
+    self.assertTrue(IPAddr.from_raw(b"\x00\x00\x00\x01")
+                    is IPAddr.from_int(1))
+
+  def test_bounded (self):
+    import pox.lib.addresses
+    set_intern_limit(4)
+    for i in range(10):
+      IPAddr.from_int(i)
+      EthAddr.from_raw(chr(i) * 6)
+    self.assertTrue(len(pox.lib.addresses._ip_intern) <= 4)
+    self.assertTrue(len(pox.lib.addresses._eth_intern) <= 4)
+
+  def test_disabled (self):
+    set_intern_limit(0)
+    self.assertFalse(IPAddr.from_int(1) is IPAddr.from_int(1))
+    self.assertEqual(IPAddr.from_int(1), IPAddr.from_int(1))
 
@@ -12,7 +12,8 @@ from copy import copy
 
 sys.path.append(os.path.dirname(__file__) + "/../../..")
 
-from pox.lib.epoll_select import EpollSelect
+import select
+from pox.lib.epoll_select import EpollSelect, EpollRegistry
 
 class TCPEcho(SocketServer.StreamRequestHandler):
   def handle(self):
@@ -86,5 +87,34 @@ class EpollSelectTest(unittest.TestCase):
       check( ([],[],[]), self.es.select(sockets, [], sockets, 0))
       check( ([],sockets,[]), self.es.select(sockets, sockets, sockets, 0))
 
+@unittest.skipUnless(sys.platform.startswith("linux"), "requires Linux")
+class EpollRegistryTest(unittest.TestCase):
+  def setUp(self):
+    self.reg = EpollRegistry()
+    self.server = ForkingTCPServer(("localhost", 0), TCPEcho)
+    self.ip, self.port = self.server.server_address
+    self.server.start()
+
+  def tearDown(self):
+    self.reg.close()
+    self.server.stop()
+
+  def test_persistent_registration(self):
+    c = socket.create_connection( (self.ip, self.port))
+    self.reg.register(c, select.EPOLLIN)
+    self.assertEqual([], self.reg.poll(0.1))
+    c.send("Hallo\n")
+    # still registered -- no need to say so again
+    self.assertEqual([(c, select.EPOLLIN)], self.reg.poll(0.5))
+    # registry itself is selectable
+    self.assertEqual([self.reg], select.select([self.reg], [], [], 0)[0])
+
+  def test_unregister_closed(self):
+    c = socket.create_connection( (self.ip, self.port))
+    self.reg.register(c, select.EPOLLIN)
+    c.close()
+    self.reg.unregister(c)
+    self.assertEqual(0, len(self.reg))
+
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1 @@
+pass
@@ -0,0 +1,195 @@
+# This file is part of POX.
+#
+# POX is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# POX is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with POX.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import sys
+import os.path
+import random
+
+sys.path.append(os.path.dirname(__file__) + "/../../../..")
+
+# Not import *, which would also pull in graph.test() for the runner
+from pox.lib.graph.graph import (Graph, Node, LeaveException, Self, Port,
+                                 Other, OtherPort, F, Is, Equal, And, Or,
+                                 IsInstance, IsType, UnaryOp, LessThan,
+                                 GreaterThan, LessThanEqualTo,
+                                 GreaterThanEqualTo)
+
+
+class Node1 (Node):
+  def __init__ (self, num):
+    self.num = num
+  def __repr__ (self):
+    return "Node1 #%s" % (self.num,)
+
+class Node2 (Node1):
+  def __repr__ (self):
+    return "Node2 #%s" % (self.num,)
+
+
+def ends (links):
+  """
+  Links as a sorted list of ((node,port),(node,port)) so they compare
+  """
+  return sorted(((l[0], l[1]) for l in links),
+                key = lambda e: (e[0][0].num, e[0][1], e[1][0].num, e[1][1]))
+
+def reference (g, query1=None, query2=()):
+  """
+  The links find_links() should return, worked out by brute force
+  """
+  if query2 is None: query2 = query1
+  if query1 == (): query1 = None
+  if query2 == (): query2 = None
+  def test (q, l):
+    if q is None: return True
+    try:
+      return q(l[0][0], l)
+    except LeaveException:
+      return False
+  r = []
+  for l in g._entries:
+    if test(query1, l) and test(query2, l.flip()):
+      r.append(l)
+    elif test(query2, l) and test(query1, l.flip()):
+      r.append(l.flip())
+  return r
+
+
+class GraphTest (unittest.TestCase):
+  def setUp (self):
+    self.g = g = Graph()
+    self.n = [Node1(i) if i % 3 else Node2(i) for i in range(6)]
+    for n in self.n:
+      g.add(n)
+    n = self.n
+    g.link((n[0],1),(n[1],1))
+    g.link((n[0],2),(n[2],1))
+    g.link((n[1],2),(n[2],2))
+    g.link((n[3],1),(n[0],3))
+
+  def test_pinned_node (self):
+    n = self.n
+    links = self.g.find_links(Is(n[0]))
+    self.assertEqual(len(links), 3)
+    for l in links:
+      self.assertTrue(l[0][0] is n[0])
+    self.assertEqual(ends(self.g.find_links(Equal(n[2]), Is(n[0]))),
+                     [((n[2],1),(n[0],2))])
+
+  def test_pinned_port (self):
+    n = self.n
+    q = And(Is(n[0]), Equal(Port(), 3))
+    self.assertEqual(ends(self.g.find_links(q)), [((n[0],3),(n[3],1))])
+    self.assertEqual(ends(self.g.find_links(Equal(Port(), 2))),
+                     [((n[0],2),(n[2],1)), ((n[1],2),(n[2],2))])
+    self.assertEqual(self.g.find_links(And(Is(n[4]), Equal(Port(), 1))), [])
+
+  def test_other (self):
+    n = self.n
+    q = And(Equal(Other(), n[1]), Equal(OtherPort(), 2))
+    self.assertEqual(ends(self.g.find_links(q)), [((n[2],2),(n[1],2))])
+
+  def test_matches_reference (self):
+    g = self.g
+    n = self.n
+    r = random.Random(7)
+    for i in range(40):
+      a,b = r.sample(n, 2)
+      g.link((a, r.randint(1,4)), (b, r.randint(1,4)))
+    queries = [None, (), Is(n[1]), Equal(Port(), 2), IsInstance(Node2),
+               And(Equal(Port(), 1), IsType(Node1)),
+               And(Is(n[2]), Equal(OtherPort(), 3)),
+               Or(Is(n[0]), Is(n[5])),
+               Equal(F('num'), 4), Equal(F('missing'), 1)]
+    for q1 in queries:
+      for q2 in queries:
+        self.assertEqual(ends(g.find_links(q1, q2)),
+                         ends(reference(g, q1, q2)), (q1, q2))
+
+  def test_has_link (self):
+    n = self.n
+    self.assertTrue(self.g.has_link(Is(n[3])))
+    self.assertFalse(self.g.has_link(Is(n[4])))
+    self.assertFalse(self.g.has_link(Is(n[3]), Is(n[1])))
+
+  def test_get_link (self):
+    n = self.n
+    self.assertRaises(RuntimeError, self.g.get_one_link, Is(n[0]))
+    l = self.g.get_one_link(Is(n[3]))
+    self.assertEqual((l[0], l[1]), ((n[3],1),(n[0],3)))
+    self.assertEqual(self.g.get_link(Is(n[4]), default=None), None)
+
+  def test_relink (self):
+    g = self.g
+    n = self.n
+    # Linking a port that's in use replaces the old link
+    g.link((n[0],1),(n[4],1))
+    self.assertEqual(g.find_links(Is(n[1]), Is(n[0])), [])
+    self.assertEqual(g.port_for_node(n[1], 1), None)
+    self.assertEqual(g.find_port(n[0], n[4]), (1, 1))
+    self.assertEqual(len(g.find_links()), 4)
+
+  def test_remove (self):
+    g = self.g
+    n = self.n
+    g.remove(n[0])
+    self.assertEqual(ends(g.find_links()), [((n[1],2),(n[2],2))])
+    self.assertEqual(g.ports_for_node(n[3]), {})
+    self.assertEqual(g.neighbors(n[1]), [n[2]])
+    self.assertFalse(g.has_link(Equal(Port(), 3)))
+
+  def test_disconnect (self):
+    g = self.g
+    n = self.n
+    self.assertEqual(g.disconnect_nodes(n[0], n[1]), 1)
+    self.assertFalse(g.connected(n[0], n[1]))
+    self.assertEqual(g.disconnect_port((n[2], 2)), 1)
+    self.assertEqual(g.disconnect_port((n[2], 2)), 0)
+    g.disconnect_node(n[0])
+    self.assertEqual(g.find_links(), [])
+    self.assertEqual(g._port_nodes, {})
+
+
+class OperatorTest (unittest.TestCase):
+  def test_compare (self):
+    n = Node1(5)
+    for op,expected in ((LessThan, False), (GreaterThan, True),
+                        (LessThanEqualTo, False),
+                        (GreaterThanEqualTo, True)):
+      q = op(F('num'), 4)
+      self.assertEqual(q(n, None), expected)
+      self.assertEqual(q._compile()(n, None), expected)
+
+  def test_field_call (self):
+    n = Node1(5)
+    n.get = lambda: 42
+    self.assertEqual(F('get()')._compile()(n, None), 42)
+    self.assertRaises(LeaveException, F('nope')._compile(), n, None)
+    self.assertRaises(AttributeError,
+                      F(Self(), 'nope', optional=False)._compile(), n, None)
+
+  def test_short_circuit (self):
+    n = Node1(5)
+    q = Or(Equal(F('num'), 5), Equal(F('missing'), 1))
+    self.assertTrue(q._compile()(n, None))
+    q = And(Equal(F('num'), 4), Equal(F('missing'), 1))
+    self.assertFalse(q._compile()(n, None))
+
+  def test_custom_call (self):
+    class Odd (UnaryOp):
+      def __call__ (self, n, li):
+        return self._operand(n, li) % 2 == 1
+    self.assertTrue(Odd(F('num'))._compile()(Node1(5), None))
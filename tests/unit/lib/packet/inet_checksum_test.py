@@ -0,0 +1,140 @@
+# This file is part of POX.
+#
+# POX is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# POX is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with POX.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import sys
+import os.path
+import struct
+import random
+
+sys.path.append(os.path.dirname(__file__) + "/../../../..")
+
+import pox.lib.packet as pkt
+import pox.lib.packet.inet_checksum as inet_checksum
+from pox.lib.packet.inet_checksum import *
+from pox.lib.addresses import IPAddr
+
+
+def reference (data):
+  """ Straightforward RFC 1071 checksum over big-endian words """
+  if len(data) % 2:
+    data += b'\0'
+  s = sum(struct.unpack('!%iH' % (len(data) // 2,), data))
+  while s >> 16:
+    s = (s >> 16) + (s & 0xffff)
+  return ~s & 0xffff
+
+
+class ChecksumTest (unittest.TestCase):
+  def setUp (self):
+    self.random = random.Random(1)
+
+  def _data (self, n):
+    return b''.join(chr(self.random.randrange(256)) for _ in xrange(n))
+
+  def test_matches_reference (self):
+    for n in range(0, 70) + [1499, 1500]:
+      data = self._data(n)
+      self.assertEqual(checksum(data), reference(data))
+
+  def test_rfc1071_example (self):
+    data = b'\x00\x01\xf2\x03\xf4\xf5\xf6\xf7'
+    self.assertEqual(checksum(data), ~0xddf2 & 0xffff)
+
+  def test_skip_word (self):
+    data = self._data(40)
+    zeroed = data[:10] + b'\0\0' + data[12:]
+    self.assertEqual(checksum(data, 0, 5), reference(zeroed))
+
+  def test_ipv4_header_verifies (self):
+    ip = pkt.ipv4(srcip=IPAddr("10.0.0.1"), dstip=IPAddr("10.0.0.2"),
+                  protocol=pkt.ipv4.UDP_PROTOCOL)
+    raw = ip.pack()
+    self.assertEqual(checksum(raw[:20]), 0)
+
+  def test_pseudo_header (self):
+    src = IPAddr("192.168.1.1")
+    dst = IPAddr("10.9.8.7")
+    for n in (0, 1, 9, 40):
+      data = self._data(n)
+      ph = struct.pack('!IIBBH', src.toUnsigned(), dst.toUnsigned(), 0, 6,
+                       len(data))
+      self.assertEqual(pseudo_header_checksum(src, dst, 6, data),
+                       reference(ph + data))
+
+  def test_udp_roundtrip (self):
+    u = pkt.udp(srcport=1234, dstport=53, payload=self._data(33))
+    ip = pkt.ipv4(srcip=IPAddr("10.0.0.1"), dstip=IPAddr("10.0.0.2"),
+                  protocol=pkt.ipv4.UDP_PROTOCOL, payload=u)
+    p = pkt.ipv4(raw=ip.pack())
+    self.assertEqual(p.next.csum, p.next.checksum(unparsed=True))
+
+  def test_numpy_path_agrees (self):
+    if inet_checksum.numpy is None:
+      return
+    old = inet_checksum.numpy_threshold
+    try:
+      inet_checksum.numpy_threshold = 0
+      for n in (2, 7, 64, 1501):
+        data = self._data(n)
+        self.assertEqual(checksum(data, 0, 1), checksum(data[:2] + b'\0\0'
+                                                        + data[4:]))
+        self.assertEqual(checksum(data), reference(data))
+    finally:
+      inet_checksum.numpy_threshold = old
+
+
+class ChecksumUpdateTest (unittest.TestCase):
+  def _ip (self, **kw):
+    kw.setdefault('srcip', IPAddr("10.0.0.1"))
+    kw.setdefault('dstip', IPAddr("10.0.0.2"))
+    kw.setdefault('protocol', pkt.ipv4.UDP_PROTOCOL)
+    return pkt.ipv4(**kw)
+
+  def test_ttl (self):
+    for ttl in (64, 1, 255):
+      ip = self._ip(ttl=ttl)
+      ip.pack()
+      csum = ip.csum
+      new = checksum_update(csum, (ttl << 8) | ip.protocol,
+                            ((ttl - 1) << 8) | ip.protocol)
+      ip.ttl -= 1
+      ip.pack()
+      self.assertEqual(new, ip.csum)
+
+  def test_nat (self):
+    r = random.Random(2)
+    for i in range(200):
+      old = IPAddr(r.getrandbits(32))
+      new = IPAddr(r.getrandbits(32))
+      ip = self._ip(srcip=old)
+      ip.pack()
+      csum = checksum_update(ip.csum, old.toUnsigned(), new.toUnsigned(),
+                             32)
+      ip.srcip = new
+      ip.pack()
+      self.assertEqual(csum, ip.csum)
+
+  def test_nat_l4 (self):
+    old = IPAddr("192.168.0.5")
+    new = IPAddr("203.0.113.9")
+    data = b'\x04\xd2\x00\x35' + b'payload!'
+    before = pseudo_header_checksum(old, IPAddr("8.8.8.8"), 6, data)
+    after = pseudo_header_checksum(new, IPAddr("8.8.8.8"), 6, data)
+    self.assertEqual(checksum_update(before, old.toUnsigned(),
+                                     new.toUnsigned(), 32), after)
+
+  def test_bad_width (self):
+    self.assertRaises(ValueError, checksum_update, 0, 0, 0, 8)
@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os.path
+import socket
+import threading
+import time
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.lib.recoco import Scheduler, Task, Timer, Select
+from pox.lib.recoco import TimerWheel, WheelTimer, BaseTask
+
+
+class SelectHubTestBase (object):
+  use_epoll = False
+
+  def setUp (self):
+    self.scheduler = Scheduler(isDefaultScheduler=False, daemon=True,
+                               useEpoll=self.use_epoll)
+
+  def tearDown (self):
+    self.scheduler.quit()
+    self.scheduler._selectHub._cycle()
+
+  def test_timers_fire_in_order (self):
+    fired = []
+    done = threading.Event()
+    def cb (i):
+      fired.append(i)
+      if len(fired) == 20: done.set()
+    # Absolute times, so a slow loop here can't reorder the deadlines
+    base = time.time() + 0.01
+    for i in reversed(range(20)):
+      Timer(base + i * 0.005, cb, absoluteTime=True, args=(i,),
+            scheduler=self.scheduler)
+    done.wait(5)
+    self.assertEqual(fired, range(20))
+
+  def test_select (self):
+    a,b = socket.socketpair()
+    got = []
+    done = threading.Event()
+    class Reader (Task):
+      def run (self):
+        while len(got) < 3:
+          rl,wl,xl = yield Select([a], None, None, timeout=5)
+          if not rl: break
+          got.append(a.recv(100))
+          b.send("x")
+        done.set()
+    Reader().start(self.scheduler)
+    # A timer sleeping in the hub shouldn't keep the reader waiting
+    Timer(60, lambda: None, scheduler=self.scheduler)
+    b.send("a")
+    done.wait(5)
+    self.assertEqual(got, ["a", "x", "x"])
+    a.close()
+    b.close()
+
+  def test_timeout (self):
+    a,b = socket.socketpair()
+    rv = []
+    done = threading.Event()
+    class Waiter (Task):
+      def run (self):
+        start = time.time()
+        rv.append((yield Select([a], None, None, timeout=0.05)))
+        rv.append(time.time() - start)
+        done.set()
+    Waiter().start(self.scheduler)
+    done.wait(5)
+    self.assertEqual(rv[0], ([],[],[]))
+    self.assertTrue(rv[1] < 1)
+    a.close()
+    b.close()
+
+  def test_reused_fd (self):
+    a,b = socket.socketpair()
+    fd = a.fileno()
+    socks = {}
+    rv = []
+    closed = threading.Event()
+    done = threading.Event()
+    class Waiter (Task):
+      def run (self):
+        # Still armed for a when a is closed and its number reused
+        yield Select([a], None, None, timeout=0.2)
+        closed.wait(5)
+        start = time.time()
+        rv.append((yield Select([socks['c']], None, None, timeout=3)))
+        rv.append(time.time() - start)
+        done.set()
+    Waiter().start(self.scheduler)
+    time.sleep(0.05)
+    a.close()
+    c,d = socket.socketpair()
+    if c.fileno() != fd:
+      d,c = c,d
+    socks['c'] = c
+    d.send("x")
+    closed.set()
+    done.wait(5)
+    self.assertEqual(c.fileno(), fd)
+    self.assertEqual(rv[0][0], [c])
+    self.assertTrue(rv[1] < 1)
+    if self.use_epoll:
+      # It stays registered, but for c now
+      self.assertTrue(self.scheduler._selectHub._armed[fd][1]() is c)
+    for s in (b, c, d):
+      s.close()
+
+  def test_closed_fds_swept (self):
+    done = threading.Event()
+    class Waiter (Task):
+      def run (self):
+        for i in range(300):
+          a,b = socket.socketpair()
+          b.send("x")
+          yield Select([a], None, None, timeout=5)
+          a.close()
+          b.close()
+        done.set()
+    Waiter().start(self.scheduler)
+    done.wait(10)
+    self.assertTrue(done.is_set())
+    self.assertTrue(len(self.scheduler._selectHub._armed) <= 64)
+
+
+class EpollCountingHubTest (unittest.TestCase):
+  def setUp (self):
+    self.scheduler = Scheduler(isDefaultScheduler=False, daemon=True,
+                               useEpoll=True)
+    # Count epoll_ctl() calls
+    self.calls = calls = []
+    epoll = self.scheduler._selectHub.epoll
+    def counted (name, f):
+      def call (*args):
+        calls.append(name)
+        return f(*args)
+      return call
+    for name in ('register', 'modify', 'unregister'):
+      setattr(epoll, name, counted(name, getattr(epoll, name)))
+
+  def tearDown (self):
+    self.scheduler.quit()
+    self.scheduler._selectHub._cycle()
+
+  def test_repeated_waits (self):
+    pairs = [socket.socketpair() for i in range(200)]
+    socks = [a for a,b in pairs]
+    woken = []
+    done = threading.Event()
+    class Waiter (Task):
+      def run (self):
+        for i in range(100):
+          rl,wl,xl = yield Select(socks, [], socks, 5)
+          for s in rl:
+            s.recv(100)
+          woken.append(len(rl))
+          pairs[(i + 1) % len(pairs)][1].send("x")
+        done.set()
+    Waiter().start(self.scheduler)
+    pairs[0][1].send("x")
+    done.wait(10)
+    self.assertEqual(woken, [1] * 100)
+    # Registering each socket once, then one re-arm per wakeup
+    self.assertTrue(len(self.calls) <= 200 + 2 * 100, len(self.calls))
+    self.assertEqual(self.calls.count('unregister'), 0)
+    for a,b in pairs:
+      a.close()
+      b.close()
+
+
+class SchedulingTest (unittest.TestCase):
+  def setUp (self):
+    self.scheduler = Scheduler(isDefaultScheduler=False, startInThread=False,
+                               weights={'io':2, 'default':1})
+
+  def tearDown (self):
+    self.scheduler.quit()
+    self.scheduler._selectHub._cycle()
+
+  def test_weighted_classes (self):
+    order = []
+    class T (BaseTask):
+      def __init__ (self, name, cls, priority=1):
+        BaseTask.__init__(self)
+        self.name = name
+        self.scheduling_class = cls
+        self.priority = priority
+      def run (self):
+        order.append(self.name)
+        yield False
+    for i in range(6):
+      T("io%i" % i, 'io').start(self.scheduler, fast=True)
+    for i in range(3):
+      T("bg%i" % i, 'default').start(self.scheduler, fast=True)
+    T("urgent", 'default', priority=2).start(self.scheduler, fast=True)
+
+    while self.scheduler.cycle(): pass
+    self.assertEqual(order, ["io0", "urgent", "io1", "io2", "bg0", "io3",
+                             "io4", "bg1", "io5", "bg2"])
+
+    stats = self.scheduler.get_stats()
+    self.assertEqual(stats['io']['runs'], 6)
+    self.assertEqual(stats['default']['runs'], 4)
+    self.assertEqual(stats['default']['ready'], 0)
+
+
+class CallLaterTest (unittest.TestCase):
+  def setUp (self):
+    self.scheduler = Scheduler(isDefaultScheduler=False, daemon=True)
+
+  def tearDown (self):
+    self.scheduler.quit()
+    self.scheduler._selectHub._cycle()
+
+  def test_many_producers (self):
+    got = {}
+    done = threading.Event()
+    def f (producer, i):
+      got.setdefault(producer, []).append(i)
+    def producer (p):
+      for i in range(500):
+        self.scheduler.callLater(f, p, i)
+      self.scheduler.callLaterMany([(f, (p, i)) for i in range(500, 1000)])
+    threads = [threading.Thread(target=producer, args=(p,))
+               for p in range(4)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    self.scheduler.callLaterMany([done.set])
+    done.wait(5)
+    self.assertTrue(done.is_set())
+    for p in range(4):
+      self.assertEqual(got[p], range(1000))
+
+
+class TimerWheelTest (unittest.TestCase):
+  def setUp (self):
+    self.scheduler = Scheduler(isDefaultScheduler=False, daemon=True)
+    self.wheel = TimerWheel(tick=0.01, slots=8, scheduler=self.scheduler,
+                            isDefaultTimerWheel=False)
+
+  def tearDown (self):
+    self.scheduler.quit()
+    self.scheduler._selectHub._cycle()
+
+  def in_scheduler (self, func):
+    """ Runs func within the scheduler and waits for it """
+    done = threading.Event()
+    def f ():
+      func()
+      done.set()
+    self.scheduler.callLater(f)
+    done.wait(5)
+
+  def test_order_and_cancel (self):
+    fired = []
+    done = threading.Event()
+    def cb (i):
+      fired.append(i)
+      if i == 9: done.set()
+    timers = []
+    def arm ():
+      # Some of these go around the wheel more than once
+      for i in reversed(range(10)):
+        timers.append(self.wheel.callDelayed(0.01 + i * 0.015, cb, i))
+      timers[-3].cancel()
+    self.in_scheduler(arm)
+    done.wait(5)
+    self.assertEqual(fired, [0, 1, 3, 4, 5, 6, 7, 8, 9])
+    self.assertEqual(len(self.wheel), 0)
+
+  def test_recurring (self):
+    fired = []
+    done = threading.Event()
+    def cb ():
+      fired.append(time.time())
+      if len(fired) == 3:
+        done.set()
+        return False
+    start = []
+    def arm ():
+      start.append(time.time())
+      WheelTimer(0.02, cb, recurring=True, wheel=self.wheel)
+    self.in_scheduler(arm)
+    done.wait(5)
+    time.sleep(0.05)
+    self.assertEqual(len(fired), 3)
+    self.assertTrue(fired[0] - start[0] >= 0.02)
+    self.assertEqual(len(self.wheel), 0)
+
+  def test_other_threads (self):
+    # Arm and cancel from several threads while the wheel is running
+    fired = []
+    lock = threading.Lock()
+    def cb (i):
+      with lock: fired.append(i)
+    def producer (p):
+      for i in range(2000):
+        # The ones which get cancelled are given time for it to happen
+        delay = 0.2 if i % 3 == 0 else 0.001 * (i % 7)
+        t = WheelTimer(delay, cb, args=((p, i),), wheel=self.wheel)
+        if i % 3 == 0: t.cancel()
+        if i % 50 == 0: time.sleep(0.005)
+    threads = [threading.Thread(target=producer, args=(p,)) for p in range(4)]
+    # Switch threads as often as possible to shake out races
+    interval = sys.getcheckinterval()
+    sys.setcheckinterval(1)
+    try:
+      for t in threads: t.start()
+      for t in threads: t.join()
+    finally:
+      sys.setcheckinterval(interval)
+    expected = set((p, i) for p in range(4) for i in range(2000) if i % 3)
+    deadline = time.time() + 5
+    while len(fired) < len(expected) and time.time() < deadline:
+      time.sleep(0.01)
+    time.sleep(0.05)
+    self.assertEqual(sorted(fired), sorted(expected))
+    self.assertEqual(len(self.wheel), 0)
+
+
+class SelectHubTest (SelectHubTestBase, unittest.TestCase):
+  pass
+
+
+class EpollSelectHubTest (SelectHubTestBase, unittest.TestCase):
+  use_epoll = True
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,157 @@
+# This file is part of POX.
+#
+# POX is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# POX is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with POX.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import sys
+import os.path
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.lib.revent import *
+
+
+class Foo (Event):
+  def __init__ (self, value = None):
+    Event.__init__(self)
+    self.value = value
+
+class Bar (Event):
+  pass
+
+class Wrapped (Event):
+  def _invoke (self, handler, *args, **kw):
+    return handler(self, "wrapped", *args, **kw)
+
+class Source (EventMixin):
+  _eventMixin_events = set([Foo, Bar, Wrapped])
+
+
+class ReventTest (unittest.TestCase):
+  def setUp (self):
+    self.source = Source()
+    self.calls = []
+
+  def handler (self, name, rv = None):
+    def h (event, *args):
+      self.calls.append((name,) + args)
+      return rv
+    return h
+
+  def test_early_out (self):
+    self.assertEqual(self.source.raiseEvent(Foo, 1), None)
+    self.source.addListener(Foo, self.handler("a"))
+    e = self.source.raiseEvent(Foo, 1)
+    self.assertEqual(e.value, 1)
+    self.assertTrue(e.source is self.source)
+    self.assertEqual(self.calls, [("a",)])
+
+  def test_undefined_event (self):
+    class Baz (Event): pass
+    self.assertRaises(RuntimeError, self.source.raiseEvent, Baz())
+    self.assertRaises(RuntimeError, self.source.raiseEvent, Baz())
+
+  def test_priority (self):
+    self.source.addListener(Foo, self.handler("low"), priority=1)
+    self.source.addListener(Foo, self.handler("high"), priority=10)
+    self.source.raiseEvent(Foo)
+    self.source.addListener(Foo, self.handler("mid"), priority=5)
+    self.source.raiseEvent(Foo)
+    self.assertEqual(self.calls, [("high",), ("low",),
+                                  ("high",), ("mid",), ("low",)])
+
+  def test_halt_and_remove (self):
+    self.source.addListener(Foo, self.handler("remove", EventRemove))
+    self.source.addListener(Foo, self.handler("false", False))
+    self.source.addListener(Foo, self.handler("halt", EventHalt))
+    self.source.addListener(Foo, self.handler("never"))
+    e = self.source.raiseEvent(Foo)
+    self.assertTrue(e.halt)
+    self.assertEqual(self.calls, [("remove",), ("false",), ("halt",)])
+    del self.calls[:]
+    self.source.raiseEvent(Foo)
+    self.assertEqual(self.calls, [("halt",)])
+
+  def test_halt_and_remove_tuple (self):
+    self.source.addListener(Foo, self.handler("a", EventHaltAndRemove))
+    self.source.addListener(Foo, self.handler("b", True))
+    self.source.raiseEvent(Foo)
+    self.source.raiseEvent(Foo)
+    self.assertEqual(self.calls, [("a",), ("b",)])
+
+  def test_event_halt_attribute (self):
+    def h (event):
+      self.calls.append("halter")
+      event.halt = True
+      return EventContinue
+    self.source.addListener(Foo, h)
+    self.source.addListener(Foo, self.handler("never"))
+    self.source.raiseEvent(Foo())
+    self.assertEqual(self.calls, ["halter"])
+
+  def test_once (self):
+    self.source.addListener(Foo, self.handler("once"), once=True)
+    self.source.addListener(Foo, self.handler("always"))
+    self.source.raiseEvent(Foo)
+    self.source.raiseEvent(Foo)
+    self.assertEqual(self.calls, [("once",), ("always",), ("always",)])
+
+  def test_change_during_dispatch (self):
+    def adder (event):
+      self.calls.append("adder")
+      self.source.addListener(Foo, self.handler("added"))
+      return EventRemove
+    self.source.addListener(Foo, adder)
+    self.source.raiseEvent(Foo)
+    self.assertEqual(self.calls, ["adder"])
+    self.source.raiseEvent(Foo)
+    self.assertEqual(self.calls, ["adder", ("added",)])
+
+  def test_remove_listener (self):
+    h = self.handler("a")
+    self.source.addListener(Foo, h)
+    eid = self.source.addListener(Bar, h)
+    self.source.raiseEvent(Foo)
+    self.source.raiseEvent(Bar)
+    self.assertTrue(self.source.removeListener(eid))
+    self.source.raiseEvent(Foo)
+    self.assertEqual(self.source.raiseEvent(Bar), None)
+    self.assertTrue(self.source.removeListener(h))
+    self.assertEqual(self.source.raiseEvent(Foo), None)
+    self.assertEqual(self.calls, [("a",)] * 3)
+
+  def test_clear_handlers (self):
+    self.source.addListener(Foo, self.handler("a"))
+    self.source.raiseEvent(Foo)
+    self.source.clearHandlers()
+    self.assertEqual(self.source.raiseEvent(Foo), None)
+    self.assertEqual(self.calls, [("a",)])
+
+  def test_invoke_override (self):
+    self.source.addListener(Wrapped, self.handler("a"))
+    self.source.raiseEvent(Wrapped)
+    self.assertEqual(self.calls, [("a", "wrapped")])
+
+  def test_weak (self):
+    class Sink (object):
+      def __init__ (self, calls):
+        self.calls = calls
+      def _handle_Foo (self, event):
+        self.calls.append("sink")
+    sink = Sink(self.calls)
+    self.source.addListeners(sink, weak=True)
+    self.source.raiseEvent(Foo)
+    del sink
+    self.assertEqual(self.source.raiseEvent(Foo), None)
+    self.assertEqual(self.calls, ["sink"])
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+#
+# This file is part of POX.
+#
+# POX is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# POX is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with POX.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import sys
+import os.path
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.openflow.discovery import Discovery, LLDPSender, LinkEvent
+from pox.lib.addresses import EthAddr
+from pox.lib.packet import ethernet
+
+Link = Discovery.Link
+
+
+class LinkDatabaseTest (unittest.TestCase):
+  def setUp (self):
+    self.d = Discovery()
+    self.events = []
+    self.d.addListener(LinkEvent, self.events.append)
+
+  def test_indexes (self):
+    d = self.d
+    d._add_link(Link(1, 1, 2, 1))
+    d._add_link(Link(2, 1, 1, 1))
+    d._add_link(Link(2, 2, 3, 1))
+    self.assertFalse(d.is_edge_port(1, 1))
+    self.assertFalse(d.is_edge_port(3, 1))
+    self.assertTrue(d.is_edge_port(1, 2))
+    self.assertEqual(d.get_links(2), set(d.adjacency))
+    self.assertEqual(d.get_links(2, 2), set([Link(2, 2, 3, 1)]))
+
+    d._delete_links([Link(1, 1, 2, 1)])
+    self.assertFalse(d.is_edge_port(1, 1))
+    d._delete_links([Link(2, 1, 1, 1)])
+    self.assertTrue(d.is_edge_port(1, 1))
+    self.assertEqual(d.get_links(1), set())
+    self.assertEqual(d._links_by_dpid.keys(), [2, 3])
+    self.assertEqual([e.added for e in self.events],
+                     [True, True, True, False, False])
+
+  def test_expiry (self):
+    d = self.d
+    a = Link(1, 1, 2, 1)
+    b = Link(2, 1, 1, 1)
+    d._add_link(a)
+    d._add_link(b)
+    start = d.adjacency[a]
+    d.adjacency[b] = start + 5 # Refreshed
+
+    d._expire_links(start + d._link_timeout - 1)
+    self.assertEqual(len(d.adjacency), 2)
+    d._expire_links(start + d._link_timeout + 1)
+    self.assertEqual(d.adjacency.keys(), [b])
+    self.assertTrue(d.is_edge_port(1, 1) is False)
+    d._expire_links(start + d._link_timeout + 6)
+    self.assertEqual(d.adjacency, {})
+    self.assertTrue(d.is_edge_port(1, 1))
+    self.assertEqual([e.link for e in self.events if e.removed], [a, b])
+
+    # Deleted and re-added links don't get expired early by stale checks
+    d._add_link(a)
+    d._delete_links([a])
+    d._add_link(a)
+    d.adjacency[a] += 100
+    d._expire_links(d.adjacency[a] - 1)
+    self.assertEqual(d.adjacency.keys(), [a])
+
+  def test_convergence (self):
+    d = self.d
+    self.assertTrue(d.get_stats()['converged'])
+    d._add_link(Link(1, 1, 2, 1))
+    start = d._converge_start
+    d._add_link(Link(2, 1, 1, 1))
+    d._last_change = start + 3
+    d.adjacency = dict((l, start + 100) for l in d.adjacency)
+    d._expire_links(start + 3 + d._link_timeout - 1)
+    self.assertFalse(d.get_stats()['converged'])
+    d._expire_links(start + 3 + d._link_timeout + 1)
+    stats = d.get_stats()
+    self.assertTrue(stats['converged'])
+    self.assertEqual(stats['convergence_time'], 3)
+    self.assertEqual(stats['links'], 2)
+
+
+class LLDPSenderTest (unittest.TestCase):
+  def setUp (self):
+    self.sender = LLDPSender(5)
+
+  def cycle (self):
+    """
+    Returns the (dpid, port) of everything sent in one cycle
+    """
+    s = self.sender
+    sent = []
+    for i in range(s._num_packets):
+      item = s._next_item()
+      sent.append((item.dpid, item.port_num))
+    return sorted(sent)
+
+  def test_ports (self):
+    s = self.sender
+    addr = EthAddr("00:00:00:00:00:01")
+    for port in range(1, 5):
+      s.add_port(1, port, addr, set_timer = False)
+      s.add_port(2, port, addr, set_timer = False)
+    self.assertEqual(s._num_packets, 16)
+    self.assertEqual(self.cycle(), sorted([(d, p) for d in (1, 2)
+                                           for p in range(1, 5)] * 2))
+
+    # Drop things part way through a cycle
+    s._next_item()
+    s.del_port(1, 2, set_timer = False)
+    s.del_switch(2, set_timer = False)
+    s.add_port(1, 2, addr, set_timer = False)
+    s.add_port(1, 5, addr, set_timer = False)
+    self.assertEqual(s._num_packets, 10)
+    # The rest of this cycle is the untouched ports on switch 1
+    left = len([i for i in s._this_cycle
+                if i.dpid == 1 and i.port_num in (1, 3, 4)])
+    sent = sorted(s._next_item()[:2] for i in range(left))
+    self.assertEqual(sorted(set(sent)), [(1, 1), (1, 3), (1, 4)])
+    self.assertEqual(self.cycle(), sorted([(1, p) for p in range(1, 6)] * 2))
+
+    s.del_switch(1, set_timer = False)
+    self.assertEqual(s._num_packets, 0)
+    self.assertEqual(s._next_item(), None)
+
+  def test_templates (self):
+    s = self.sender
+    addr = EthAddr("00:11:22:33:44:55")
+    for dpid in (1, 0x123456789abc):
+      for port in (1, 12, 65000):
+        for t in ("LLDP", "BDDP"):
+          fast = s._build_discovery_packet(dpid, port, addr, t)
+          slow = s.create_discovery_packet(dpid, port, addr, t)
+          # Same apart from the xid
+          self.assertEqual(fast[:4] + fast[8:], slow[:4] + slow[8:])
+
+  def test_burst (self):
+    s = self.sender
+    addr = EthAddr("00:00:00:00:00:01")
+    for port in range(1, 1001):
+      s.add_port(1, port, addr, set_timer = False)
+    s._set_timer()
+    try:
+      # 2000 packets in 5 seconds would be one every 2.5ms
+      self.assertEqual(s._burst, 40)
+      self.assertAlmostEqual(s._timer._interval, 0.1)
+      s.del_port(1, 1000, set_timer = False)
+      s.del_port(1, 999, set_timer = False)
+      s._set_timer()
+      self.assertEqual(s._burst, 40)
+      s.del_switch(1, set_timer = False)
+      s.add_port(1, 1, addr, set_timer = False)
+      s._set_timer()
+      self.assertEqual(s._burst, 1)
+      self.assertAlmostEqual(s._timer._interval, 2.5)
+    finally:
+      s.del_switch(1)
+
+  def test_probe_origin (self):
+    s = self.sender
+    d = Discovery()
+    addr = EthAddr("00:11:22:33:44:55")
+    s.add_port(0x123456789abc, 7, addr, set_timer = False)
+    s.add_port(0x123456789abc, 300, addr, set_timer = False)
+    s.add_port(2, 7, addr, set_timer = False)
+    for dpid, port in ((0x123456789abc, 7), (0x123456789abc, 300), (2, 7)):
+      for item in s._packets[dpid][port]:
+        frame = item.packet[24:] # Skip the packet_out and its action
+        self.assertEqual(s.probe_origin(frame), (dpid, port))
+        # Switches may pad it out to the minimum frame size
+        self.assertEqual(s.probe_origin(frame + b'\0' * 20), (dpid, port))
+        # The slow way gets the same answer
+        self.assertEqual(d._parse_lldp(ethernet(frame)), (dpid, port))
+
+    probe = s._packets[2][7][0].packet[24:]
+    s.del_port(2, 7, set_timer = False)
+    self.assertEqual(s.probe_origin(probe), None)
+    self.assertEqual(d._parse_lldp(ethernet(probe)), (2, 7))
+    s.del_switch(0x123456789abc, set_timer = False)
+    self.assertEqual(s._probe_origins, {})
+
+    self.assertEqual(s.probe_origin(probe[:20]), None)
+    self.assertEqual(s.probe_origin(b''), None)
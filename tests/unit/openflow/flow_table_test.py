@@ -101,6 +101,111 @@ class FlowTableTest(unittest.TestCase):
       t.remove_expired_entries(now=time)
       self.assertEqual([e.cookie for e in t.entries ], remaining)
 
+  def test_expiry_events(self):
+    """ expired flows are removed in batches, one per reason """
+    t = FlowTable()
+    events = []
+    t.addListener(FlowTableModification, events.append)
+    for (cookie, idle, hard) in ( (1, 5, 0), (2, 0, 5), (3, 5, 0), (4, 0, 0) ):
+      t.add_entry(TableEntry(now=0, cookie=cookie, idle_timeout=idle, hard_timeout=hard))
+    self.assertEqual(t.next_expiry(), 5)
+    t.entries[2].touch_packet(1, now=4) # cookie 3
+    del events[:]
+
+    self.assertEqual([e.cookie for e in t.expired_entries(now=6)], [1,2])
+    removed = t.remove_expired_entries(now=6)
+    self.assertEqual([e.cookie for e in removed], [1,2])
+    self.assertEqual(sorted((e.reason, [r.cookie for r in e.removed]) for e in events),
+                     [(OFPRR_IDLE_TIMEOUT, [1]), (OFPRR_HARD_TIMEOUT, [2])])
+    self.assertEqual(t.next_expiry(), 9)
+
+    # Nothing expired -> no event
+    del events[:]
+    self.assertEqual(t.remove_expired_entries(now=7), [])
+    self.assertEqual(events, [])
+
+    # A removed entry's timeout doesn't fire
+    t.remove_entry(t.entries[0])
+    self.assertEqual(t.remove_expired_entries(now=100), [])
+    self.assertEqual(t.next_expiry(), None)
+    self.assertEqual([e.cookie for e in t.entries], [4])
+
+  def test_replaced_entries_expiry(self):
+    """ replacing a flow over and over doesn't grow the expiry heap """
+    t = SwitchFlowTable()
+    t.add_entry(TableEntry(now=0, cookie=99, priority=5, hard_timeout=50,
+                           match=ofp_match(in_port=2)))
+    for i in range(1000):
+      t.process_flow_mod(ofp_flow_mod(cookie=i, priority=1, hard_timeout=3600,
+                                      match=ofp_match(in_port=1)))
+    self.assertEqual(len(t), 2)
+    self.assertTrue(len(t._expiry) <= 2 * len(t) + 1)
+    self.assertEqual(t.next_expiry(), 50)
+    self.assertEqual([e.cookie for e in t.remove_expired_entries(now=60)],
+                     [99])
+    self.assertEqual([e.cookie for e in t.entries], [999])
+
+  def test_lookup_matches_linear_scan(self):
+    """ classifier lookups agree with scanning the ordered table """
+    import random
+    from pox.lib.packet import ethernet, ipv4, udp, arp
+    r = random.Random(1)
+    macs = [EthAddr("00:00:00:00:00:0%i" % i) for i in range(1,4)]
+    ips = [IPAddr("10.0.%i.%i" % (i, j)) for i in range(2) for j in range(1,3)]
+    nets = ["10.0.0.0/8", "10.0.0.0/16", "10.0.1.0/24", "10.0.0.2", "10.0.1.1"]
+
+    def random_match():
+      m = ofp_match()
+      if r.random() < 0.5: m.in_port = r.randint(1, 2)
+      if r.random() < 0.5: m.dl_src = r.choice(macs)
+      if r.random() < 0.3: m.dl_dst = r.choice(macs)
+      if r.random() < 0.6:
+        m.dl_type = 0x800
+        if r.random() < 0.6: m.nw_src = r.choice(nets)
+        if r.random() < 0.3: m.nw_proto = 17
+        if r.random() < 0.3: m.tp_dst = r.choice((80, 8080))
+      return m
+
+    def random_packet():
+      if r.random() < 0.2:
+        payload = arp(protosrc=r.choice(ips), protodst=r.choice(ips))
+        t = ethernet.ARP_TYPE
+      else:
+        payload = ipv4(srcip=r.choice(ips), dstip=r.choice(ips), protocol=17,
+                       payload=udp(srcport=1000, dstport=r.choice((80, 8080))))
+        t = ethernet.IP_TYPE
+      e = ethernet(src=r.choice(macs), dst=r.choice(macs), type=t, payload=payload)
+      return ethernet(e.pack())
+
+    t = FlowTable()
+    for i in range(200):
+      t.add_entry(TableEntry(priority=r.randint(1, 5), cookie=i, match=random_match()))
+    # Exact matches go first
+    exact = ofp_match.from_packet(random_packet(), 1)
+    t.add_entry(TableEntry(priority=0, cookie=1000, match=exact))
+    for i in range(0, 200, 3):
+      t.remove_entry(t.entries[r.randint(0, len(t) - 1)])
+
+    hits = 0
+    for i in range(300):
+      packet = random_packet()
+      in_port = r.randint(1, 2)
+      pm = ofp_match.from_packet(packet, in_port)
+      self.assertEqual(packet_key(packet, in_port), match_key(pm)[1])
+      expected = [e for e in t.entries
+                  if e.match.matches_with_wildcards(pm, consider_other_wildcards=False)]
+      found = t.entry_for_packet(packet, in_port)
+      self.assertIs(found, expected[0] if expected else None)
+      hits += bool(expected)
+    self.assertTrue(hits > 100)
+
+    for i in range(100):
+      m = random_match()
+      expected = [e for e in t.entries if e.is_matched_by(m)]
+      self.assertEqual(t.matching_entries(m), expected)
+      for e in t.entries[:5]:
+        self.assertIn(e, t.matching_entries(e.match, e.priority, strict=True))
+
 class SwitchFlowTableTest(unittest.TestCase):
   def test_process_flow_mod_add(self):
     """ test that simple insertion of a flow works"""
@@ -3,7 +3,8 @@
 import unittest
 import sys
 import os.path
-from copy import copy
+from copy import copy, deepcopy
+import pickle
 sys.path.append(os.path.dirname(__file__) + "/../../..")
 
 from pox.openflow.libopenflow_01 import *
@@ -297,6 +298,102 @@ class ofp_command_test(unittest.TestCase):
             for (check_attr,val) in attrs.iteritems():
               self.assertEqual(getattr(unpacked, check_attr), val)
 
+  def test_lazy_packet_in(self):
+    o = ofp_packet_in(xid=7, in_port=3, buffer_id=0, reason=OFPR_ACTION,
+                      data="\x01" * 60)
+    packed = o.pack()
+    p = ofp_packet_in()
+    self.assertEqual(p.unpack(packed), (len(packed), len(packed)))
+    self.assertEqual(len(p), len(packed))
+    self.assertIsNotNone(p._lazy_data)
+    self.assertEqual(p.in_port, 3)
+    self.assertIsNone(p._lazy_fields)
+    self.assertIsNotNone(p._lazy_data)
+    self.assertEqual(p.buffer_id, 0)
+    self.assertEqual(p.reason, OFPR_ACTION)
+    self.assertEqual(p.data, "\x01" * 60)
+    self.assertEqual(p, o)
+    self.assertEqual(p.pack(), packed)
+
+    # Setting a field must not lose the undecoded ones
+    p = ofp_packet_in()
+    p.unpack(packed)
+    p.in_port = 4
+    self.assertEqual(p.total_len, 60)
+    p.data = "\x02"
+    self.assertEqual(p.data, "\x02")
+
+    self.assertRaises(UnderrunError, ofp_packet_in().unpack, packed[:-1])
+
+  def test_lazy_match(self):
+    m = ofp_match(in_port=1, dl_type=0x0800, dl_src=EthAddr("00:00:00:00:00:01"),
+                  nw_proto=6, nw_src="10.0.0.0/8", nw_dst="11.0.0.1",
+                  tp_dst=80)
+    packed = m.pack()
+    try:
+      for lazy in (True, False):
+        ofp_match.lazy_unpack = lazy
+        u = ofp_match()
+        self.assertEqual(u.unpack(packed), 40)
+        self.assertEqual(u, m)
+        self.assertEqual(u.get_nw_src(), (IPAddr("10.0.0.0"), 8))
+        self.assertEqual(u.pack(), packed)
+    finally:
+      ofp_match.lazy_unpack = True
+
+    u = ofp_match()
+    u.unpack(packed)
+    u._dl_dst = EthAddr("00:00:00:00:00:09")
+    self.assertEqual(u.dl_src, EthAddr("00:00:00:00:00:01"))
+    self.assertEqual(u._dl_dst, EthAddr("00:00:00:00:00:09"))
+    self.assertEqual(u.clone(), u)
+
+  def test_from_packet(self):
+    e = ethernet(src=EthAddr("00:00:00:00:00:01"), dst=EthAddr("00:00:00:00:00:02"),
+        type=ethernet.IP_TYPE,
+        payload=ipv4(srcip=IPAddr("1.2.3.4"), dstip=IPAddr("1.2.3.5"), protocol=ipv4.UDP_PROTOCOL,
+            payload=udp(srcport=1234, dstport=53, payload="haha")))
+    e = ethernet(e.pack())
+    m = ofp_match.from_packet(e, in_port=3)
+    # Should be the same as setting each field by hand
+    n = ofp_match(in_port=3, dl_src=e.src, dl_dst=e.dst, dl_type=e.type,
+                  dl_vlan=OFP_VLAN_NONE, dl_vlan_pcp=0, nw_src="1.2.3.4",
+                  nw_dst="1.2.3.5", nw_proto=ipv4.UDP_PROTOCOL, nw_tos=0,
+                  tp_src=1234, tp_dst=53)
+    self.assertEqual(m, n)
+    self.assertEqual(m.wildcards, n.wildcards)
+    self.assertTrue(m.is_exact)
+    u = ofp_match()
+    u.unpack(m.pack())
+    self.assertEqual(u, m)
+
+  def test_extra_attributes(self):
+    m = ofp_match(in_port=1, dl_type=0x800, nw_src="10.0.0.1")
+    m.cookie_hint = 42
+    self.assertEqual(m.cookie_hint, 42)
+    for c in (copy(m), deepcopy(m), pickle.loads(pickle.dumps(m))):
+      self.assertEqual(c, m)
+      self.assertEqual(c.cookie_hint, 42)
+    self.assertRaises(AttributeError, getattr, ofp_match(), "cookie_hint")
+
+  def test_hash(self):
+    # Raw addresses compare equal to EthAddr/IPAddr, so must hash the same
+    a = ofp_match(in_port=1, dl_src=EthAddr("00:00:00:00:00:01").toRaw(),
+                  dl_type=0x800, nw_proto=6, nw_src="10.0.0.0/8", tp_dst=80)
+    a.nw_dst = 0x0a000001
+    b = ofp_match(in_port=1, dl_src=EthAddr("00:00:00:00:00:01"),
+                  dl_type=0x800, nw_proto=6, tp_dst=80)
+    b.set_nw_src(IPAddr("10.0.0.0"), 8)
+    b.nw_dst = IPAddr("10.0.0.1")
+    self.assertEqual(a, b)
+    self.assertEqual(hash(a), hash(b))
+    u = ofp_match()
+    u.unpack(b.pack())
+    self.assertEqual(hash(u), hash(a))
+    self.assertEqual(len(set([a, b, u, a.clone()])), 1)
+    b.tp_dst = 81
+    self.assertNotEqual(hash(a), hash(b))
+
 class ofp_action_test(unittest.TestCase):
   def assert_packed_action(self, cls, packed, a_type, length):
     self.assertEqual(extract_num(packed, 0,2), a_type, "Action %s: expected type %d (but is %d)" % (cls, a_type, extract_num(packed, 0,2)))
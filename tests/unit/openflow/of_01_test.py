@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os.path
+import socket
+from errno import EAGAIN
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.openflow.libopenflow_01 import *
+from pox.openflow import ConnectionBackpressure, OpenFlowNexus, PacketIn
+from pox.openflow.of_01 import Connection
+from pox.lib.packet import ethernet, ipv4, tcp, lazy_stats
+from pox.lib.addresses import EthAddr, IPAddr
+
+class MockSocket (object):
+  """ A socket which only takes as many bytes as it has room for """
+  def __init__ (self, room = 1 << 30):
+    self.room = room
+    self.sent = b''
+    self.incoming = b''
+
+  def recv_into (self, buf, nbytes = 0):
+    d = self.incoming[:nbytes or len(buf)]
+    self.incoming = self.incoming[len(d):]
+    buf[:len(d)] = d
+    return len(d)
+
+  def send (self, data):
+    if self.room == 0:
+      raise socket.error(EAGAIN, "Resource temporarily unavailable")
+    l = min(len(data), self.room)
+    self.room -= l
+    self.sent += data[:l]
+    return l
+
+  def shutdown (self, how):
+    pass
+
+  def close (self):
+    pass
+
+class MockLoop (object):
+  def __init__ (self):
+    self.writers = []
+  def _want_write (self, con):
+    self.writers.append(con)
+
+class ConnectionSendTest (unittest.TestCase):
+  def setUp (self):
+    self.sock = MockSocket()
+    self.loop = MockLoop()
+    self.con = Connection(self.sock, io_loop=self.loop)
+    self.sock.sent = b''
+
+  def test_direct_send (self):
+    self.con.send(ofp_hello(xid=1))
+    self.assertEqual(self.sock.sent, ofp_hello(xid=1).pack())
+    self.assertEqual(self.loop.writers, [])
+
+  def test_partial_send_is_buffered (self):
+    m1 = ofp_echo_request(xid=1).pack()
+    m2 = ofp_echo_request(xid=2).pack()
+    self.sock.room = 3
+    self.con.send(m1)
+    self.assertEqual(self.loop.writers, [self.con])
+    self.con.send(m2)
+    self.assertEqual(self.sock.sent, m1[:3])
+    self.sock.room = 1 << 30
+    self.assertFalse(self.con._flush())
+    self.assertEqual(self.sock.sent, m1 + m2)
+    self.assertEqual(self.con._send_queued, 0)
+
+  def test_large_backlog (self):
+    self.con.send_chunk = 1000
+    self.sock.room = 0
+    msgs = [ofp_echo_request(xid=i, body=b'x' * (i * 37 % 700)).pack()
+            for i in range(300)]
+    for m in msgs:
+      self.con.send(m)
+    writes = []
+    send = self.sock.send
+    def record (data):
+      writes.append(len(data))
+      return send(data)
+    self.sock.send = record
+    while True:
+      self.sock.room = 333
+      if not self.con._flush(): break
+    self.assertEqual(self.sock.sent, b''.join(msgs))
+    self.assertEqual(self.con._send_queued, 0)
+    # Never handed more than a chunk's worth of coalesced messages
+    self.assertTrue(max(writes) <= 1000)
+
+  def test_backpressure (self):
+    events = []
+    self.con.addListener(ConnectionBackpressure, events.append)
+    self.con.send_high_water = 100
+    self.con.send_low_water = 20
+    self.sock.room = 0
+    data = b'\x01' * 40
+    for i in range(3):
+      self.con.send(data)
+    self.assertEqual(len(events), 1)
+    self.assertTrue(events[0].congested)
+    self.assertTrue(self.con.congested)
+    self.sock.room = 100
+    self.assertTrue(self.con._flush())
+    self.assertEqual(len(events), 2)
+    self.assertFalse(events[1].congested)
+    self.assertEqual(events[1].buffered, 20)
+
+class ConnectionReadTest (unittest.TestCase):
+  def setUp (self):
+    self.sock = MockSocket()
+    self.con = Connection(self.sock)
+    self.sock.sent = b''
+
+  def test_framing (self):
+    # Echo requests are answered directly by of_01, so we can tell which
+    # ones made it through by looking at what got sent back.
+    requests = [ofp_echo_request(xid=i, body=b'x' * i) for i in range(1, 40)]
+    self.sock.incoming = b''.join(r.pack() for r in requests)
+    self.con.read_size = 7 # Lots of messages split across reads
+    while self.sock.incoming:
+      self.assertTrue(self.con.read())
+    replies = b''.join(ofp_echo_reply(xid=r.xid, body=r.body).pack()
+                       for r in requests)
+    self.assertEqual(self.sock.sent, replies)
+    self.assertEqual(self.con._rbuf_start, self.con._rbuf_end)
+
+  def test_eof (self):
+    self.assertFalse(self.con.read())
+
+  def test_bad_version (self):
+    self.sock.incoming = b'\x04\x02\x00\x08\x00\x00\x00\x01'
+    self.assertFalse(self.con.read())
+
+class PacketInTest (unittest.TestCase):
+  def setUp (self):
+    self.sock = MockSocket()
+    self.con = Connection(self.sock)
+    self.con.ofnexus = OpenFlowNexus()
+    self.con.dpid = 1
+    e = ethernet(src=EthAddr("00:00:00:00:00:01"),
+                 dst=EthAddr("00:00:00:00:00:02"), type=ethernet.IP_TYPE)
+    ip = ipv4(srcip=IPAddr("10.0.0.1"), dstip=IPAddr("10.0.0.2"),
+              protocol=ipv4.TCP_PROTOCOL)
+    ip.payload = tcp(srcport=1234, dstport=80, off=5, payload=b'x' * 10)
+    e.payload = ip
+    self.sock.incoming = ofp_packet_in(in_port=3, data=e.pack()).pack()
+
+  def test_shared_event (self):
+    events = []
+    def nexus_handler (event):
+      events.append(event)
+      self.assertTrue(event.source is self.con.ofnexus)
+    def con_handler (event):
+      events.append(event)
+      self.assertTrue(event.source is self.con)
+    self.con.ofnexus.addListener(PacketIn, nexus_handler)
+    self.con.addListener(PacketIn, con_handler)
+    self.assertTrue(self.con.read())
+    self.assertEqual(len(events), 2)
+    self.assertTrue(events[0] is events[1])
+    self.assertEqual(events[0].port, 3)
+
+  def test_lazy_parse (self):
+    seen = []
+    self.con.addListener(PacketIn, lambda event: seen.append(event.parsed))
+    deferred = lazy_stats['deferred']
+    parsed = lazy_stats['parsed']
+    self.assertTrue(self.con.read())
+    packet = seen[0]
+    self.assertEqual(packet.dst, EthAddr("00:00:00:00:00:02"))
+    self.assertEqual(lazy_stats['deferred'], deferred + 1)
+    self.assertEqual(lazy_stats['parsed'], parsed)
+
+    ip = packet.next
+    self.assertEqual(ip.dstip, IPAddr("10.0.0.2"))
+    self.assertEqual(lazy_stats['deferred'], deferred + 2)
+    self.assertEqual(lazy_stats['parsed'], parsed + 1)
+
+    self.assertEqual(packet.find('tcp').dstport, 80)
+    self.assertEqual(packet.find('tcp').payload, b'x' * 10)
+    self.assertEqual(lazy_stats['parsed'], parsed + 2)
+    self.assertTrue(packet.next is ip)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -3,6 +3,7 @@
 import unittest
 import sys
 import os.path
+import time
 from copy import copy
 
 sys.path.append(os.path.dirname(__file__) + "/../../..")
@@ -69,6 +70,65 @@ class SwitchImplTest(unittest.TestCase):
     self.assertEqual(e.priority,1)
     self.assertEqual(e.match, ofp_match(in_port=1, nw_src="1.2.3.4"))
 
+  def test_flow_expiry(self):
+    c = self.conn
+    s = self.switch
+    now = time.time()
+    c.to_switch(ofp_flow_mod(priority=1, cookie=1, idle_timeout=30,
+                             flags=OFPFF_SEND_FLOW_REM,
+                             match=ofp_match(in_port=1)))
+    c.to_switch(ofp_flow_mod(priority=1, cookie=2, hard_timeout=60,
+                             flags=OFPFF_SEND_FLOW_REM,
+                             match=ofp_match(in_port=2)))
+    c.to_switch(ofp_flow_mod(priority=1, cookie=3, idle_timeout=30,
+                             match=ofp_match(in_port=3)))
+    self.assertEqual(len(s.table), 3)
+    self.assertEqual(s.expire_flows(now=now + 10), [])
+
+    s.expire_flows(now=now + 40)
+    self.assertEqual([e.cookie for e in s.table.entries], [2])
+    self.assertEqual(len(c.received), 1)
+    self.assertTrue(isinstance(c.last, ofp_flow_removed))
+    self.assertEqual(c.last.cookie, 1)
+    self.assertEqual(c.last.reason, OFPRR_IDLE_TIMEOUT)
+
+    s.expire_flows(now=now + 70)
+    self.assertEqual(len(s.table), 0)
+    self.assertEqual(len(c.received), 2)
+    self.assertEqual(c.last.cookie, 2)
+    self.assertEqual(c.last.reason, OFPRR_HARD_TIMEOUT)
+
+  def test_disconnect(self):
+    class ClosingConnection(MockConnection):
+      def set_close_handler(self, handler):
+        self.on_closed = handler
+      def close(self):
+        self.on_closed(self)
+    c = ClosingConnection()
+    s = SoftwareSwitch(1, name="sw2")
+    s.set_connection(c)
+    c.to_switch(ofp_flow_mod(priority=1, idle_timeout=30,
+                             match=ofp_match(in_port=1)))
+    timer = s._expiry_timer
+    self.assertNotEqual(timer, None)
+
+    # closing the connection stops the expiry timer for good
+    c.close()
+    self.assertEqual(s._expiry_timer, None)
+    self.assertTrue(timer._cancelled)
+    s.rx_message(c, ofp_flow_mod(priority=2, hard_timeout=10,
+                                 match=ofp_match(in_port=2)))
+    self.assertEqual(len(s.table), 2)
+    self.assertEqual(s._expiry_timer, None)
+    s.send(ofp_hello())
+    self.assertEqual(c.received, [])
+
+    # until there's a new connection
+    c2 = ClosingConnection()
+    s.set_connection(c2)
+    self.assertNotEqual(s._expiry_timer, None)
+    s.disconnect()
+
   def test_packet_out(self):
     c = self.conn
     s = self.switch
@@ -129,6 +189,93 @@ class SwitchImplTest(unittest.TestCase):
     self.assertEqual(event.port.port_no,3)
     self.assertEqual(event.packet, self.packet)
 
+  def test_microflow_cache(self):
+    c = self.conn
+    s = self.switch
+    received = []
+    s.addListener(DpPacketOut, lambda(event): received.append(event))
+    c.to_switch(ofp_flow_mod(priority=1, match=ofp_match(in_port=1),
+                             actions=[ofp_action_output(port=2)]))
+    s.rx_packet(self.packet, in_port=1)
+    s.rx_packet(self.packet, in_port=1)
+    self.assertEqual(len(s._microflows), 1)
+    self.assertEqual(s.table.entries[0].counters['packets'], 2)
+    self.assertEqual(received[-1].port.port_no, 2)
+
+    # a more specific flow has to win over the cached one
+    c.to_switch(ofp_flow_mod(priority=2, match=ofp_match(in_port=1, tp_dst=53),
+                             actions=[ofp_action_output(port=3)]))
+    self.assertEqual(len(s._microflows), 0)
+    s.rx_packet(self.packet, in_port=1)
+    self.assertEqual(received[-1].port.port_no, 3)
+
+    # modified actions are used by the cached entry
+    c.to_switch(ofp_flow_mod(command=OFPFC_MODIFY_STRICT, priority=2,
+                             match=ofp_match(in_port=1, tp_dst=53),
+                             actions=[ofp_action_output(port=4)]))
+    s.rx_packet(self.packet, in_port=1)
+    self.assertEqual(received[-1].port.port_no, 4)
+
+    # neither are deleted or expired ones
+    c.to_switch(ofp_flow_mod(command=OFPFC_DELETE_STRICT, priority=2,
+                             match=ofp_match(in_port=1, tp_dst=53)))
+    s.rx_packet(self.packet, in_port=1)
+    self.assertEqual(received[-1].port.port_no, 2)
+    s.expire_flows(now=time.time() + 60)
+    c.to_switch(ofp_flow_mod(priority=1, idle_timeout=10,
+                             match=ofp_match(in_port=1),
+                             actions=[ofp_action_output(port=3)]))
+    s.rx_packet(self.packet, in_port=1)
+    self.assertEqual(received[-1].port.port_no, 3)
+    s.expire_flows(now=time.time() + 60)
+    c.received = []
+    s.rx_packet(self.packet, in_port=1)
+    self.assertTrue(isinstance(c.last, ofp_packet_in))
+
+  def test_packet_buffers(self):
+    pool = PacketBufferPool(size=2, timeout=10)
+    a = pool.allocate("a", 1, now=0)
+    b = pool.allocate("b", 2, now=5)
+    self.assertEqual(pool.allocate("c", 3, now=5), None)
+    self.assertEqual(pool.release(a), ("a", 1))
+    self.assertEqual(pool.release(a), None)
+    # the slot is reused with a new buffer id
+    c = pool.allocate("c", 3, now=6)
+    self.assertNotEqual(c, a)
+    self.assertEqual(c & 0xffff, a & 0xffff)
+    self.assertEqual(pool.release(a), None)
+    # b has expired by now, c hasn't
+    d = pool.allocate("d", 4, now=15)
+    self.assertEqual(pool.release(b), None)
+    self.assertEqual(pool.release(c), ("c", 3))
+    self.assertEqual(pool.release(d), ("d", 4))
+    self.assertEqual(pool.stats(), dict(n_buffers=2, in_use=0, high_water=2,
+                                        allocated=4, released=3, expired=1,
+                                        overflows=1, unknown=3))
+
+    # released buffers' deadlines don't pile up
+    pool = PacketBufferPool(size=8, timeout=10)
+    held = pool.allocate("held", 1, now=0)
+    for i in range(1000):
+      pool.release(pool.allocate("x", 1, now=i * 0.001))
+      self.assertTrue(len(pool._deadlines) <= 2 * pool.size)
+    self.assertEqual(pool.expire(now=10), 1)
+    self.assertEqual(pool.release(held), None)
+
+    # the switch reports unknown buffers
+    c = self.conn
+    s = self.switch
+    s.rx_packet(self.packet, in_port=1)
+    buffer_id = c.last.buffer_id
+    c.to_switch(ofp_packet_out(buffer_id=buffer_id,
+                               actions=[ofp_action_output(port=2)]))
+    self.assertEqual(len(s.packet_buffers), 0)
+    c.to_switch(ofp_packet_out(xid=7, buffer_id=buffer_id,
+                               actions=[ofp_action_output(port=2)]))
+    self.assertTrue(isinstance(c.last, ofp_error))
+    self.assertEqual(c.last.xid, 7)
+    self.assertEqual(c.last.code, OFPBRC_BUFFER_UNKNOWN)
+
   def test_delete_port(self):
     c = self.conn
     s = self.switch
@@ -8,6 +8,7 @@ import unittest
 import sys
 import os.path
 import itertools
+import struct
 
 sys.path.append(os.path.dirname(__file__) + "/../../..")
 from pox.openflow.libopenflow_01 import *
@@ -133,6 +134,91 @@ class OFSyncFlowTableTest(unittest.TestCase):
       self.assertEqual(len(t), 1)
       self.assertEqual(t.entries[0].cookie, 0x31415927)
 
+  def _entry (self, i, priority=5):
+    return TableEntry(priority=priority,
+                      match=ofp_match(dl_src=EthAddr("00:00:00:00:%02x:%02x"
+                                                     % (i >> 8, i & 0xff))),
+                      actions=[ofp_action_output(port=5)])
+
+  def _split (self, data):
+    """ (type, xid) of each message in a packed write """
+    msgs = []
+    while data:
+      version,type,length,xid = struct.unpack("!BBHL", data[:8])
+      msgs.append((type, xid))
+      data = data[length:]
+    return msgs
+
+  def test_windowed_install (self):
+    t = self.t
+    s = self.s
+    t.BARRIER_WINDOW = 10
+    seen_ft_events = []
+    t.addListener(FlowTableModification, seen_ft_events.append)
+
+    entries = [self._entry(i) for i in range(25)]
+    t.install(entries)
+    self.assertEqual(t.num_pending, 25)
+
+    # one packed write: three windows, each closed by a barrier
+    self.assertEqual(len(s.sent), 1)
+    msgs = self._split(s.sent[0])
+    self.assertEqual(len(msgs), 28)
+    barriers = [xid for type,xid in msgs if type == OFPT_BARRIER_REQUEST]
+    self.assertEqual([i for i,m in enumerate(msgs)
+                      if m[0] == OFPT_BARRIER_REQUEST], [10, 21, 27])
+
+    for xid,left in zip(barriers, (15, 5, 0)):
+      s.raiseEvent(BarrierIn(self.conn, ofp_barrier_reply(xid=xid)))
+      self.assertEqual(t.num_pending, left)
+    self.assertEqual(len(t), 25)
+    self.assertEqual([len(e.added) for e in seen_ft_events], [10, 10, 5])
+
+  def test_retry (self):
+    t = self.t
+    s = self.s
+    entry = self._entry(1)
+    t.install(entry)
+    first = s.last.xid
+
+    # the barrier reply is overdue; the next sync sends the flow again
+    t.TIME_OUT = -1
+    t.install(self._entry(2))
+    self.assertEqual(len(s.sent), 5)
+    self.assertEqual(s.sent[-3].match, entry.match)
+    second = s.last.xid
+
+    # the first barrier confirms it after all; the retry doesn't add it twice
+    s.raiseEvent(BarrierIn(self.conn, ofp_barrier_reply(xid=first)))
+    self.assertEqual(len(t), 1)
+    s.raiseEvent(BarrierIn(self.conn, ofp_barrier_reply(xid=second)))
+    self.assertEqual(len(t), 2)
+    self.assertEqual(t.num_pending, 0)
+
+  def test_remove_cancels_pending (self):
+    t = self.t
+    s = self.s
+    s.connected = False
+    t.install([self._entry(i) for i in range(4)])
+    t.install(self._entry(1, priority=7))
+    self.assertEqual(t.num_pending, 5)
+
+    # a strict removal only cancels adds with the same match and priority
+    t.remove_strict(self._entry(1))
+    self.assertEqual(t.num_pending, 5)
+    self.assertEqual(len(t._pending_adds), 4)
+
+    # a wildcarded one cancels everything it matches
+    t.remove_with_wildcards(TableEntry(match=ofp_match()))
+    self.assertEqual(t.num_pending, 2)
+    self.assertEqual(len(t._pending_adds), 0)
+
+    # reconnecting drops removals of entries we never had
+    s.connected = True
+    s.raiseEvent(SwitchConnectionUp(s, self.conn))
+    self.assertEqual(t.num_pending, 0)
+    self.assertEqual(len(s.sent), 2)
+
 
 if __name__ == '__main__':
   unittest.main()
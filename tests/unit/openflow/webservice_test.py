@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os.path
+import struct
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+import pox.openflow.libopenflow_01 as of
+from pox.openflow import BarrierIn, ErrorIn
+from pox.openflow.webservice import pack_flows, OFSetTableRequest
+from pox.lib.revent import EventMixin
+
+class MockConnection (EventMixin):
+  _eventMixin_events = set([BarrierIn, ErrorIn])
+
+  def __init__ (self):
+    EventMixin.__init__(self)
+    self.dpid = 1
+    self.sent = []
+
+  def send (self, data):
+    if type(data) is not bytes:
+      data = data.pack()
+    self.sent.append(data)
+
+def split (data):
+  """ (type, xid) for each message in data """
+  msgs = []
+  while data:
+    version,t,length,xid = struct.unpack("!BBHL", data[:8])
+    msgs.append((t, xid))
+    data = data[length:]
+  return msgs
+
+def hub_flow (priority = 1):
+  return {'priority':priority,'match':{},
+          'actions':[{'type':'OFPAT_OUTPUT','port':'OFPP_ALL'}]}
+
+class PackFlowsTest (unittest.TestCase):
+  def test_pack (self):
+    packed,errors = pack_flows([hub_flow(), {'match':{'dl_type':'IP'},
+                                             'output':'OFPP_CONTROLLER'}])
+    self.assertEqual(errors, [])
+    self.assertEqual(len(packed), 2)
+    fm = of.ofp_flow_mod()
+    fm.unpack(packed[1])
+    self.assertEqual(fm.xid, 0)
+    self.assertEqual(fm.match.dl_type, 0x800)
+    self.assertEqual(fm.actions[0].port, of.OFPP_CONTROLLER)
+
+  def test_errors (self):
+    packed,errors = pack_flows([hub_flow(), 5,
+                                {'actions':[{'type':'OFPAT_BOGUS'}]},
+                                hub_flow()])
+    self.assertEqual([e['index'] for e in errors], [1, 2])
+
+  def test_not_a_list (self):
+    packed,errors = pack_flows(hub_flow())
+    self.assertEqual(len(errors), 1)
+
+class SetTableTest (unittest.TestCase):
+  def setUp (self):
+    self.con = MockConnection()
+
+  def _request (self, flows):
+    # Skip OFConRequest.__init__, which defers _init to the core
+    r = OFSetTableRequest.__new__(OFSetTableRequest)
+    r._response = None
+    r._aborted = False
+    r._con = self.con
+    import threading
+    r._sync = threading.Event()
+    packed,errors = pack_flows(flows)
+    assert not errors
+    r._do_init((packed,), {})
+    return r
+
+  def test_single_write (self):
+    r = self._request([hub_flow(i) for i in range(100)])
+    self.assertEqual(len(self.con.sent), 1)
+    msgs = split(self.con.sent[0])
+    self.assertEqual(len(msgs), 102)
+    self.assertEqual([t for t,x in msgs].count(of.OFPT_BARRIER_REQUEST), 1)
+    self.assertEqual(msgs[-1], (of.OFPT_BARRIER_REQUEST, r.barrier_xid))
+    self.assertEqual(len(set(x for t,x in msgs)), 102)
+
+    self.con.raiseEvent(BarrierIn(self.con,
+                                  of.ofp_barrier_reply(xid=r.barrier_xid)))
+    self.assertEqual(r._response['result']['flowmod'], True)
+
+  def test_flow_errors (self):
+    r = self._request([hub_flow(i) for i in range(10)])
+    msgs = split(self.con.sent[0])
+    for i in (7, 2):
+      err = of.ofp_error(type=of.OFPET_FLOW_MOD_FAILED, xid=msgs[1 + i][1])
+      self.con.raiseEvent(ErrorIn(self.con, err))
+    self.assertEqual(r._response, None)
+
+    self.con.raiseEvent(BarrierIn(self.con,
+                                  of.ofp_barrier_reply(xid=r.barrier_xid)))
+    error = r._response['error']
+    self.assertEqual([e['index'] for e in error['data']], [2, 7])
+    # The table is cleared after a failure
+    self.assertEqual(split(self.con.sent[-2])[0][0], of.OFPT_FLOW_MOD)
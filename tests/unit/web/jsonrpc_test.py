@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os.path
+from StringIO import StringIO
+from mimetools import Message
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.web.jsonrpc import JSONRPCHandler
+
+class Handler (JSONRPCHandler):
+  def __init__ (self):
+    # Skip the request handling the base class does on construction
+    pass
+
+def make_handler (headers, body):
+  h = Handler()
+  h.headers = Message(StringIO(headers + "\r\n"))
+  h.rfile = StringIO(body)
+  h.wfile = StringIO()
+  return h
+
+class ReadBodyTest (unittest.TestCase):
+  def test_content_length (self):
+    h = make_handler("Content-Length: 5\r\n", "hello, world")
+    self.assertEqual(h._read_body(), "hello")
+
+  def test_chunked (self):
+    body = "5\r\nhello\r\n7;ext=1\r\n, world\r\n0\r\nTrailer: x\r\n\r\n"
+    h = make_handler("Transfer-Encoding: chunked\r\n", body + "next")
+    self.assertEqual(h._read_body(), "hello, world")
+    self.assertEqual(h.rfile.read(), "next")
+
+  def test_continue (self):
+    h = make_handler("Expect: 100-continue\r\nContent-Length: 2\r\n", "{}")
+    self.assertEqual(h._read_body(), "{}")
+    self.assertTrue(" 100 Continue\r\n" in h.wfile.getvalue())
+
+  def test_truncated_chunk (self):
+    h = make_handler("Transfer-Encoding: chunked\r\n", "5\r\nhel")
+    self.assertRaises(ValueError, h._read_body)